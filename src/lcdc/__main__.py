@@ -10,7 +10,7 @@ import re
 import string
 
 
-def main(_listen_addr: str, _config_dir: str, _data_dir: str, _debug: bool) -> int:
+def main(_listen_addr: str, _config_dir: str, _data_dir: str, _debug: bool, _asyncio: bool = False) -> int:
     if _debug:
         logging.basicConfig(level=logging.DEBUG)
     else:
@@ -72,7 +72,7 @@ def main(_listen_addr: str, _config_dir: str, _data_dir: str, _debug: bool) -> i
     logger.info("Starting LCDC")
     try:
         from lcdc.server.server import run
-        ret = run(listen_addr, listen_port, _debug, config_dir, data_dir)
+        ret = run(listen_addr, listen_port, _debug, config_dir, data_dir, _asyncio)
     except Exception as e:
         logger.exception(f"Exception in LCDC server: {e}")
         ret = -1
@@ -94,7 +94,8 @@ if __name__ == '__main__':
     parser.add_argument("-c", "--config", type=str, help="configuration directory")
     parser.add_argument("-s", "--data", type=str, help="data storage directory")
     parser.add_argument("-d", "--debug", action="store_true", help="set debug log level mode")
-    parser.set_defaults(func=lambda args: main(args.listen, args.config, args.data, args.debug))
+    parser.add_argument("-a", "--asyncio", action="store_true", help="serve with asyncio instead of threads")
+    parser.set_defaults(func=lambda args: main(args.listen, args.config, args.data, args.debug, args.asyncio))
 
     myfunc = parser.parse_args()
     exit(myfunc.func(myfunc))
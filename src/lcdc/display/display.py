@@ -31,13 +31,31 @@ class Display:
     def clear(self) -> None:
         raise NotImplementedError
 
-    def print(self, _: Image) -> int:
+    def encode(self, _: Image) -> bytes:
+        """
+        device packet of a frame
+        :return:
+        """
+        raise NotImplementedError
+
+    def send(self, _: bytes) -> int:
+        """
+        write an encoded frame
+        :return: bytes written
+        """
         raise NotImplementedError
 
+    def print(self, _img: Image) -> int:
+        return self.send(self.encode(_img))
+
     def close(self) -> None:
         raise NotImplementedError
 
-    def resolutions(self) -> List[Tuple[int, int]]:
+    @staticmethod
+    def resolutions() -> List[Tuple[int, int]]:
+        """
+        static, so themes can be prepared for a display that is not plugged
+        """
         raise NotImplementedError
 
     def device(self) -> Tuple[int, int]:
@@ -75,6 +75,9 @@ class HidDisplay(Display):
     def close(self) -> None:
         self._device.close()
 
+    def send(self, _data: bytes) -> int:
+        return self._device.write(_data)
+
     def device(self) -> Tuple[int, int]:
         return self._device.device()
 
@@ -103,7 +106,7 @@ class Display04165302(HidDisplay):
         resp = self._device.read()
         logger.debug(str(resp.hex(" ")))
 
-    def print(self, _img: Image) -> int:
+    def encode(self, _img: Image) -> bytes:
         _buf = io.BytesIO()
         _img.convert("RGB").save(_buf, format="JPEG", progressive=False, optimize=False, )
 
@@ -116,7 +119,8 @@ class Display04165302(HidDisplay):
                 + len(_buf.getvalue()).to_bytes(4, byteorder="little") + _buf.getvalue()
                 )
 
-        return self._device.write(data)
+        return data
 
-    def resolutions(self) -> List[Tuple[int, int]]:
+    @staticmethod
+    def resolutions() -> List[Tuple[int, int]]:
         return [(1280, 480), ]
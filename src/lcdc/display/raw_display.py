@@ -75,6 +75,9 @@ class RawDisplay(Display):
     def close(self) -> None:
         self._device.close()
 
+    def send(self, _data: bytes) -> int:
+        return self._device.write(_data)
+
     def device(self) -> Tuple[int, int]:
         return self._device.device()
 
@@ -110,7 +113,7 @@ class Display87ad70db(RawDisplay):
         resp = self._device.read()
         logger.debug(str(resp.hex(" ")))
 
-    def print(self, _img: Image) -> int:
+    def encode(self, _img: Image) -> bytes:
         # baseline DCT only
         # no optimized Huffman
         _buf = io.BytesIO()
@@ -133,7 +136,8 @@ class Display87ad70db(RawDisplay):
                 + len(_buf.getvalue()).to_bytes(4, byteorder="little") + _buf.getvalue()
                 )
 
-        return self._device.write(data)
+        return data
 
-    def resolutions(self) -> List[Tuple[int, int]]:
+    @staticmethod
+    def resolutions() -> List[Tuple[int, int]]:
         return [(480, 480), (320, 320)]
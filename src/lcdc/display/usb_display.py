@@ -1,18 +1,26 @@
 import usb
 
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 
 from .raw_display import Display87ad70db
 from .hid_display import Display04165302
 
 _USB_ID_SUPPORTED = {
-    (0x0416, 0x5302): lambda: Display04165302(),
-    (0x87ad, 0x70db): lambda: Display87ad70db(),
+    (0x0416, 0x5302): Display04165302,
+    (0x87ad, 0x70db): Display87ad70db,
 }
 
 Display = Union[Display87ad70db, Display04165302]
 
 
+def usb_resolutions() -> Dict[Tuple[int, int], List[Tuple[int, int]]]:
+    """
+    resolutions of every supported display, plugged or not
+    :return: {(vendor, product): resolutions}
+    """
+    return {k: v.resolutions() for k, v in _USB_ID_SUPPORTED.items()}
+
+
 def usb_detect() -> List[Display]:
 
     dev_list = []
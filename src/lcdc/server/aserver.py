@@ -0,0 +1,299 @@
+import asyncio
+import io
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.parse
+
+from typing import Callable, Dict, List, Set, Tuple, Union
+
+from .canvas import Canvas
+from .preview import mjpeg_part, preview_args, stream_period
+from .sensors import SensorEvents, Sensors, stream_interval
+from ..display.display import Display
+
+
+logger = logging.getLogger(__name__)
+
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 408: "Request Timeout",
+            413: "Content Too Large", 500: "Internal Server Error"}
+
+
+class _Request:
+    def __init__(self, _method: str, _target: str, _version: str, _headers: Dict[str, str], _body: bytes):
+        self.method = _method
+        self.version = _version
+        self.headers = _headers
+        self.body = _body
+        url = urllib.parse.urlsplit(_target)
+        self.path = urllib.parse.unquote(url.path)
+        self.query_string = url.query
+        self.args = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+    def keep_alive(self) -> bool:
+        c = self.headers.get("connection", "").lower()
+        return c == "keep-alive" if self.version == "HTTP/1.0" else c != "close"
+
+
+class AsyncServer:
+    """
+    asyncio http server of the flask app
+
+    Streaming routes (MJPEG preview and sensor events) are served by coroutines, so idle or slow stream clients
+    cost no thread. Other routes are handed to the WSGI app on a small shared thread pool.
+    SIGINT and SIGTERM close the listener, end all connections, stop the canvases and release the displays.
+    """
+    # request head and body limits
+    MAX_HEAD = 65536
+    MAX_BODY = 16 * 1048576
+    # idle keep-alive connection timeout in seconds
+    IDLE_TIMEOUT = 30.0
+
+    def __init__(self, _app: Callable, _listen_addr: str, _listen_port: int, _displays: List[Display],
+                 _canvas: List[Canvas], _sensors: Sensors, _paints: List[threading.Thread]):
+        self._app = _app
+        self._listen_addr = _listen_addr
+        self._listen_port = _listen_port
+        self._displays = _displays
+        self._canvas = _canvas
+        self._sensors = _sensors
+        self._paints = _paints
+
+        self._connections: Set[asyncio.Task] = set()
+        self._stop: Union[asyncio.Event, None] = None
+        self._streams = {
+            "/lcdc/displays/stream": self._route_displays_stream,
+            "/lcdc/sensors/stream": self._route_sensors_stream,
+        }
+
+    def run(self) -> int:
+        return asyncio.run(self._serve())
+
+    async def _serve(self) -> int:
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for s in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(s, self._signal, s)
+
+        if self._listen_port == 0:
+            server = await asyncio.start_unix_server(self._accept, path=self._listen_addr[7:])
+        else:
+            server = await asyncio.start_server(self._accept, host=self._listen_addr, port=self._listen_port)
+
+        logger.warning("Ctrl+C to stop server")
+        self._sensors.start()
+        for _t in self._paints:
+            _t.start()
+
+        await self._stop.wait()
+
+        server.close()
+        for t in list(self._connections):
+            t.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await loop.run_in_executor(None, self._shutdown)
+        logger.info("Stop server")
+        return 0
+
+    def _signal(self, _sig: int) -> None:
+        logger.info(f"Signal {_sig} detected")
+        self._stop.set()
+
+    def _shutdown(self) -> None:
+        """
+        stop rendering before the displays are closed, so no frame is written to a released device
+        """
+        for _c in self._canvas:
+            _c.stop()
+        for _t in self._paints:
+            _t.join(timeout=2.0)
+        self._sensors.clean()
+        for _d in self._displays:
+            try:
+                _d.close()
+            except Exception as e:
+                logger.warning(f"Display {_d.device()[0]:04x}:{_d.device()[1]:04x} close failed: {e}")
+        if self._listen_port == 0:
+            os.remove(self._listen_addr[7:])
+
+    async def _accept(self, _reader: asyncio.StreamReader, _writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    req = await asyncio.wait_for(self._read_request(_reader), self.IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    logger.debug(f"Bad request: {e}")
+                    await self._respond(_writer, 400, [], b"", False)
+                    break
+                if req is None:
+                    break
+
+                stream = self._streams.get(req.path)
+                if stream is not None and req.method == "GET":
+                    await stream(req, _writer)
+                    break
+                if not await self._wsgi(req, _writer):
+                    break
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.exception(f"Connection error: {e}")
+        finally:
+            self._connections.discard(task)
+            _writer.close()
+
+    async def _read_request(self, _reader: asyncio.StreamReader) -> Union[_Request, None]:
+        try:
+            head = await _reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if len(e.partial) == 0:
+                # client closed a keep-alive connection
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise ValueError("request head too long")
+        if len(head) > self.MAX_HEAD:
+            raise ValueError("request head too long")
+
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if line == "":
+                continue
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+
+        length = int(headers.get("content-length", "0"))
+        if length < 0 or length > self.MAX_BODY:
+            raise ValueError(f"content length {length}")
+        body = await _reader.readexactly(length) if length > 0 else b""
+        return _Request(method, target, version, headers, body)
+
+    @staticmethod
+    async def _respond(_writer: asyncio.StreamWriter, _status: int, _headers: List[Tuple[str, str]],
+                       _body: bytes, _keep_alive: bool) -> None:
+        head = [f"HTTP/1.1 {_status} {_REASONS.get(_status, '')}"]
+        head += [f"{k}: {v}" for k, v in _headers if k.lower() not in ("content-length", "connection")]
+        head.append(f"Content-Length: {len(_body)}")
+        head.append("Connection: keep-alive" if _keep_alive else "Connection: close")
+        _writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + _body)
+        await _writer.drain()
+
+    def _environ(self, _req: _Request, _writer: asyncio.StreamWriter) -> Dict:
+        peer = _writer.get_extra_info("peername")
+        environ = {
+            "REQUEST_METHOD": _req.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": _req.path,
+            "QUERY_STRING": _req.query_string,
+            "CONTENT_TYPE": _req.headers.get("content-type", ""),
+            "CONTENT_LENGTH": str(len(_req.body)),
+            "SERVER_NAME": self._listen_addr,
+            "SERVER_PORT": str(self._listen_port),
+            "SERVER_PROTOCOL": _req.version,
+            "REMOTE_ADDR": peer[0] if isinstance(peer, tuple) else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(_req.body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for k, v in _req.headers.items():
+            if k in ("content-type", "content-length"):
+                continue
+            environ["HTTP_" + k.upper().replace("-", "_")] = v
+        return environ
+
+    async def _wsgi(self, _req: _Request, _writer: asyncio.StreamWriter) -> bool:
+        """
+        :return: connection kept alive
+        """
+        environ = self._environ(_req, _writer)
+        status: List = []
+
+        def call() -> bytes:
+            def start_response(_status, _headers, _exc_info=None):
+                status[:] = [_status, _headers]
+
+            it = self._app(environ, start_response)
+            try:
+                return b"".join(it)
+            finally:
+                if hasattr(it, "close"):
+                    it.close()
+
+        body = await asyncio.get_running_loop().run_in_executor(None, call)
+        keep_alive = _req.keep_alive()
+        await self._respond(_writer, int(status[0].split(" ", 1)[0]), status[1], body, keep_alive)
+        return keep_alive
+
+    def _display_index(self, _req: _Request) -> Union[int, None]:
+        try:
+            id_v = int(_req.args.get("vendor"))
+            id_p = int(_req.args.get("product"))
+        except Exception:
+            return None
+        for i in range(len(self._displays)):
+            if self._displays[i].device() == (id_v, id_p):
+                return i
+        return None
+
+    async def _route_displays_stream(self, _req: _Request, _writer: asyncio.StreamWriter) -> None:
+        # same parameters as the threaded route
+        i = self._display_index(_req)
+        if i is None:
+            await self._respond(_writer, 404, [], b"", False)
+            return
+        try:
+            scale, quality, size = preview_args(_req.args)
+            period = stream_period(_req.args)
+        except ValueError:
+            await self._respond(_writer, 400, [], b"", False)
+            return
+
+        preview = self._canvas[i].preview
+        loop = asyncio.get_running_loop()
+        _writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+                      b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        seq = -1
+        sent = 0.0
+        while True:
+            t0 = time.monotonic()
+            # polling at the client rate, resend the same frame every 15 seconds to keep alive
+            if preview.seq != seq or t0 - sent >= 15.0:
+                seq, jpeg = await loop.run_in_executor(None, preview.encode, scale, quality, False, size)
+                if jpeg is not None:
+                    _writer.write(mjpeg_part(jpeg))
+                    # a slow client only holds back itself and skips to the newest frame
+                    await _writer.drain()
+                    sent = t0
+            await asyncio.sleep(max(0.0, period - (time.monotonic() - t0)))
+
+    async def _route_sensors_stream(self, _req: _Request, _writer: asyncio.StreamWriter) -> None:
+        # same parameters as the threaded route
+        try:
+            events = SensorEvents(self._sensors, self._sensors.select(_req.args.get("keys")),
+                                  stream_interval(_req.args))
+        except ValueError:
+            await self._respond(_writer, 400, [], b"", False)
+            return
+
+        _writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                      b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        while True:
+            e = events.poll()
+            if e != "":
+                _writer.write(e.encode())
+                await _writer.drain()
+            await asyncio.sleep(events.interval)
@@ -0,0 +1,118 @@
+import argparse
+import logging
+import pathlib
+import tempfile
+import time
+
+from .sensors import Sensors, _BAT, _CPU, _DISK, _FAN, _GPU, _MEMORY, _NET, _SYSTEM, _TEMP
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_fake_root(_root: pathlib.Path, _hwmon_sensors: int = 200, _cpus: int = 8, _per_chip: int = 8) -> pathlib.Path:
+    """
+    generate a /proc and /sys tree the builtin providers can read
+    :param _root: empty directory
+    :param _hwmon_sensors: temp*_input files in total
+    :param _cpus: cores in /proc/stat and cpufreq
+    :param _per_chip: temp*_input files of each hwmon chip
+    :return: _root
+    """
+    proc = _root / "proc"
+    (proc / "net").mkdir(parents=True, exist_ok=True)
+
+    stat = [f"cpu  {100 * _cpus} 0 {50 * _cpus} {1000 * _cpus} 10 0 1 0 0 0"]
+    stat += [f"cpu{i} 100 0 50 1000 10 0 1 0 0 0" for i in range(_cpus)]
+    stat += ["intr 0", "ctxt 0"]
+    (proc / "stat").write_text("\n".join(stat) + "\n")
+    (proc / "diskstats").write_text("   7       0 loop0 0 0 0 0 0 0 0 0 0 0 0\n"
+                                    " 259       0 nvme0n1 100 0 2048 10 200 0 4096 20 0 30 30\n")
+    (proc / "net" / "dev").write_text("Inter-|   Receive                                                |  Transmit\n"
+                                      " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+                                      "    lo:    1000      10    0    0    0     0          0         0     1000      10    0    0    0     0       0          0\n"
+                                      "  eth0:  500000     400    0    0    0     0          0         0   200000     300    0    0    0     0       0          0\n")
+    (proc / "loadavg").write_text("0.10 0.05 0.01 1/100 1000\n")
+    (proc / "uptime").write_text("12345.67 23456.78\n")
+    (proc / "meminfo").write_text("MemTotal:       32768000 kB\n"
+                                  "MemFree:         8192000 kB\n"
+                                  "MemAvailable:   16384000 kB\n"
+                                  "SwapTotal:       4096000 kB\n"
+                                  "SwapFree:        3072000 kB\n")
+
+    for i in range(_cpus):
+        f = _root / f"sys/devices/system/cpu/cpu{i}/cpufreq"
+        f.mkdir(parents=True, exist_ok=True)
+        (f / "scaling_cur_freq").write_text(f"{3000000 + i * 1000}\n")
+
+    (_root / "sys/block/nvme0n1").mkdir(parents=True, exist_ok=True)
+
+    # one amdgpu card
+    driver = _root / "sys/bus/pci/drivers/amdgpu"
+    driver.mkdir(parents=True, exist_ok=True)
+    dev = _root / "sys/class/drm/card0/device"
+    (dev / "hwmon/hwmon0").mkdir(parents=True, exist_ok=True)
+    (dev / "driver").symlink_to(driver)
+    (dev / "gpu_busy_percent").write_text("37\n")
+    (dev / "mem_info_vram_used").write_text("1073741824\n")
+    (dev / "mem_info_vram_total").write_text("8589934592\n")
+    (dev / "hwmon/hwmon0/temp1_input").write_text("52000\n")
+
+    hwmon = _root / "sys/class/hwmon"
+    for n in range(_hwmon_sensors):
+        c, t = divmod(n, _per_chip)
+        h = hwmon / f"hwmon{c}"
+        if t == 0:
+            h.mkdir(parents=True, exist_ok=True)
+            (h / "name").write_text("k10temp\n" if c == 0 else f"chip{c}\n")
+        (h / f"temp{t + 1}_input").write_text(f"{40000 + n * 10}\n")
+        (h / f"temp{t + 1}_label").write_text(f"Sensor {t + 1}\n")
+
+    (hwmon / "hwmon0" / "fan1_input").write_text("1200\n")
+    (hwmon / "hwmon0" / "fan1_label").write_text("Pump\n")
+
+    for n, t, a in (("BAT0", "Battery", {"capacity": "80", "energy_now": "40000000", "power_now": "10000000",
+                                        "status": "Discharging"}),
+                    ("AC", "Mains", {"online": "0"})):
+        d = _root / "sys/class/power_supply" / n
+        d.mkdir(parents=True, exist_ok=True)
+        (d / "type").write_text(t + "\n")
+        for k, v in a.items():
+            (d / k).write_text(v + "\n")
+
+    return _root
+
+
+def bench(_root: pathlib.Path, _iterations: int) -> None:
+    print(f"{'provider':<10}{'keys':>8}{'us/update':>12}")
+    for cls in (_TEMP, _CPU, _GPU, _MEMORY, _DISK, _NET, _FAN, _BAT, _SYSTEM):
+        p = cls(_root)
+        t0 = time.perf_counter()
+        for _ in range(_iterations):
+            p.update()
+        t = (time.perf_counter() - t0) / _iterations
+        print(f"{p.name:<10}{len(p.keys()):>8}{t * 1e6:>12.1f}")
+        p.clean()
+
+    s = Sensors(root=_root, providers=[_TEMP, _CPU, _GPU, _MEMORY, _DISK, _NET, _FAN, _BAT, _SYSTEM])
+    t0 = time.perf_counter()
+    for _ in range(_iterations):
+        s._update(s.stats().keys())
+    t = (time.perf_counter() - t0) / _iterations
+    print(f"{'sensors':<10}{len(s.format_desc):>8}{t * 1e6:>12.1f}")
+    s.clean()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="lcdc.server.bench", description="sensor providers on a generated sysfs tree")
+    parser.add_argument("-n", "--hwmon", type=int, default=200, help="hwmon temperature sensors")
+    parser.add_argument("-i", "--iterations", type=int, default=1000, help="updates of each provider")
+    parser.add_argument("-r", "--root", type=str, help="keep the generated tree in this directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    if args.root is not None:
+        bench(make_fake_root(pathlib.Path(args.root), args.hwmon), args.iterations)
+    else:
+        with tempfile.TemporaryDirectory() as d:
+            bench(make_fake_root(pathlib.Path(d), args.hwmon), args.iterations)
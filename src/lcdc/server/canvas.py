@@ -1,6 +1,7 @@
 
 import av
 import logging
+import math
 import pyaudio
 import queue
 import time
@@ -8,7 +9,11 @@ import threading
 
 from typing import Dict, List, Union
 
+from .metrics import DisplayMetrics
+from .preview import FramePreview
 from .sensors import Sensors
+from .trace import (TRACE_ACCEPT, TRACE_AUDIO_EMPTY, TRACE_AUDIO_FULL, TRACE_DROP_LATE, TRACE_DROP_SLOW, TRACE_LOOP,
+                    TRACE_VIDEO_EMPTY, TRACE_VIDEO_FULL, TraceRing)
 from ..display.usb_display import Display
 from ..theme.theme import Theme
 
@@ -67,15 +72,39 @@ class Canvas:
         self._display_info = _display.device()
         self._theme = _theme
         self._sensors = _sensors
+        self._sensors.demand(self, self._theme.sensor_keys())
+        self._theme.compile(self._sensors)
 
+        self.preview = FramePreview(self._theme.last_blend_frame())
+        self.metrics = DisplayMetrics()
+        self.trace = TraceRing()
         self.stop_env = threading.Event()
 
     def set_theme(self, _theme: Theme):
         self._theme = _theme
+        self._sensors.demand(self, self._theme.sensor_keys())
+        self._theme.compile(self._sensors)
+
+    def set_theme_widgets(self, _widgets: List[Dict]) -> None:
+        """
+        replace widgets of the running theme, raise ValueError on invalid widgets
+        """
+        self._theme.set_widgets(_widgets, self._sensors)
+        self._sensors.demand(self, self._theme.sensor_keys())
+
+    def patch_theme_widgets(self, _patches: Dict[str, Dict]) -> None:
+        """
+        change some widgets of the running theme, raise ValueError on invalid changes
+        """
+        self._theme.patch_widgets(_patches, self._sensors)
+        self._sensors.demand(self, self._theme.sensor_keys())
 
     def get_theme_config(self) -> Dict:
         return self._theme.get_config()
 
+    def get_theme_stats(self) -> Dict:
+        return self._theme.stats()
+
     def paint(self):
         """
         run in a new thread
@@ -151,6 +180,8 @@ class Canvas:
             buf_video_index = 0
             buf_use = True
             buf_ready = False
+            # queue full is traced, only the first one is logged
+            full_warned = False
 
             logger.debug(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
                          f"Theme background demux started")
@@ -189,8 +220,11 @@ class Canvas:
                                 try:
                                     audio_q.put(af, timeout=timeout_q)
                                 except queue.Full:
-                                    logger.warning(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
-                                                   f"Theme background demux audio queue full")
+                                    self.trace.record(TRACE_AUDIO_FULL, _video_q=video_q.qsize(), _audio_q=audio_q.qsize())
+                                    if not full_warned:
+                                        full_warned = True
+                                        logger.warning(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
+                                                       f"Theme background demux audio queue full, see the frame trace")
                                 if buf_use:
                                     buf_audio.append(af)
 
@@ -202,8 +236,11 @@ class Canvas:
                                 try:
                                     video_q.put(vf, timeout=timeout_q)
                                 except queue.Full:
-                                    logger.warning(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
-                                                   f"Theme background demux video queue full")
+                                    self.trace.record(TRACE_VIDEO_FULL, _video_q=video_q.qsize(), _audio_q=audio_q.qsize())
+                                    if not full_warned:
+                                        full_warned = True
+                                        logger.warning(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
+                                                       f"Theme background demux video queue full, see the frame trace")
                                 if buf_use:
                                     buf_video.append(vf)
 
@@ -276,9 +313,9 @@ class Canvas:
                 while not self.stop_env.is_set():
                     try:
                         frame = audio_q.get(timeout=timeout_q)
+                        self.metrics.audio_queue = audio_q.qsize()
                     except queue.Empty:
-                        logger.debug(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
-                                     f"Theme background audio queue is empty")
+                        self.trace.record(TRACE_AUDIO_EMPTY, _video_q=video_q.qsize(), _audio_q=0)
                     else:
                         if frame is None:
                             break
@@ -322,9 +359,9 @@ class Canvas:
             while not self.stop_env.is_set():
                 try:
                     frame = video_q.get(timeout=timeout_q)
+                    self.metrics.video_queue = video_q.qsize()
                 except queue.Empty:
-                    logger.debug(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
-                                 f"Theme background video queue is empty")
+                    self.trace.record(TRACE_VIDEO_EMPTY, _video_q=0, _audio_q=audio_q.qsize())
                 else:
                     if frame is None:
                         break
@@ -334,6 +371,7 @@ class Canvas:
                         timestamp_old = frame.time
                         if timestamp_loop > 0:
                             timestamp_base = timestamp_max * timestamp_loop + timestamp_loop / video_framerate
+                            self.trace.record(TRACE_LOOP, timestamp_base)
                     timestamp_max = max(timestamp_max, frame.time)
                     timestamp_old = frame.time
 
@@ -356,6 +394,8 @@ class Canvas:
                             # drop this frame
                             dropped_frames += 1
                             frames_dropped += 1
+                            self.metrics.frames_dropped += 1
+                            self.trace.record(TRACE_DROP_SLOW, frame_time, math.nan, video_q.qsize(), audio_q.qsize())
                             continue
 
                     while not self.stop_env.is_set():
@@ -366,28 +406,29 @@ class Canvas:
                             continue
                         elif delta < drop_threshold:
                             frames_dropped += 1
-                            logger.debug(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
-                                         f"Frame dropped {delta} "
-                                         f"timestamp_base={timestamp_base} timestamp_max={timestamp_max} "
-                                         f"timestamp_old={timestamp_old} timestamp_loop={timestamp_loop}"
-                                         )
+                            self.metrics.frames_dropped += 1
+                            self.trace.record(TRACE_DROP_LATE, frame_time, delta, video_q.qsize(), audio_q.qsize())
                         else:
                             # accept this frame
                             frames_accept += 1
-
-                            self._display.print(self._theme.blend(frame.to_image(), self._sensors))
-
-                            logger.debug(f"Display {self._display_info[0]:04x}:{self._display_info[1]:04x}: "
-                                         f"Frame accepted t={frame_time:.3f}s  "
-                                         f"size={frame.width}x{frame.height}  "
-                                         f"frames={frames_accept + frames_dropped}  "
-                                         f"frames_dropped={frames_dropped}  "
-                                         f"frames_accept={frames_accept}  "
-                                         f"rate={(frames_accept + frames_dropped - 1) / max(frame_time, 0.1):.2f}  "
-                                         f"rate accept={(frames_accept - 1) / max(frame_time, 0.1):.2f}  "
-                                         f"timestamp_base={timestamp_base} timestamp_max={timestamp_max} "
-                                         f"timestamp_old={timestamp_old} timestamp_loop={timestamp_loop}"
-                                         )
+                            self.metrics.frames_accepted += 1
+
+                            t0 = time.perf_counter()
+                            img = self._theme.blend(frame.to_image(), self._sensors)
+                            t1 = time.perf_counter()
+                            data = self._display.encode(img)
+                            t2 = time.perf_counter()
+                            try:
+                                self.metrics.bytes_sent += self._display.send(data)
+                            except Exception:
+                                self.metrics.usb_errors += 1
+                                raise
+                            t3 = time.perf_counter()
+                            self.metrics.blend.observe(t1 - t0)
+                            self.metrics.encode.observe(t2 - t1)
+                            self.metrics.transfer.observe(t3 - t2)
+                            self.preview.publish(img)
+                            self.trace.record(TRACE_ACCEPT, frame_time, delta, video_q.qsize(), audio_q.qsize())
                         break
 
             # video_q.shutdown()
@@ -409,3 +450,4 @@ class Canvas:
 
     def stop(self):
         self.stop_env.set()
+        self._sensors.release(self)
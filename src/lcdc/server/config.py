@@ -1,10 +1,11 @@
 import pathlib
 
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 from .canvas import Canvas
 from .sensors import Sensors
 from ..display.usb_display import Display
+from ..theme.font import FontManager
 from ..theme.theme import Theme
 
 
@@ -20,7 +21,8 @@ class Config:
 
         self.canvas: List[Tuple[Display, Canvas]] = []
 
-    def setup_canvas(self, __displays: List[Display], __sensors: Sensors) -> List[Canvas]:
+    def setup_canvas(self, __displays: List[Display], __sensors: Sensors,
+                     __fonts: Union[FontManager, None] = None) -> List[Canvas]:
         ret = []
         for d in __displays:
             v, p = d.device()
@@ -29,7 +31,7 @@ class Config:
             if not cd.exists():
                 cd.mkdir()
 
-            c = Canvas(d, Theme(cd, d.resolutions()[0][0], d.resolutions()[0][1]), __sensors)
+            c = Canvas(d, Theme(cd, d.resolutions()[0][0], d.resolutions()[0][1], __fonts), __sensors)
             ret.append(c)
 
             self.canvas.append((d, c))
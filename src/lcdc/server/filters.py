@@ -0,0 +1,80 @@
+import math
+
+from typing import Any, Union
+
+from .history import History
+
+
+SMOOTH_KINDS = ("ema", "mean")
+
+
+class WidgetFilter:
+    """
+    smoothing and change threshold of one widget, applied to raw values before formatting
+
+    ema: exponential moving average with time constant tau seconds, follows snapshot timestamps so the
+         frame rate does not change the result
+    mean: mean of the key history in the last window seconds
+    threshold: the shown value only moves when the filtered value differs from it by at least threshold
+    """
+    def __init__(self, _key: str, _history: History, _smooth: Union[str, None] = None,
+                 _tau: float = 1.0, _window: float = 2.0, _threshold: float = 0.0):
+        if _smooth is not None and _smooth not in SMOOTH_KINDS:
+            raise ValueError(f"Unknown smoothing {_smooth}")
+
+        self._key = _key
+        self._history = _history
+        self._smooth = _smooth
+        self._tau = max(_tau, 1e-3)
+        self._window = _window
+        self._threshold = _threshold
+
+        self._seq = -1
+        self._timestamp = 0.0
+        self._raw: Any = None
+        self._ema: Union[float, None] = None
+        self._shown: Any = None
+
+        # value changes without and with the filter
+        self.raw_changes = 0
+        self.shown_changes = 0
+
+    def apply(self, _snapshot) -> Any:
+        """
+        :param _snapshot: SensorSnapshot
+        :return: value to format, None if the key has no value
+        """
+        if _snapshot.seq == self._seq:
+            return self._shown
+        dt = _snapshot.timestamp - self._timestamp
+        self._seq = _snapshot.seq
+        self._timestamp = _snapshot.timestamp
+
+        raw = _snapshot.values.get(self._key)
+        if raw != self._raw:
+            self._raw = raw
+            self.raw_changes += 1
+        if not isinstance(raw, (int, float)):
+            # missing or not a number, like load average
+            if raw != self._shown:
+                self.shown_changes += 1
+            self._shown = raw
+            return raw
+
+        v = float(raw)
+        if self._smooth == "ema":
+            if self._ema is None:
+                self._ema = v
+            else:
+                self._ema += (1.0 - math.exp(-dt / self._tau)) * (v - self._ema)
+            v = self._ema
+        elif self._smooth == "mean":
+            _, w = self._history.window(self._key, self._window)
+            if len(w) > 0:
+                v = float(w.mean())
+
+        if self._shown is None or not isinstance(self._shown, float) or abs(v - self._shown) >= self._threshold:
+            if v != self._shown:
+                self.shown_changes += 1
+            self._shown = v
+        return self._shown
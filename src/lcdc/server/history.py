@@ -0,0 +1,139 @@
+import numpy
+import threading
+import time
+
+from typing import Any, Dict, Mapping, Tuple, Union
+
+
+class _Ring:
+    """
+    preallocated (timestamp, value) ring of one sensor key
+    """
+    def __init__(self, _capacity: int):
+        self.capacity = _capacity
+        self.t = numpy.zeros(_capacity, dtype=numpy.float64)
+        self.v = numpy.zeros(_capacity, dtype=numpy.float64)
+        # next write position
+        self.head = 0
+        self.size = 0
+
+    def append(self, _t: float, _v: float) -> None:
+        self.t[self.head] = _t
+        self.v[self.head] = _v
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def ordered(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        copies oldest first
+        :return: timestamps, values
+        """
+        if self.size < self.capacity:
+            return self.t[:self.size].copy(), self.v[:self.size].copy()
+        return (numpy.concatenate((self.t[self.head:], self.t[:self.head])),
+                numpy.concatenate((self.v[self.head:], self.v[:self.head])))
+
+    def after(self, _t: float, _side: str = "right") -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        copies of the samples after _t oldest first, the ring is searched in place and only the tail is copied
+        :param _t: timestamp
+        :param _side: right for newer than _t, left to keep samples at _t too
+        :return: timestamps, values
+        """
+        if self.size == 0:
+            return numpy.zeros(0), numpy.zeros(0)
+        latest = self.t[self.head - 1]
+        if latest < _t or (_side == "right" and latest == _t):
+            return numpy.zeros(0), numpy.zeros(0)
+
+        if self.size < self.capacity:
+            s = numpy.searchsorted(self.t[:self.size], _t, side=_side)
+            return self.t[s:self.size].copy(), self.v[s:self.size].copy()
+        # the newer segment [:head] is enough unless _t is before its first sample
+        if self.head > 0 and self.t[0] <= _t:
+            s = numpy.searchsorted(self.t[:self.head], _t, side=_side)
+            return self.t[s:self.head].copy(), self.v[s:self.head].copy()
+        s = self.head + numpy.searchsorted(self.t[self.head:], _t, side=_side)
+        return (numpy.concatenate((self.t[s:], self.t[:self.head])),
+                numpy.concatenate((self.v[s:], self.v[:self.head])))
+
+
+class History:
+    def __init__(self, capacity: int = 3600):
+        """
+        :param capacity: samples kept of each key, memory is 16 bytes per sample per key
+        """
+        self._capacity = capacity
+        self._rings: Dict[str, _Ring] = {}
+        self._lock = threading.Lock()
+
+    def append(self, _timestamp: float, _values: Mapping[str, Any]) -> None:
+        """
+        record numeric values sampled at the same time, only called by the sampler
+        :param _timestamp: time.monotonic()
+        :param _values: {key: value}
+        :return:
+        """
+        with self._lock:
+            for k, v in _values.items():
+                if not isinstance(v, (int, float)):
+                    continue
+                r = self._rings.get(k)
+                if r is None:
+                    r = _Ring(self._capacity)
+                    self._rings[k] = r
+                r.append(_timestamp, v)
+
+    def keys(self):
+        return self._rings.keys()
+
+    def window(self, key: str, seconds: Union[float, None] = None) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        samples of a key, oldest first
+        :param key: sensor key
+        :param seconds: only the last seconds, None for all kept samples
+        :return: timestamps, values
+        """
+        with self._lock:
+            r = self._rings.get(key)
+            if r is None:
+                return numpy.zeros(0), numpy.zeros(0)
+            if seconds is None:
+                return r.ordered()
+            return r.after(time.monotonic() - seconds, "left")
+
+    def since(self, key: str, timestamp: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        samples of a key newer than timestamp, oldest first
+        """
+        with self._lock:
+            r = self._rings.get(key)
+            if r is None:
+                return numpy.zeros(0), numpy.zeros(0)
+            return r.after(timestamp)
+
+    def last(self, key: str, n: int) -> numpy.ndarray:
+        """
+        last n values of a key, oldest first
+        """
+        return self.window(key)[1][-n:]
+
+    def aggregate(self, key: str, seconds: Union[float, None] = None) -> Union[Dict[str, float], None]:
+        """
+        :return: {count, min, max, mean, p50, p95, p99}, None if no samples in the window
+        """
+        _, v = self.window(key, seconds)
+        if len(v) == 0:
+            return None
+
+        p50, p95, p99 = numpy.percentile(v, (50, 95, 99))
+        return {
+            "count": int(len(v)),
+            "min": float(v.min()),
+            "max": float(v.max()),
+            "mean": float(v.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+        }
@@ -0,0 +1,110 @@
+import bisect
+import psutil
+
+from typing import Dict, List, Tuple
+
+
+# seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+    """
+    prometheus histogram written by a single thread, plain increments without locks
+    readers may see a sample in count before sum, which is fine for scraping
+    """
+    def __init__(self, _buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = _buckets
+        # counts[i] counts samples in (buckets[i-1], buckets[i]], the last one is +Inf
+        self.counts = [0] * (len(_buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, _v: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, _v)] += 1
+        self.sum += _v
+
+
+class DisplayMetrics:
+    """
+    counters of one canvas, only written by its render threads
+    """
+    def __init__(self):
+        self.frames_accepted = 0
+        self.frames_dropped = 0
+        self.usb_errors = 0
+        self.bytes_sent = 0
+        # queue depths sampled by the consumer threads
+        self.video_queue = 0
+        self.audio_queue = 0
+        self.blend = Histogram()
+        self.encode = Histogram()
+        self.transfer = Histogram()
+
+
+def _format_labels(_labels: Dict[str, str]) -> str:
+    return "{" + ",".join(f'{k}="{v}"' for k, v in _labels.items()) + "}" if len(_labels) > 0 else ""
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, _name: str, _kind: str, _help: str) -> None:
+        self.lines.append(f"# HELP {_name} {_help}")
+        self.lines.append(f"# TYPE {_name} {_kind}")
+
+    def sample(self, _name: str, _labels: Dict[str, str], _v: float) -> None:
+        self.lines.append(f"{_name}{_format_labels(_labels)} {_v}")
+
+    def histogram(self, _name: str, _labels: Dict[str, str], _h: Histogram) -> None:
+        # copy first, the render thread keeps writing
+        counts = list(_h.counts)
+        total = 0
+        for b, c in zip(_h.buckets + (float("inf"), ), counts):
+            total += c
+            self.sample(f"{_name}_bucket", {**_labels, "le": "+Inf" if b == float("inf") else f"{b:g}"}, total)
+        self.sample(f"{_name}_sum", _labels, _h.sum)
+        self.sample(f"{_name}_count", _labels, total)
+
+
+def exposition(_displays: List[Tuple[str, DisplayMetrics]], _sensor_stats: Dict[str, Dict]) -> str:
+    """
+    prometheus text format 0.0.4
+    :param _displays: (display id like 0416:5302, metrics)
+    :param _sensor_stats: Sensors.stats()
+    :return:
+    """
+    w = _Writer()
+
+    for name, kind, attr, desc in (
+            ("lcdc_frames_accepted_total", "counter", "frames_accepted", "Frames sent to the display"),
+            ("lcdc_frames_dropped_total", "counter", "frames_dropped", "Frames dropped for being late"),
+            ("lcdc_usb_errors_total", "counter", "usb_errors", "Failed USB transfers"),
+            ("lcdc_bytes_sent_total", "counter", "bytes_sent", "Bytes written to the display"),
+            ("lcdc_video_queue_depth", "gauge", "video_queue", "Decoded video frames waiting"),
+            ("lcdc_audio_queue_depth", "gauge", "audio_queue", "Decoded audio frames waiting")):
+        w.family(name, kind, desc)
+        for d, m in _displays:
+            w.sample(name, {"display": d}, getattr(m, attr))
+
+    for name, attr, desc in (
+            ("lcdc_blend_seconds", "blend", "Theme blend time of a frame"),
+            ("lcdc_encode_seconds", "encode", "JPEG and packet encode time of a frame"),
+            ("lcdc_transfer_seconds", "transfer", "USB transfer time of a frame")):
+        w.family(name, "histogram", desc)
+        for d, m in _displays:
+            w.histogram(name, {"display": d}, getattr(m, attr))
+
+    for name, kind, attr, desc in (
+            ("lcdc_sensor_updates_total", "counter", "count", "Updates of a sensor source"),
+            ("lcdc_sensor_update_seconds_total", "counter", "total", "Time spent updating a sensor source"),
+            ("lcdc_sensor_update_p99_seconds", "gauge", "p99", "99th percentile of recent update times"),
+            ("lcdc_sensor_active", "gauge", "active", "Sensor source sampled by a theme or client")):
+        w.family(name, kind, desc)
+        for s, st in _sensor_stats.items():
+            w.sample(name, {"source": s}, float(st[attr]))
+
+    w.family("lcdc_resident_memory_bytes", "gauge", "Resident set size of the process")
+    w.sample("lcdc_resident_memory_bytes", {}, psutil.Process().memory_info().rss)
+
+    return "\n".join(w.lines) + "\n"
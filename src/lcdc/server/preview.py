@@ -0,0 +1,138 @@
+import collections
+import io
+import os
+import threading
+
+from PIL import Image
+from typing import Mapping, Tuple, Union
+
+
+class FramePreview:
+    """
+    last blended frame of a canvas for http previews
+
+    The render thread only swaps a reference and notifies waiters, encoding happens in the http threads.
+    Each (size, quality) variant of a frame is encoded once and shared by every client asking for it,
+    the last few variants are kept in a small LRU so polling clients of an unchanged frame cost nothing.
+    """
+    def __init__(self, _frame: Union[Image.Image, None] = None, _cache_size: int = 8):
+        """
+        :param _frame: frame shown before the first publish
+        :param _cache_size: encoded variants kept
+        """
+        self._cond = threading.Condition()
+        self._frame = _frame
+        # frame sequence number, 0 before the first frame
+        self.seq = 0
+        # etags stay unique across restarts
+        self._boot = os.urandom(4).hex()
+
+        # {(seq, width, height, quality, progressive): jpeg}
+        self._encoded: collections.OrderedDict[Tuple[int, int, int, int, bool], bytes] = collections.OrderedDict()
+        self._cache_size = _cache_size
+        self._encode_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def publish(self, _frame: Image.Image) -> None:
+        """
+        called by the render thread after each accepted frame, the frame must not be modified later
+        :param _frame: blended frame
+        :return:
+        """
+        with self._cond:
+            self._frame = _frame
+            self.seq += 1
+            self._cond.notify_all()
+
+    def wait(self, _seq: int, _timeout: float) -> int:
+        """
+        block until a frame newer than _seq is published
+        :param _seq: last frame seen by the caller
+        :param _timeout: seconds
+        :return: current frame seq, equal to _seq on timeout
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq != _seq, _timeout)
+            return self.seq
+
+    def etag(self, _seq: int, _scale: float = 1.0, _quality: int = 75, _progressive: bool = False,
+             _size: Union[Tuple[int, int], None] = None) -> str:
+        """
+        :return: unquoted entity tag of a variant
+        """
+        size = f"{_scale:g}" if _size is None else f"{_size[0]}x{_size[1]}"
+        return f"{self._boot}-{_seq}-{size}-{_quality}{'p' if _progressive else ''}"
+
+    def encode(self, _scale: float = 1.0, _quality: int = 75, _progressive: bool = False,
+               _size: Union[Tuple[int, int], None] = None) -> Tuple[int, Union[bytes, None]]:
+        """
+        JPEG of the current frame
+        :param _scale: size relative to the frame
+        :param _quality: JPEG quality 1-95
+        :param _progressive: progressive and optimized, smaller but several times slower to encode
+        :param _size: width and height instead of _scale, never larger than the frame
+        :return: frame seq, jpeg or None before the first frame
+        """
+        with self._cond:
+            frame, seq = self._frame, self.seq
+        if frame is None:
+            return seq, None
+
+        if _size is None:
+            size = (max(1, round(frame.width * _scale)), max(1, round(frame.height * _scale)))
+        else:
+            size = (max(1, min(frame.width, _size[0])), max(1, min(frame.height, _size[1])))
+        variant = (seq, size[0], size[1], _quality, _progressive)
+        with self._encode_lock:
+            b = self._encoded.get(variant)
+            if b is not None:
+                self.hits += 1
+                self._encoded.move_to_end(variant)
+                return seq, b
+
+            self.misses += 1
+            img = frame.convert("RGB")
+            if img.size != size:
+                img = img.resize(size, Image.Resampling.BILINEAR)
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=_quality, progressive=_progressive, optimize=_progressive, )
+            b = buf.getvalue()
+            self._encoded[variant] = b
+            while len(self._encoded) > self._cache_size:
+                self._encoded.popitem(last=False)
+
+        return seq, b
+
+
+def preview_args(_args: Mapping[str, str]) -> Tuple[float, int, Union[Tuple[int, int], None]]:
+    """
+    preview query of the frame and stream routes, size=WxH takes precedence over scale=0.05-1, quality=1-95
+    :param _args: query arguments
+    :return: scale, quality, size
+    :raise ValueError: malformed argument
+    """
+    scale = min(1.0, max(0.05, float(_args.get("scale", "1"))))
+    quality = min(95, max(1, int(_args.get("quality", "75"))))
+    size = _args.get("size")
+    if size is not None:
+        w, h = size.lower().split("x")
+        size = (int(w), int(h))
+    return scale, quality, size
+
+
+def stream_period(_args: Mapping[str, str]) -> float:
+    """
+    :param _args: query arguments, fps=0.1-60 max frames per second
+    :return: seconds between stream frames
+    :raise ValueError: malformed argument
+    """
+    return 1.0 / min(60.0, max(0.1, float(_args.get("fps", "10"))))
+
+
+def mjpeg_part(_jpeg: bytes) -> bytes:
+    """
+    one frame of a multipart/x-mixed-replace stream with boundary frame
+    """
+    return (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(_jpeg)).encode() + b"\r\n\r\n" +
+            _jpeg + b"\r\n")
@@ -0,0 +1,149 @@
+import dataclasses
+import errno
+import os
+import pathlib
+import time
+
+from typing import Any, Callable, Dict, List, Union
+
+
+class IoCount:
+    """
+    opens and preads of all SysfsFile, the sampler takes the delta around each provider update
+    """
+    opens = 0
+    reads = 0
+
+
+class SysfsFile:
+    """
+    long living sysfs attribute, read with pread from offset 0 instead of open/read/close every sample
+    """
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._fd = -1
+        self._size = 4096
+
+        self.open()
+
+    def open(self) -> None:
+        IoCount.opens += 1
+        self._fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+
+    def read(self, size: int = 64) -> Union[bytes, None]:
+        """
+        :param size: bytes to read
+        :return: None when the attribute is gone
+        """
+        try:
+            if self._fd < 0:
+                self.open()
+            IoCount.reads += 1
+            return os.pread(self._fd, size, 0)
+        except OSError as e:
+            self.close()
+            if e.errno not in (errno.ENODEV, errno.ENOENT, errno.ENXIO, errno.EBADF):
+                return None
+
+        # hot plugged device came back with the same path
+        try:
+            self.open()
+            IoCount.reads += 1
+            return os.pread(self._fd, size, 0)
+        except OSError:
+            self.close()
+            return None
+
+    def read_all(self) -> Union[bytes, None]:
+        """
+        whole content of a file longer than 64 bytes, like /proc tables
+        """
+        while True:
+            b = self.read(self._size)
+            if b is None or len(b) < self._size:
+                return b
+            self._size *= 2
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def c2f(_cels: float) -> float:
+    return _cels * 1.8 + 32.0
+
+
+def format_number(_spec: str, _unit: str, _scale: float = 1.0) -> Callable[[Any, bool, bool], str]:
+    """
+    formatter of a plain number
+    :param _spec: format spec like "4.1f"
+    :param _unit: unit appended when asked
+    :param _scale: raw value is divided by it
+    :return:
+    """
+    return lambda _v, _with_unit, _: f"{_v / _scale:{_spec}}" + (_unit if _with_unit else "")
+
+
+def format_temp(_v: float, _unit: bool, _cels: bool) -> str:
+    if _cels:
+        return f"{_v:4.1f}" + ("℃" if _unit else "")
+    else:
+        return f"{c2f(_v):5.1f}" + ("℉" if _unit else "")
+
+
+def format_bytes_count(_v: int, _unit: bool, _: bool) -> str:
+    return (f"{_v / 1073741824.0 if _v > 1048502599.68 else _v / 1048576.0:5.1f}" +
+            ("GB" if _v > 1048502599.68 else "MB" if _unit else ""))
+
+
+def format_bytes_rate(_v: float, _unit: bool, _: bool) -> str:
+    return (f"{_v / 1048576.0 if _v > 1023928.32 else _v / 1024.0:6.2f}" +
+            ("MB" if _v > 1023928.32 else "KB" if _unit else ""))
+
+
+def format_uptime(_v: float, _: bool, __: bool) -> str:
+    if _v < 86400.0:
+        return time.strftime("%_H:%M:%S", time.gmtime(_v))
+    else:
+        return f"{_v // 86400.0:.0f} days, " + time.strftime("%_H:%M:%S", time.gmtime(_v))
+
+
+@dataclasses.dataclass(frozen=True)
+class SensorKey:
+    key: str
+    desc: str
+    # unit of the raw value in snapshots, not of the formatted string
+    unit: str
+    formatter: Callable[[Any, bool, bool], str]
+
+
+class Provider:
+    """
+    a source of sensor values
+
+    Sensors creates providers with the filesystem root, calls update() from the sampler thread only,
+    and reads values() right after. keys() is read once after the first update.
+    Third party providers are registered with the "lcdc.providers" entry point group.
+    """
+    # unique source name
+    name: str = ""
+    # default sampling interval in seconds
+    interval: float = 1.0
+    # rough cost of one update: low (a few preads), medium (psutil or many files), high (driver calls)
+    cost: str = "low"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        self.root = root
+
+    def update(self) -> None:
+        raise NotImplementedError
+
+    def values(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def keys(self) -> List[SensorKey]:
+        raise NotImplementedError
+
+    def clean(self) -> None:
+        pass
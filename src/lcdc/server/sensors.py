@@ -1,65 +1,75 @@
 import atexit
+import dataclasses
+import fnmatch
 import importlib
+import importlib.metadata
+import json
 import logging
+import numpy
 import pathlib
 import psutil
+import threading
 import time
+import types
 
-from typing import Callable, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Mapping, Set, Tuple, Type, Union
 
+from .filters import WidgetFilter
+from .history import History
+from .provider import (IoCount, Provider, SensorKey, SysfsFile, format_bytes_count, format_bytes_rate, format_number,
+                       format_temp, format_uptime)
 
-logger = logging.getLogger(__name__)
-
-
-class _BAT:
-    def __init__(self):
-        # percent, secs_left, power_plugged
-        self.precent = False
-        self.bat: Tuple[float, int, bool] = (100.0, 0, True)
 
-        self.update()
-
-    def update(self) -> None:
-        b = psutil.sensors_battery()
-        if b is not None:
-            self.precent = True
-            self.bat = (b.percent, b.secsleft, b.power_plugged)
-
-    def __str__(self) -> str:
-        return (f"BAT Precent: {self.precent}\n"
-                f"BAT Data: {self.bat}\n")
-
-
-class _CPU:
-    def __init__(self):
-        self.cpu_count = psutil.cpu_count(logical=True)
-
-        self.cpu_usage = 0.0
-        self.cpu_usage_core: List[float] = [0.0 for _ in range(self.cpu_count)]
-        self.cpu_freq = 0.0
-        self.cpu_freq_core: List[float] = [0.0 for _ in range(self.cpu_count)]
-
-        self.update()
-
-    def update(self) -> None:
-        self.cpu_usage = psutil.cpu_percent(percpu=False)
-        self.cpu_usage_core = psutil.cpu_percent(percpu=True)
-        self.cpu_freq = psutil.cpu_freq(percpu=False).current
-        self.cpu_freq_core = [ i.current for i in psutil.cpu_freq(percpu=True) ]
-
-    def __str__(self) -> str:
-        return (f'CPU Cores: {self.cpu_count}\n'
-                f'CPU Usage: {self.cpu_usage}\n'
-                f'CPU Usage Core: {self.cpu_usage_core}\n'
-                f'CPU Frequency: {self.cpu_freq}\n'
-                f'CPU Frequency Core: {self.cpu_freq_core}\n')
+logger = logging.getLogger(__name__)
 
 
-def _c2f(_cels: float) -> float:
-    return _cels * 1.8 + 57.6
+_FORMAT_PERCENT = format_number("4.1f", "%")
+_FORMAT_GB = format_number("5.2f", "GB", 1073741824.0)
+_FORMAT_RPM = format_number("4.0f", "RPM")
+
+
+class _DrmCard:
+    """
+    amdgpu or i915 card in /sys/class/drm, attributes the driver does not have are None
+    """
+    def __init__(self, _card: pathlib.Path, _driver: str):
+        self.name = f"{_driver} {_card.name}"
+        self.busy: Union[SysfsFile, None] = None
+        self.vram_used: Union[SysfsFile, None] = None
+        self.vram_total: int = 0
+        self.temp: Union[SysfsFile, None] = None
+
+        dev = _card / "device"
+        if (dev / "gpu_busy_percent").is_file():
+            self.busy = SysfsFile(dev / "gpu_busy_percent")
+        if (dev / "mem_info_vram_used").is_file() and (dev / "mem_info_vram_total").is_file():
+            # total never changes
+            self.vram_total = int((dev / "mem_info_vram_total").read_bytes())
+            if self.vram_total > 0:
+                self.vram_used = SysfsFile(dev / "mem_info_vram_used")
+        for t in sorted(dev.glob("hwmon/hwmon*/temp1_input")):
+            self.temp = SysfsFile(t)
+            break
+
+    def close(self) -> None:
+        for f in (self.busy, self.vram_used, self.temp):
+            if f is not None:
+                f.close()
+
+
+class _GPU(Provider):
+    """
+    Nvidia cards through NVML, then amdgpu and i915 cards through sysfs, numbered in that order
+    """
+    name = "gpu"
+    interval = 2.0
+    cost = "high"
+
+    DRM_DRIVERS = ("amdgpu", "i915")
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
 
-class _GPU:
-    def __init__(self):
         self.pynvml = None
         self.nvidia = False
         self.nvidia_dev_count: int = 0
@@ -69,16 +79,39 @@ class _GPU:
         self.nvidia_dev_mem_total: List[int] = []
         self.nvidia_dev_mem_free: List[int] = []
         self.nvidia_dev_mem_used: List[int] = []
+        # devices do not change at runtime, handles and names are resolved once
+        self._nvidia_handles: List[Any] = []
         self.amd = False
+        self._drm_cards: List[_DrmCard] = []
+        # {index: value} of drm cards, indices continue after the Nvidia cards
+        self._drm_values: Dict[str, Any] = {}
+
+        if root == pathlib.Path("/"):
+            self._detect_nvidia()
+        self._detect_drm()
+        if not self.nvidia:
+            # only a few preads left
+            self.cost = "low"
+            self.interval = 1.0
+
+        self.update()
 
+    def _detect_nvidia(self) -> None:
         try:
             self.pynvml = importlib.import_module("pynvml")
 
             self.pynvml.nvmlInit()
-            if self.pynvml.nvmlDeviceGetCount() > 0:
+            count = self.pynvml.nvmlDeviceGetCount()
+            if count > 0:
                 logger.info("Find Nvidia devices:")
-                for i in range(self.pynvml.nvmlDeviceGetCount()):
-                    logger.info(f"Card {i}: {self.pynvml.nvmlDeviceGetName(self.pynvml.nvmlDeviceGetHandleByIndex(i)).strip()}")
+                for i in range(count):
+                    h = self.pynvml.nvmlDeviceGetHandleByIndex(i)
+                    n = self.pynvml.nvmlDeviceGetName(h)
+                    n = (n.decode() if isinstance(n, bytes) else n).strip()
+                    logger.info(f"Card {i}: {n}")
+                    self._nvidia_handles.append(h)
+                    self.nvidia_dev_names.append(n)
+                self.nvidia_dev_count = count
                 self.nvidia = True
             else:
                 logger.warning("No supported Nvidia devices found")
@@ -86,22 +119,40 @@ class _GPU:
         except ImportError:
             logger.warning("Install pynvml for Nvidia GPU support")
             self.pynvml = None
+        except Exception as e:
+            # libnvidia-ml missing or driver not loaded
+            logger.warning(f"NVML init failed: {e}")
+            self.pynvml = None
 
-        self.update()
+    def _detect_drm(self) -> None:
+        drm = self.root / "sys/class/drm"
+        if not drm.exists():
+            return
+        for c in sorted(drm.glob("card[0-9]*")):
+            if not c.name[4:].isdigit():
+                # connectors like card0-DP-1
+                continue
+            driver = c / "device/driver"
+            if not driver.exists() or driver.resolve().name not in self.DRM_DRIVERS:
+                continue
+            try:
+                card = _DrmCard(c, driver.resolve().name)
+            except (OSError, ValueError) as e:
+                logger.warning(f"GPU {c} open failed: {e}")
+                continue
+            logger.info(f"Find GPU {card.name}")
+            self._drm_cards.append(card)
+        self.amd = len(self._drm_cards) > 0
 
     def update(self) -> None:
         if self.nvidia:
             temps: List[int] = []
-            names: List[str] = []
             usages: List[int] = []
             mem_total: List[int] = []
             mem_free: List[int] = []
             mem_used: List[int] = []
-            count = self.pynvml.nvmlDeviceGetCount()
 
-            for d in range(count):
-                h = self.pynvml.nvmlDeviceGetHandleByIndex(d)
-                names.append(self.pynvml.nvmlDeviceGetName(h).strip())
+            for h in self._nvidia_handles:
                 temps.append(self.pynvml.nvmlDeviceGetTemperature(h, self.pynvml.NVML_TEMPERATURE_GPU,))
                 m = self.pynvml.nvmlDeviceGetMemoryInfo(h)
                 usages.append(self.pynvml.nvmlDeviceGetUtilizationRates(h).gpu)
@@ -109,18 +160,70 @@ class _GPU:
                 mem_free.append(m.free)
                 mem_used.append(m.used)
 
-            self.nvidia_dev_count = count
-            self.nvidia_dev_names = names
             self.nvidia_dev_temps = temps
             self.nvidia_dev_usages = usages
             self.nvidia_dev_mem_total = mem_total
             self.nvidia_dev_mem_free = mem_free
             self.nvidia_dev_mem_used = mem_used
 
+        v: Dict[str, Any] = {}
+        for i, c in enumerate(self._drm_cards, self.nvidia_dev_count):
+            if c.busy is not None:
+                b = c.busy.read()
+                if b is not None:
+                    v[f"GpuUsage{i:03d}"] = float(b)
+            if c.vram_used is not None:
+                b = c.vram_used.read()
+                if b is not None:
+                    used = int(b)
+                    v[f"GpuMemoryUsage{i:03d}"] = used * 100.0 / c.vram_total
+                    v[f"GpuMemoryFree{i:03d}"] = c.vram_total - used
+            if c.temp is not None:
+                b = c.temp.read()
+                if b is not None:
+                    v[f"GpuTemp{i:03d}"] = int(b) / 1000.0
+        self._drm_values = v
+
+    def values(self) -> Dict[str, Any]:
+        v = {}
+        for i in range(len(self.nvidia_dev_usages)):
+            v[f"GpuUsage{i:03d}"] = float(self.nvidia_dev_usages[i])
+            v[f"GpuMemoryUsage{i:03d}"] = self.nvidia_dev_mem_used[i] * 100.0 / self.nvidia_dev_mem_total[i]
+            v[f"GpuMemoryFree{i:03d}"] = self.nvidia_dev_mem_free[i]
+            v[f"GpuTemp{i:03d}"] = float(self.nvidia_dev_temps[i])
+        v.update(self._drm_values)
+        return v
+
+    def keys(self) -> List[SensorKey]:
+        keys: List[SensorKey] = []
+        for i in range(self.nvidia_dev_count):
+            n = self.nvidia_dev_names[i]
+            keys += [
+                SensorKey(f"GpuUsage{i:03d}", f"GPU Usage of Card ({i})", "%", _FORMAT_PERCENT),
+                SensorKey(f"GpuMemoryUsage{i:03d}", f"GPU Memory Usage of Card {n} ({i})", "%", _FORMAT_PERCENT),
+                SensorKey(f"GpuMemoryFree{i:03d}", f"GPU Memory Free of Card {n} ({i}) in GB", "B", _FORMAT_GB),
+                SensorKey(f"GpuTemp{i:03d}", f"GPU Temperature of Card {n} ({i})", "℃", format_temp),
+            ]
+        for i, c in enumerate(self._drm_cards, self.nvidia_dev_count):
+            n = c.name
+            if c.busy is not None:
+                keys.append(SensorKey(f"GpuUsage{i:03d}", f"GPU Usage of Card {n} ({i})", "%", _FORMAT_PERCENT))
+            if c.vram_used is not None:
+                keys += [
+                    SensorKey(f"GpuMemoryUsage{i:03d}", f"GPU Memory Usage of Card {n} ({i})", "%", _FORMAT_PERCENT),
+                    SensorKey(f"GpuMemoryFree{i:03d}", f"GPU Memory Free of Card {n} ({i}) in GB", "B", _FORMAT_GB),
+                ]
+            if c.temp is not None:
+                keys.append(SensorKey(f"GpuTemp{i:03d}", f"GPU Temperature of Card {n} ({i})", "℃", format_temp))
+        return keys
+
     def clean(self) -> None:
         if self.nvidia:
             self.nvidia = False
+            self._nvidia_handles = []
             self.pynvml.nvmlShutdown()
+        for c in self._drm_cards:
+            c.close()
 
     def __str__(self) -> str:
         return (f"Nvidia Count {self.nvidia_dev_count}\n"
@@ -129,23 +232,178 @@ class _GPU:
                 f"Nvidia Temperatures: {self.nvidia_dev_temps}\n"
                 f"Nvidia Memory Total: {self.nvidia_dev_mem_total}\n"
                 f"Nvidia Memory Free: {self.nvidia_dev_mem_free}\n"
-                f"Nvidia Memory Used: {self.nvidia_dev_mem_used}\n")
+                f"Nvidia Memory Used: {self.nvidia_dev_mem_used}\n"
+                f"DRM Cards: {[c.name for c in self._drm_cards]}\n"
+                f"DRM Values: {self._drm_values}\n")
 
 
-class _FAN:
-    def __init__(self):
-        self.fans = {}
+class _FAN(Provider):
+    """
+    hwmon fan*_input of every chip, numbered across chips
+    """
+    name = "fan"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
+
+        # (chip name, label, fan*_input)
+        self._files: List[Tuple[str, str, SysfsFile]] = []
+        self.rpms: List[int] = []
+
+        self.detect()
         self.update()
 
+    def detect(self) -> None:
+        self.clean()
+
+        sys_base = self.root / "sys/class/hwmon"
+        if not sys_base.exists():
+            return
+        for h in sorted(sys_base.glob("hwmon*/name")):
+            hn = h.read_bytes().decode(encoding="ascii").strip()
+            for f in sorted(h.parent.glob("fan*_input")):
+                lp = f.parent / (f.name[:-5] + "label")
+                label = lp.read_bytes().decode(encoding="ascii").strip() if lp.is_file() else f.name[:-6]
+                try:
+                    self._files.append((hn, label, SysfsFile(f)))
+                except OSError as e:
+                    logger.warning(f"Fan sensor {f} open failed: {e}")
+
     def update(self) -> None:
-        self.fans = psutil.sensors_fans()
+        rpms: List[int] = []
+        for _, _, f in self._files:
+            b = f.read()
+            rpms.append(0 if b is None else int(b))
+        self.rpms = rpms
+
+    def values(self) -> Dict[str, Any]:
+        return {f"FanRpm{i:03d}": r for i, r in enumerate(self.rpms)}
+
+    def keys(self) -> List[SensorKey]:
+        return [SensorKey(f"FanRpm{i:03d}", f"Fan Speed of {n} {label} ({i})", "RPM", _FORMAT_RPM)
+                for i, (n, label, _) in enumerate(self._files)]
+
+    def clean(self) -> None:
+        for _, _, f in self._files:
+            f.close()
+        self._files = []
 
     def __str__(self) -> str:
-        return f"{self.fans}\n"
+        return f"Fans: {[(n, label, r) for (n, label, _), r in zip(self._files, self.rpms)]}\n"
 
 
-class _MEMORY:
-    def __init__(self):
+class _BAT(Provider):
+    """
+    first battery and mains adapter in /sys/class/power_supply
+    """
+    name = "battery"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
+
+        self._capacity: Union[SysfsFile, None] = None
+        # energy_now and power_now in µWh and µW, or charge_now and current_now in µAh and µA
+        self._now: Union[SysfsFile, None] = None
+        self._rate: Union[SysfsFile, None] = None
+        # Charging, Discharging, Full, Not charging or Unknown
+        self._status: Union[SysfsFile, None] = None
+        self._online: Union[SysfsFile, None] = None
+
+        self.percent: Union[float, None] = None
+        self.secs_left: Union[float, None] = None
+        self.plugged: bool = True
+
+        self.detect()
+        self.update()
+
+    def detect(self) -> None:
+        self.clean()
+
+        sys_base = self.root / "sys/class/power_supply"
+        if not sys_base.exists():
+            return
+        for d in sorted(sys_base.iterdir()):
+            t = d / "type"
+            if not t.is_file():
+                continue
+            t = t.read_bytes().decode(encoding="ascii").strip()
+            try:
+                if t == "Battery" and self._capacity is None and (d / "capacity").is_file():
+                    self._capacity = SysfsFile(d / "capacity")
+                    for now, rate in (("energy_now", "power_now"), ("charge_now", "current_now")):
+                        if (d / now).is_file() and (d / rate).is_file():
+                            self._now = SysfsFile(d / now)
+                            self._rate = SysfsFile(d / rate)
+                            break
+                    if (d / "status").is_file():
+                        self._status = SysfsFile(d / "status")
+                    logger.info(f"Find battery {d.name}")
+                elif t == "Mains" and self._online is None and (d / "online").is_file():
+                    self._online = SysfsFile(d / "online")
+            except OSError as e:
+                logger.warning(f"Power supply {d} open failed: {e}")
+
+    def update(self) -> None:
+        if self._capacity is None:
+            return
+        b = self._capacity.read()
+        self.percent = None if b is None else float(b)
+
+        # the battery knows whether it is drained, a mains adapter may be missing or belong to a dock
+        b = None if self._status is None else self._status.read()
+        if b is not None:
+            self.plugged = b.strip() != b"Discharging"
+        elif self._online is not None:
+            b = self._online.read()
+            self.plugged = b is not None and int(b) == 1
+
+        self.secs_left = None
+        if self._now is not None and not self.plugged:
+            now, rate = self._now.read(), self._rate.read()
+            if now is not None and rate is not None and int(rate) > 0:
+                self.secs_left = int(now) * 3600.0 / int(rate)
+
+    def values(self) -> Dict[str, Any]:
+        if self._capacity is None:
+            return {}
+        v: Dict[str, Any] = {"BatteryPlugged": int(self.plugged)}
+        if self.percent is not None:
+            v["BatteryPercent"] = self.percent
+        if self.secs_left is not None:
+            v["BatteryTimeLeft"] = self.secs_left
+        return v
+
+    def keys(self) -> List[SensorKey]:
+        if self._capacity is None:
+            return []
+        keys = [
+            SensorKey("BatteryPercent", "Battery Charge", "%", _FORMAT_PERCENT),
+            SensorKey("BatteryPlugged", "Power Adapter Plugged", "", lambda _v, _, __: "Yes" if _v else "No"),
+        ]
+        if self._now is not None:
+            keys.append(SensorKey("BatteryTimeLeft", "Battery Time Left", "s", format_uptime))
+        return keys
+
+    def clean(self) -> None:
+        for f in (self._capacity, self._now, self._rate, self._status, self._online):
+            if f is not None:
+                f.close()
+        self._capacity = self._now = self._rate = self._status = self._online = None
+
+    def __str__(self) -> str:
+        return (f"BAT Percent: {self.percent}\n"
+                f"BAT Time Left: {self.secs_left}\n"
+                f"BAT Plugged: {self.plugged}\n")
+
+
+class _MEMORY(Provider):
+    name = "memory"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
+
+        self._meminfo = SysfsFile(root / "proc/meminfo")
+
         self.free: int = 0
         self.usage: float = 0.0
         self.swap_free: int = 0
@@ -154,13 +412,45 @@ class _MEMORY:
         self.update()
 
     def update(self) -> None:
-        m = psutil.virtual_memory()
-        self.free = m.free
-        self.usage = m.percent
+        b = self._meminfo.read_all()
+        if b is None:
+            return
+
+        # "MemTotal:       32768000 kB"
+        info: Dict[bytes, int] = {}
+        for line in b.split(b"\n"):
+            f = line.split()
+            if len(f) >= 2:
+                info[f[0]] = int(f[1]) * 1024
+
+        # same as psutil, usage is what is not available
+        total = info.get(b"MemTotal:", 0)
+        self.free = info.get(b"MemFree:", 0)
+        available = info.get(b"MemAvailable:", self.free)
+        self.usage = round((total - available) / total * 100.0, 1) if total > 0 else 0.0
+
+        total = info.get(b"SwapTotal:", 0)
+        self.swap_free = info.get(b"SwapFree:", 0)
+        self.swap_usage = round((total - self.swap_free) / total * 100.0, 1) if total > 0 else 0.0
+
+    def values(self) -> Dict[str, Any]:
+        return {
+            "MemoryDdrUsage": self.usage,
+            "MemoryDdrFree": self.free,
+            "MemorySwapUsage": self.swap_usage,
+            "MemorySwapFree": self.swap_free,
+        }
+
+    def keys(self) -> List[SensorKey]:
+        return [
+            SensorKey("MemoryDdrUsage", "Memory Usage", "%", _FORMAT_PERCENT),
+            SensorKey("MemoryDdrFree", "Memory Free in GB", "B", _FORMAT_GB),
+            SensorKey("MemorySwapUsage", "Swap Usage", "%", _FORMAT_PERCENT),
+            SensorKey("MemorySwapFree", "Swap Free in GB", "B", _FORMAT_GB),
+        ]
 
-        m = psutil.swap_memory()
-        self.swap_free = m.free
-        self.swap_usage = m.percent
+    def clean(self) -> None:
+        self._meminfo.close()
 
     def __str__(self) -> str:
         return (f"Memory Usage: {self.usage}\n"
@@ -169,78 +459,350 @@ class _MEMORY:
                 f"Memory Swap free: {self.swap_free}\n")
 
 
-class _DISK:
-    def __init__(self):
+# devices and interfaces not sampled, fnmatch patterns
+DISK_EXCLUDE: List[str] = ["loop*", "ram*", "zram*", "dm-*"]
+NET_EXCLUDE: List[str] = ["lo", "veth*", "docker*", "br-*", "virbr*", "ifb*"]
+
+
+class _Counters(Provider):
+    """
+    per device byte counters parsed from a /proc table, rates use monotonic time
+    """
+    def __init__(self, _root: pathlib.Path, _path: str, _exclude: List[str]):
+        Provider.__init__(self, _root)
+
+        self._file = SysfsFile(_root / _path)
+        self._exclude = _exclude
+        # accept or skip of each name, decided once
+        self._accept: Dict[bytes, bool] = {}
+
+        self.bytes: Dict[str, Tuple[int, int]] = {}
+        self.rates: Dict[str, Tuple[float, float]] = {}
+        self.bytes_time = time.monotonic()
+
+    def _accepted(self, _name: bytes) -> bool:
+        a = self._accept.get(_name)
+        if a is None:
+            n = _name.decode(encoding="ascii", errors="replace")
+            a = not any(fnmatch.fnmatchcase(n, e) for e in self._exclude) and self.accept(n)
+            self._accept[_name] = a
+        return a
+
+    def accept(self, _name: str) -> bool:
+        return True
+
+    def parse(self, _table: bytes) -> Dict[str, Tuple[int, int]]:
+        raise NotImplementedError
+
+    def update(self) -> None:
+        b = self._file.read_all()
+        if b is None:
+            return
+        counters = self.parse(b)
+        now = time.monotonic()
+        dt = now - self.bytes_time
+
+        rates: Dict[str, Tuple[float, float]] = {}
+        for n, c in counters.items():
+            o = self.bytes.get(n)
+            if o is None or dt <= 0.0 or c[0] < o[0] or c[1] < o[1]:
+                # new device or counters reset
+                rates[n] = (0.0, 0.0)
+            else:
+                rates[n] = ((c[0] - o[0]) / dt, (c[1] - o[1]) / dt)
+
+        self.bytes = counters
+        self.rates = rates
+        self.bytes_time = now
+
+    def clean(self) -> None:
+        self._file.close()
+
+
+_FORMAT_MB = format_number("5.1f", "MB", 1048576.0)
+
+
+class _DISK(_Counters):
+    name = "disk"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/"), exclude: Union[List[str], None] = None):
+        _Counters.__init__(self, root, "proc/diskstats", DISK_EXCLUDE if exclude is None else exclude)
+
         self.bytes_write: int = 0
         self.bytes_read: int = 0
-        self.bytes_time = time.time()
-        self.bytes_write_old = self.bytes_write
-        self.bytes_read_old = self.bytes_read
-        self.bytes_time_old = self.bytes_time
-
         self.rate_write = 0.0
         self.rate_read = 0.0
 
         self.update()
 
-    def update(self) -> None:
-        c = psutil.disk_io_counters()
-
-        self.bytes_write_old = self.bytes_write
-        self.bytes_read_old = self.bytes_read
-        self.bytes_time_old = self.bytes_time
-
-        self.bytes_write = c.write_bytes
-        self.bytes_read = c.read_bytes
-        self.bytes_time = time.time()
+    def accept(self, _name: str) -> bool:
+        # whole disks only, partitions are counted by their disk
+        return (self.root / "sys/block" / _name).exists()
+
+    def parse(self, _table: bytes) -> Dict[str, Tuple[int, int]]:
+        # major minor name reads merged sectors_read ms writes merged sectors_written ...
+        # sectors are always 512 bytes here
+        counters: Dict[str, Tuple[int, int]] = {}
+        for line in _table.splitlines():
+            f = line.split(None, 10)
+            if len(f) < 10 or not self._accepted(f[2]):
+                continue
+            counters[f[2].decode(encoding="ascii")] = (int(f[5]) * 512, int(f[9]) * 512)
+        return counters
 
-        self.rate_write = (self.bytes_write - self.bytes_write_old) / (self.bytes_time - self.bytes_time_old)
-        self.rate_read = (self.bytes_read - self.bytes_read_old) / (self.bytes_time - self.bytes_time_old)
+    def update(self) -> None:
+        _Counters.update(self)
+        self.bytes_read = sum(c[0] for c in self.bytes.values())
+        self.bytes_write = sum(c[1] for c in self.bytes.values())
+        self.rate_read = sum(r[0] for r in self.rates.values())
+        self.rate_write = sum(r[1] for r in self.rates.values())
+
+    def values(self) -> Dict[str, Any]:
+        v = {
+            "DiskWrite": self.bytes_write,
+            "DiskRead": self.bytes_read,
+            "DiskWriteRate": self.rate_write,
+            "DiskReadRate": self.rate_read,
+        }
+        for n, c in self.bytes.items():
+            v[f"DiskRead.{n}"] = c[0]
+            v[f"DiskWrite.{n}"] = c[1]
+        for n, r in self.rates.items():
+            v[f"DiskReadRate.{n}"] = r[0]
+            v[f"DiskWriteRate.{n}"] = r[1]
+        return v
+
+    def keys(self) -> List[SensorKey]:
+        keys = [
+            SensorKey("DiskWrite", "Disk Write Count in MB/GB", "B", format_bytes_count),
+            SensorKey("DiskRead", "Disk Read Count in MB/GB", "B", format_bytes_count),
+            SensorKey("DiskWriteRate", "Disk Write Rate in MB", "B/s", _FORMAT_MB),
+            SensorKey("DiskReadRate", "Disk Read Rate in MB", "B/s", _FORMAT_MB),
+        ]
+        for d in self.bytes.keys():
+            keys += [SensorKey(f"{k.key}.{d}", k.desc.replace("Disk ", f"Disk {d} ", 1), k.unit, k.formatter) for k in keys[:4]]
+        return keys
 
     def __str__(self) -> str:
         return (f'Disk Bytes Write: {self.bytes_write}\n'
                 f'Disk Bytes Read: {self.bytes_read}\n'
                 f'Disk Bytes Write Rate: {self.rate_write}\n'
-                f'Disk Bytes Read Rate: {self.rate_read}\n')
+                f'Disk Bytes Read Rate: {self.rate_read}\n'
+                f'Disk Devices: {list(self.bytes.keys())}\n')
 
 
-class _NET:
-    def __init__(self):
+class _NET(_Counters):
+    name = "net"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/"), exclude: Union[List[str], None] = None):
+        _Counters.__init__(self, root, "proc/net/dev", NET_EXCLUDE if exclude is None else exclude)
+
         self.bytes_sent: int = 0
         self.bytes_recv: int = 0
-        self.bytes_time = time.time()
-        self.bytes_sent_old = self.bytes_sent
-        self.bytes_recv_old = self.bytes_recv
-        self.bytes_time_old = self.bytes_time
-
         self.rate_sent = 0.0
         self.rate_recv = 0.0
 
         self.update()
 
-    def update(self) -> None:
-        c = psutil.net_io_counters()
-
-        self.bytes_sent_old = self.bytes_sent
-        self.bytes_recv_old = self.bytes_recv
-        self.bytes_time_old = self.bytes_time
+    def parse(self, _table: bytes) -> Dict[str, Tuple[int, int]]:
+        # two header lines, then "name: rx_bytes packets errs drop fifo frame compressed multicast tx_bytes ..."
+        counters: Dict[str, Tuple[int, int]] = {}
+        for line in _table.splitlines()[2:]:
+            name, _, data = line.partition(b":")
+            name = name.strip()
+            if not self._accepted(name):
+                continue
+            f = data.split(None, 9)
+            counters[name.decode(encoding="ascii")] = (int(f[0]), int(f[8]))
+        return counters
 
-        self.bytes_sent = c.bytes_sent
-        self.bytes_recv = c.bytes_recv
-        self.bytes_time = time.time()
-
-        self.rate_sent = (self.bytes_sent - self.bytes_sent_old) / (self.bytes_time - self.bytes_time_old)
-        self.rate_recv = (self.bytes_recv - self.bytes_recv_old) / (self.bytes_time - self.bytes_time_old)
+    def update(self) -> None:
+        _Counters.update(self)
+        self.bytes_recv = sum(c[0] for c in self.bytes.values())
+        self.bytes_sent = sum(c[1] for c in self.bytes.values())
+        self.rate_recv = sum(r[0] for r in self.rates.values())
+        self.rate_sent = sum(r[1] for r in self.rates.values())
+
+    def values(self) -> Dict[str, Any]:
+        v = {
+            "NetworkSent": self.bytes_sent,
+            "NetworkRecv": self.bytes_recv,
+            "NetworkSentRate": self.rate_sent,
+            "NetworkRecvRate": self.rate_recv,
+        }
+        for n, c in self.bytes.items():
+            v[f"NetworkRecv.{n}"] = c[0]
+            v[f"NetworkSent.{n}"] = c[1]
+        for n, r in self.rates.items():
+            v[f"NetworkRecvRate.{n}"] = r[0]
+            v[f"NetworkSentRate.{n}"] = r[1]
+        return v
+
+    def keys(self) -> List[SensorKey]:
+        keys = [
+            SensorKey("NetworkSent", "Network Sent Count in MB/GB", "B", format_bytes_count),
+            SensorKey("NetworkRecv", "Network Received Count in MB/GB", "B", format_bytes_count),
+            SensorKey("NetworkSentRate", "Network Sent Rate in KB/MB", "B/s", format_bytes_rate),
+            SensorKey("NetworkRecvRate", "Network Received Rate in KB/MB", "B/s", format_bytes_rate),
+        ]
+        for d in self.bytes.keys():
+            keys += [SensorKey(f"{k.key}.{d}", k.desc.replace("Network ", f"Network {d} ", 1), k.unit, k.formatter) for k in keys[:4]]
+        return keys
 
     def __str__(self) -> str:
         return (f'Network Bytes Sent: {self.bytes_sent}\n'
                 f'Network Bytes Received: {self.bytes_recv}\n'
                 f'Network Bytes Sent Rate: {self.rate_sent}\n'
-                f'Network Bytes Received Rate: {self.rate_recv}\n')
+                f'Network Bytes Received Rate: {self.rate_recv}\n'
+                f'Network Interfaces: {list(self.bytes.keys())}\n')
+
+
+class _CPU(Provider):
+    name = "cpu"
+    interval = 0.25
 
+    # user nice system idle iowait irq softirq steal, guest time is already in user and nice
+    _STAT_FIELDS = 8
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
+
+        # /proc/stat cpu lines are at the head, do not read the long intr line
+        self._stat = SysfsFile(root / "proc/stat")
+        self.cpu_count = max(self._stat_rows(self._stat.read_all())[0])
+
+        self.cpu_usage = 0.0
+        self.cpu_usage_core: List[float] = [0.0 for _ in range(self.cpu_count)]
+        self.cpu_freq = 0.0
+        self.cpu_freq_core: List[float] = [0.0 for _ in range(self.cpu_count)]
+        self.iowait_percent = 0.0
+
+        self._stat_size = 4096 + 256 * (self.cpu_count + 1)
+        # row 0 all cpus, row i + 1 core i
+        self._ticks = numpy.zeros((self.cpu_count + 1, self._STAT_FIELDS), dtype=numpy.int64)
+        self._extra_warned = False
+
+        self._freq_files: List[SysfsFile] = []
+        for i in range(self.cpu_count):
+            p = root / f"sys/devices/system/cpu/cpu{i}/cpufreq/scaling_cur_freq"
+            try:
+                self._freq_files.append(SysfsFile(p))
+            except OSError:
+                logger.debug(f"CPU frequency of core {i} not in sysfs, use psutil")
+                for f in self._freq_files:
+                    f.close()
+                self._freq_files = []
+                break
+
+        self.update()
+
+    @staticmethod
+    def _stat_rows(_stat: bytes) -> Tuple[List[int], List[bytes]]:
+        """
+        :return: row of each cpu line (0 all cpus, i + 1 core i), fields of each line
+        """
+        rows: List[int] = []
+        fields: List[bytes] = []
+        for line in _stat.split(b"\n"):
+            if not line.startswith(b"cpu"):
+                break
+            label, data = line.split(None, 1)
+            # offline cores have no line
+            rows.append(0 if label == b"cpu" else int(label[3:]) + 1)
+            fields.append(data)
+        return rows, fields
+
+    def _update_usage(self) -> None:
+        b = self._stat.read(self._stat_size)
+        if b is None:
+            return
+
+        rows, fields = self._stat_rows(b)
+        if max(rows) > self.cpu_count:
+            # cores brought online after start have no keys, skip their lines
+            if not self._extra_warned:
+                self._extra_warned = True
+                logger.warning(f"CPU cores beyond the {self.cpu_count} found at start are ignored")
+            fields = [f for r, f in zip(rows, fields) if r <= self.cpu_count]
+            rows = [r for r in rows if r <= self.cpu_count]
+
+        ticks = numpy.array(b" ".join(fields).split(), dtype=numpy.int64).reshape(len(rows), -1)[:, :self._STAT_FIELDS]
+        delta = ticks - self._ticks[rows]
+        self._ticks[rows] = ticks
+
+        total = delta.sum(axis=1)
+        busy = total - delta[:, 3] - delta[:, 4]
+        usage = numpy.divide(100.0 * busy, total, out=numpy.zeros(len(rows)), where=total > 0)
+
+        usage_core = numpy.array(self.cpu_usage_core)
+        core_rows = numpy.array(rows) - 1
+        usage_core[core_rows[core_rows >= 0]] = usage[core_rows >= 0]
+
+        a = rows.index(0)
+        self.cpu_usage = float(usage[a])
+        self.cpu_usage_core = usage_core.tolist()
+        self.iowait_percent = float(100.0 * delta[a, 4] / total[a]) if total[a] > 0 else 0.0
+
+    def _update_freq(self) -> None:
+        if len(self._freq_files) > 0:
+            # kHz
+            self.cpu_freq_core = [int(b) / 1000.0 if b else 0.0 for b in (f.read() for f in self._freq_files)]
+        elif self.root == pathlib.Path("/"):
+            freq = psutil.cpu_freq(percpu=True)
+            if len(freq) > 0:
+                self.cpu_freq_core = [i.current for i in freq]
+        self.cpu_freq = sum(self.cpu_freq_core) / len(self.cpu_freq_core)
+
+    def update(self) -> None:
+        self._update_usage()
+        self._update_freq()
+
+    def values(self) -> Dict[str, Any]:
+        v = {
+            "CpuFreq": self.cpu_freq,
+            "CpuUsage": self.cpu_usage,
+            "CpuFreqMax": max(self.cpu_freq_core),
+            "CpuUsageMax": max(self.cpu_usage_core),
+            "SystemIoWait": self.iowait_percent,
+        }
+        v.update({f"CpuFreq{i:03d}": f for i, f in enumerate(self.cpu_freq_core)})
+        v.update({f"CpuUsage{i:03d}": u for i, u in enumerate(self.cpu_usage_core)})
+        return v
+
+    def keys(self) -> List[SensorKey]:
+        keys = [
+            SensorKey("CpuFreq", "CPU Frequency in GHz", "MHz", format_number("4.2f", "GHz", 1000.0)),
+            SensorKey("CpuUsage", "CPU Usage", "%", _FORMAT_PERCENT),
+            SensorKey("CpuFreqMax", "CPU Core Frequency Max in GHz", "MHz", format_number("4.2f", "GHz", 1000.0)),
+            SensorKey("CpuUsageMax", "CPU Core Usage Max", "%", _FORMAT_PERCENT),
+            SensorKey("SystemIoWait", "CPU Time IO Wait Percentage", "%", format_number("5.2f", "%")),
+        ]
+        keys += [SensorKey(f"CpuFreq{i:03d}", f"CPU Frequency of Core {i} in MHz", "MHz", format_number("3.1f", "MHz"))
+                 for i in range(self.cpu_count)]
+        keys += [SensorKey(f"CpuUsage{i:03d}", f"CPU Usage of Core {i}", "%", _FORMAT_PERCENT) for i in range(self.cpu_count)]
+        return keys
+
+    def clean(self) -> None:
+        self._stat.close()
+        for f in self._freq_files:
+            f.close()
+        self._freq_files = []
+
+    def __str__(self) -> str:
+        return (f'CPU Cores: {self.cpu_count}\n'
+                f'CPU Usage: {self.cpu_usage}\n'
+                f'CPU Usage Core: {self.cpu_usage_core}\n'
+                f'CPU Frequency: {self.cpu_freq}\n'
+                f'CPU Frequency Core: {self.cpu_freq_core}\n'
+                f'IOWAIT: {self.iowait_percent}\n')
+
+
+class _TEMP(Provider):
+    name = "temp"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
 
-class _TEMP:
-    def __init__(self, fahrenheit: bool = False):
         # (name, label, current)
         self.disk_count: int = 0
         self.disk_names: List[str] = []
@@ -255,6 +817,11 @@ class _TEMP:
         self.misc_paths: List[List[pathlib.Path]] = []
         self.misc_temps: List[Tuple[str, float]] = []
 
+        # opened temp*_input and cached temp*_label, filled by detect
+        self._disk_files: List[List[Tuple[str, SysfsFile]]] = []
+        self._cpu_files: List[List[Tuple[str, SysfsFile]]] = []
+        self._misc_files: List[List[Tuple[str, SysfsFile]]] = []
+
         self.detect()
         self.update()
 
@@ -264,74 +831,44 @@ class _TEMP:
         :return:
         """
 
-        temp_list: List[List[Tuple[str, float]]] = []
-        # detect_flag = False # only warn on /sys change
-
-        def _sensor_read(_p: pathlib.Path) -> Tuple[str, float]:
-            si = float(p.read_bytes().decode(encoding="ascii").strip()) / 1000.0
-            fi = p.parent.absolute() / (p.name[:-5] + "label")
-            sn = ""
-            if fi.is_file():
-                sn = fi.read_bytes().decode(encoding="ascii").strip()
-
-            return sn, si
-
-        # disk temperature sensors
-        for pl in self.disk_paths:
-            temps: List[Tuple[str, float]] = []
-            for p in pl:
-                if not p.exists():
-                    # logger.debug(f"Disk temperature sensor {p} disappeared, set redetect flag")
-                    # detect_flag = True
-                    logger.warning(f"Disk temperature sensor {p} disappeared")
-                    temps.append(("", 0.0))
-                    continue
-                temps.append(_sensor_read(p))
-
-            if len(temps) > 0:
-                temp_list.append(temps)
-
-        self.disk_temps = temp_list
+        def _sensors_read(_files: List[List[Tuple[str, SysfsFile]]], _kind: str) -> List[List[Tuple[str, float]]]:
+            temp_list: List[List[Tuple[str, float]]] = []
+            for fl in _files:
+                temps: List[Tuple[str, float]] = []
+                for label, f in fl:
+                    b = f.read()
+                    if b is None:
+                        logger.warning(f"{_kind} temperature sensor {f.path} disappeared")
+                        temps.append(("", 0.0))
+                        continue
+                    temps.append((label, int(b) / 1000.0))
 
-        # cpu temperature sensors
-        temp_list = []
-        for pl in self.cpu_paths:
-            temps: List[Tuple[str, float]] = []
-            for p in pl:
-                if not p.exists():
-                    # logger.debug(f"CPU temperature sensor {p} disappeared, set redetect flag")
-                    # detect_flag = True
-                    logger.warning(f"CPU temperature sensor {p} disappeared")
-                    temps.append(("", 0.0))
-                    continue
-                temps.append(_sensor_read(p))
+                if len(temps) > 0:
+                    temp_list.append(temps)
 
-            if len(temps) > 0:
-                temp_list.append(temps)
+            return temp_list
 
-        self.cpu_temps = temp_list
+        self.disk_temps = _sensors_read(self._disk_files, "Disk")
+        self.cpu_temps = _sensors_read(self._cpu_files, "CPU")
+        self.misc_temps = _sensors_read(self._misc_files, "Misc")
 
-        # misc temperature sensors
-        temp_list = []
-        for pl in self.misc_paths:
-            temps: List[Tuple[str, float]] = []
+    @staticmethod
+    def _open(_path_list: List[List[pathlib.Path]]) -> List[List[Tuple[str, SysfsFile]]]:
+        files: List[List[Tuple[str, SysfsFile]]] = []
+        for pl in _path_list:
+            fl: List[Tuple[str, SysfsFile]] = []
             for p in pl:
-                if not p.exists():
-                    # logger.debug(f"Misc temperature sensor {p} disappeared, set redetect flag")
-                    # detect_flag = True
-                    logger.warning(f"Misc temperature sensor {p} disappeared")
-                    temps.append(("", 0.0))
-                    continue
-                temps.append(_sensor_read(p))
-
-            if len(temps) > 0:
-                temp_list.append(temps)
-
-        self.misc_temps = temp_list
-
-        # if detect_flag:
-        #     logger.debug(f"Temperature sensor redetect")
-        #     self.detect()
+                lp = p.parent / (p.name[:-5] + "label")
+                label = ""
+                if lp.is_file():
+                    label = lp.read_bytes().decode(encoding="ascii").strip()
+                try:
+                    fl.append((label, SysfsFile(p)))
+                except OSError as e:
+                    logger.warning(f"Temperature sensor {p} open failed: {e}")
+            files.append(fl)
+
+        return files
 
     def detect(self) -> None:
         """
@@ -339,15 +876,17 @@ class _TEMP:
         :return:
         """
 
+        self.clean()
+
         temp_count: int = 0
         dev_names: List[str] = []
         path_list: List[List[pathlib.Path]] = []
 
         # disk temperature sensors
-        sys_base = pathlib.Path("/sys/block")
+        sys_base = self.root / "sys/block"
         if not sys_base.exists():
             return
-        logger.debug(f"Entering /sys/block")
+        logger.debug(f"Entering {sys_base}")
         for d in sys_base.iterdir():
             for s in d.glob("device/hwmon*"):
                 paths: List[pathlib.Path] = []
@@ -366,6 +905,7 @@ class _TEMP:
         self.disk_count = temp_count
         self.disk_names = dev_names
         self.disk_paths = path_list
+        self._disk_files = self._open(path_list)
 
         # hardware temperature sensors
         temp_count = 0
@@ -374,8 +914,8 @@ class _TEMP:
         cpu_count: int = 0
         cpu_names: List[str] = []
         cpu_list: List[List[pathlib.Path]] = []
-        sys_base = pathlib.Path("/sys/class/hwmon")
-        logger.debug(f"Entering /sys/class/hwmon")
+        sys_base = self.root / "sys/class/hwmon"
+        logger.debug(f"Entering {sys_base}")
         if not sys_base.exists():
             return
         for h in sys_base.glob("hwmon*/name"):
@@ -405,9 +945,43 @@ class _TEMP:
         self.cpu_count = cpu_count
         self.cpu_names = cpu_names
         self.cpu_paths = cpu_list
+        self._cpu_files = self._open(cpu_list)
         self.misc_count = temp_count
         self.misc_names = dev_names
         self.misc_paths = path_list
+        self._misc_files = self._open(path_list)
+
+    def clean(self) -> None:
+        for files in (self._disk_files, self._cpu_files, self._misc_files):
+            for fl in files:
+                for _, f in fl:
+                    f.close()
+        self._disk_files = []
+        self._cpu_files = []
+        self._misc_files = []
+
+    def values(self) -> Dict[str, Any]:
+        # sensors are numbered across all devices of a kind
+        v = {}
+        for kind, temps in (("CpuTemp", self.cpu_temps), ("DiskTemp", self.disk_temps), ("MiscTemp", self.misc_temps)):
+            i = 0
+            for tl in temps:
+                for t in tl:
+                    v[f"{kind}{i:03d}"] = t[1]
+                    i += 1
+        return v
+
+    def keys(self) -> List[SensorKey]:
+        keys: List[SensorKey] = []
+        for kind, desc, names, temps in (("CpuTemp", "CPU", self.cpu_names, self.cpu_temps),
+                                         ("DiskTemp", "Disk", self.disk_names, self.disk_temps),
+                                         ("MiscTemp", "Misc", self.misc_names, self.misc_temps)):
+            i = 0
+            for c in range(len(temps)):
+                for t in temps[c]:
+                    keys.append(SensorKey(f"{kind}{i:03d}", f"{desc} Temperature of {names[c]} {t[0]}({i})", "℃", format_temp))
+                    i += 1
+        return keys
 
     def __str__(self) -> str:
         return (f"CPU Count {self.cpu_count}\n"
@@ -421,223 +995,493 @@ class _TEMP:
                 f"Misc Temp: {self.misc_temps}\n")
 
 
-class _SYSTEM:
-    def __init__(self):
-        self.boot_time = psutil.boot_time()
-        self.cpu_count = psutil.cpu_count(logical=True)
+class _SYSTEM(Provider):
+    name = "system"
+
+    def __init__(self, root: pathlib.Path = pathlib.Path("/")):
+        Provider.__init__(self, root)
+
+        self._loadavg = SysfsFile(root / "proc/loadavg")
+        self._uptime = SysfsFile(root / "proc/uptime")
 
         self.load_average: Tuple[float, float, float] = (0.0, 0.0, 0.0)
-        self.iowait_percent: float = 0.0
+        self.uptime: float = 0.0
 
         self.update()
 
     def update(self) -> None:
-        self.load_average = psutil.getloadavg()
-        self.iowait_percent = psutil.cpu_times(percpu=False).iowait / self.cpu_count / 100.0
+        # "0.10 0.05 0.01 1/234 5678"
+        b = self._loadavg.read()
+        if b is not None:
+            f = b.split()
+            self.load_average = (float(f[0]), float(f[1]), float(f[2]))
+        # "uptime idle"
+        b = self._uptime.read()
+        if b is not None:
+            self.uptime = float(b.split()[0])
+
+    def values(self) -> Dict[str, Any]:
+        return {
+            "SystemLoad": self.load_average,
+            "SystemUptime": self.uptime,
+        }
+
+    def keys(self) -> List[SensorKey]:
+        return [
+            SensorKey("SystemLoad", "System Average Load", "",
+                      lambda _v, _, __: f"{_v[0]:5.2f}, {_v[1]:5.2f}, {_v[2]:5.2f}"),
+            SensorKey("SystemUptime", "Uptime", "s", format_uptime),
+        ]
+
+    def clean(self) -> None:
+        self._loadavg.close()
+        self._uptime.close()
 
     def __str__(self) -> str:
-        return (f"Boot Time: {self.boot_time}\n"
-                f'Load Average: {self.load_average}\n'
-                f'IOWAIT: {self.iowait_percent}\n')
+        return (f"Uptime: {self.uptime}\n"
+                f'Load Average: {self.load_average}\n')
 
 
-class Sensors:
+# sources sampled when no provider list is given, entry points of "lcdc.providers" are added
+BUILTIN_PROVIDERS: List[Type[Provider]] = [_CPU, _GPU, _MEMORY, _DISK, _NET, _TEMP, _FAN, _BAT, _SYSTEM]
+
+
+def discover_providers() -> List[Type[Provider]]:
+    providers = list(BUILTIN_PROVIDERS)
+    for ep in importlib.metadata.entry_points(group="lcdc.providers"):
+        try:
+            providers.append(ep.load())
+            logger.info(f"Sensor provider {ep.name} loaded from {ep.value}")
+        except Exception as e:
+            logger.error(f"Sensor provider {ep.name} load error: {e}")
+    return providers
+
+
+@dataclasses.dataclass(frozen=True)
+class SensorSnapshot:
+    """
+    immutable sensor values published by the sampler thread
+    """
+    seq: int
+    timestamp: float
+    values: Mapping[str, Any]
+
+
+class _SourceCost:
+    """
+    update time of a source, the last 1024 updates are kept for percentiles
+    """
     def __init__(self):
-        self._cpu = _CPU()
-        self._gpu = _GPU()
-        self._net = _NET()
-        self._temp = _TEMP()
-        self._disk = _DISK()
-        self._mem = _MEMORY()
-        self._system = _SYSTEM()
-
-        self._data_dict = {}
-
-        self._old_update = time.monotonic()
-        self.format_def: Dict[str, Callable[[bool, bool, ], str]] = {}
-        self.format_desc = {}
-
-        # init format_desc and format_def
-        # self._update()
-        self.format("No such key", True, True)
-
-    def _update(self):
-        update = time.monotonic()
-        if update - self._old_update > 0.25:
-            self._old_update = update
-            self._cpu.update()
-            self._gpu.update()
-            self._net.update()
-            self._temp.update()
-            self._disk.update()
-            self._mem.update()
-            self._system.update()
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.opens = 0
+        self.reads = 0
+        self._latency = numpy.zeros(1024, dtype=numpy.float64)
+
+    def add(self, _cost: float, _opens: int, _reads: int) -> None:
+        self._latency[self.count % len(self._latency)] = _cost
+        self.count += 1
+        self.total += _cost
+        self.last = _cost
+        self.opens += _opens
+        self.reads += _reads
+
+    def stats(self) -> Dict[str, Any]:
+        lat = self._latency[:min(self.count, len(self._latency))]
+        return {
+            "count": self.count,
+            "total": self.total,
+            "last": self.last,
+            "mean": self.total / self.count if self.count > 0 else 0.0,
+            "p99": float(numpy.percentile(lat, 99)) if len(lat) > 0 else 0.0,
+            "max": float(lat.max()) if len(lat) > 0 else 0.0,
+            "opens": self.opens,
+            "reads": self.reads,
+        }
 
-    def format(self, key: str, unit: bool, cels: bool) -> Tuple[Union[str, None], str]:
-        self._update()
-
-        if key not in self.format_desc.keys():
-            # CPUs
-            self.format_def.update({
-                "CpuFreq": lambda _unit, _: f"{self._cpu.cpu_freq / 1000:4.2f}" + ("GHz" if _unit else ""),
-                "CpuUsage": lambda _unit, _: f"{self._cpu.cpu_usage:4.1f}" + ("%" if _unit else ""),
-                "CpuFreqMax": lambda _unit, _: f"{max(self._cpu.cpu_freq_core) / 1000:4.2f}" + ("GHz" if _unit else ""),
-                "CpuUsageMax": lambda _unit, _: f"{max(self._cpu.cpu_usage_core):4.1f}" + ("%" if _unit else ""),
-            })
-            self.format_def.update({f"CpuFreq{i:03d}":
-                                        (lambda _unit, _, i=i: f"{self._cpu.cpu_freq_core[i]:3.1f}" + "MHz" if _unit else "") for i in range(self._cpu.cpu_count)})
-            self.format_def.update({f"CpuUsage{i:03d}":
-                                        (lambda _unit, _, i=i: f"{self._cpu.cpu_usage_core[i]:4.1f}" + "%" if _unit else "") for i in range(self._cpu.cpu_count)})
-
-            self.format_desc = {
-                "CpuFreq": "CPU Frequency in GHz",
-                "CpuUsage": "CPU Usage",
-                "CpuFreqMax": "CPU Core Frequency Max in GHz",
-                "CpuUsageMax": "CPU Core Usage Max",
-            }
-            self.format_desc.update({f"CpuFreq{i:03d}": f"CPU Frequency of Core {i} in MHz" for i in range(self._cpu.cpu_count)})
-            self.format_desc.update({f"CpuUsage{i:03d}": f"CPU Usage of Core {i}" for i in range(self._cpu.cpu_count)})
-
-            # GPUs
-            if self._gpu.nvidia:
-                def _format_gpu_temp(_unit: bool, _i: int) -> str:
-                    if cels:
-                        return f"{self._gpu.nvidia_dev_temps[_i]:4.1f}" + ("℃" if _unit else "")
-                    else:
-                        return f"{_c2f(self._gpu.nvidia_dev_temps[_i]):5.1f}" + ("℉" if _unit else "")
-
-                self.format_def.update({f"GpuUsage{i:03d}":
-                                            (lambda _unit, _, i=i: f"{self._gpu.nvidia_dev_usages[i]:4.1f}" + ("%" if _unit else "")) for i in range(self._gpu.nvidia_dev_count)})
-                self.format_def.update({f"GpuMemoryUsage{i:03d}":
-                                            (lambda _unit, _, i=i: f"{self._gpu.nvidia_dev_mem_used[i] * 100.0 / self._gpu.nvidia_dev_mem_total[i]:4.1f}" + ("%" if _unit else "")) for i in range(self._gpu.nvidia_dev_count)})
-                self.format_def.update({f"GpuMemoryFree{i:03d}":
-                                            (lambda _unit, _, i=i: f"{self._gpu.nvidia_dev_mem_free[i] / 1073741824.0:5.2f}" + ("GB" if _unit else "")) for i in range(self._gpu.nvidia_dev_count)})
-                self.format_def.update({f"GpuTemp{i:03d}":
-                                            (lambda _unit, _, i=i: _format_gpu_temp(_unit, i)) for i in range(self._gpu.nvidia_dev_count)})
-
-                self.format_desc.update({f"GpuUsage{i:03d}": f"GPU Usage of Card ({i})" for i in range(self._gpu.nvidia_dev_count)})
-                self.format_desc.update(
-                    {f"GpuMemoryUsage{i:03d}": f"GPU Memory Usage of Card {self._gpu.nvidia_dev_names[i]} ({i})" for i in
-                     range(self._gpu.nvidia_dev_count)})
-                self.format_desc.update(
-                    {f"GpuMemoryFree{i:03d}": f"GPU Memory Free of Card {self._gpu.nvidia_dev_names[i]} ({i}) in GB" for i in
-                     range(self._gpu.nvidia_dev_count)})
-                self.format_desc.update(
-                    {f"GpuTemp{i:03d}": f"GPU Temperature of Card {self._gpu.nvidia_dev_names[i]} ({i})" for i in
-                     range(self._gpu.nvidia_dev_count)})
-
-            # Memory
-            self.format_def.update({"MemoryDdrUsage": lambda _unit, _: f"{self._mem.usage:4.1f}" + ("%" if _unit else ""),
-                                    "MemoryDdrFree": lambda _unit, _: f"{self._mem.free / 1073741824.0:5.2f}" + ("GB" if _unit else ""),
-                                    "MemorySwapUsage": lambda _unit, _: f"{self._mem.swap_usage:4.1f}" + ("%" if _unit else ""),
-                                    "MemorySwapFree": lambda _unit, _: f"{self._mem.swap_free / 1073741824.0:5.2f}" + ("GB" if _unit else ""),
-                                    })
-
-            self.format_desc.update({"MemoryDdrUsage": "Memory Usage",
-                                     "MemoryDdrFree": "Memory Free in GB",
-                                     "MemorySwapUsage": "Swap Usage",
-                                     "MemorySwapFree": "Swap Free in GB",
-                                     })
-
-            # Disk
-            self.format_def.update({"DiskWrite": lambda _unit, _: f"{self._disk.bytes_write / 1073741824.0 if self._disk.bytes_write > 1048502599.68 else self._disk.bytes_write / 1048576.0:5.1f}" +
-                                                                  ("GB" if self._disk.bytes_write > 1048502599.68 else "MB" if _unit else ""),
-                                    "DiskRead": lambda _unit, _: f"{self._disk.bytes_read / 1073741824.0 if self._disk.bytes_read > 1048502599.68 else self._disk.bytes_read / 1048576.0:5.1f}" +
-                                                                 ("GB" if self._disk.bytes_read > 1048502599.68 else "MB" if _unit else ""),
-                                    "DiskWriteRate": lambda _unit, _: f"{self._disk.rate_write / 1048576.0:5.1f}" + ("MB" if _unit else ""),
-                                    "DiskReadRate": lambda _unit, _: f"{self._disk.rate_read / 1048576.0:5.1f}" + ("MB" if _unit else ""),
-                                    })
-
-            self.format_desc.update({"DiskWrite": "Disk Write Count in MB/GB",
-                                     "DiskRead": "Disk Read Count in MB/GB",
-                                     "DiskWriteRate": "Disk Write Rate in MB",
-                                     "DiskReadRate": "Disk Read Rate in MB",
-                                     })
-
-            # Net
-            self.format_def.update({"NetworkSent": lambda _unit, _: f"{self._net.bytes_sent / 1073741824.0 if self._net.bytes_sent > 1048502599.68 else self._net.bytes_sent / 1048576.0:5.1f}" +
-                                                                    ("GB" if self._net.bytes_sent > 1048502599.68 else "MB" if _unit else ""),
-                                    "NetworkRecv": lambda _unit, _: f"{self._net.bytes_recv / 1073741824.0 if self._net.bytes_recv > 1048502599.68 else self._net.bytes_recv / 1048576.0:5.1f}" +
-                                                                    ("GB" if self._net.bytes_recv > 1048502599.68 else "MB" if _unit else ""),
-                                    "NetworkSentRate": lambda _unit, _: f"{self._net.rate_sent / 1048576.0 if self._net.rate_sent > 1023928.32 else self._net.rate_sent / 1024.0:6.2f}" +
-                                                                        ("MB" if self._net.rate_sent > 1023928.32 else "KB" if _unit else ""),
-                                    "NetworkRecvRate": lambda _unit, _: f"{self._net.rate_recv / 1048576.0 if self._net.rate_recv > 1023928.32 else self._net.rate_recv / 1024.0:6.2f}" +
-                                                                        ("MB" if self._net.rate_recv > 1023928.32 else "KB" if _unit else ""),
-                                    })
-
-            self.format_desc.update({"NetworkSent": "Network Sent Count in MB/GB",
-                                     "NetworkRecv": "Network Received Count in MB/GB",
-                                     "NetworkSentRate": "Network Sent Rate in KB/MB",
-                                     "NetworkRecvRate": "Network Received Rate in KB/MB",
-                                     })
-            # temperature
-            def _format_cpu_temps(_unit: bool, _cels: bool, _i: int, _j: int) -> str:
-                if _cels:
-                    return f"{self._temp.cpu_temps[_i][_j][1]:4.1f}" + ("℃" if _unit else "")
-                else:
-                    return f"{_c2f(self._temp.cpu_temps[_i][_j][1]):5.1f}" + ("℉" if _unit else "")
 
-            def _format_disk_temps(_unit: bool, _cels: bool, _i: int, _j: int) -> str:
-                if _cels:
-                    return f"{self._temp.disk_temps[_i][_j][1]:4.1f}" + ("℃" if _unit else "")
-                else:
-                    return f"{_c2f(self._temp.disk_temps[_i][_j][1]):5.1f}" + ("℉" if _unit else "")
+class Sensors:
+    def __init__(self, intervals: Union[Dict[str, float], None] = None, history_capacity: int = 3600,
+                 root: pathlib.Path = pathlib.Path("/"), providers: Union[List[Union[Type[Provider], Provider]], None] = None):
+        """
+        :param intervals: {source name: seconds} overriding provider defaults
+        :param history_capacity: samples kept of each key
+        :param root: filesystem root of /proc and /sys, a generated tree in tests and benchmarks
+        :param providers: provider classes or instances, default discover_providers()
+        """
+        self._root = root
+        self._sources: Dict[str, Provider] = {}
+        self._intervals: Dict[str, float] = {} if intervals is None else dict(intervals)
+        self._cost: Dict[str, _SourceCost] = {}
+        self._next_update: Dict[str, float] = {}
+        # consecutive failed updates of a source, its interval is backed off meanwhile
+        self._failures: Dict[str, int] = {}
+        # keys of the last values of each source, keys it stops returning are dropped
+        self._source_keys: Dict[str, Set[str]] = {}
+
+        # demanded keys of each owner, and short living keys from the api
+        self._lock = threading.Lock()
+        self._demand: Dict[Any, frozenset] = {}
+        self._leases: Dict[str, float] = {}
+        self._active: frozenset = frozenset()
+
+        self._snapshot = SensorSnapshot(0, time.monotonic(), types.MappingProxyType({}))
+        self.history = History(history_capacity)
+        self._sampler: Union[threading.Thread, None] = None
+        self.stop_env = threading.Event()
+
+        # key -> source name
+        self._key_source: Dict[str, str] = {}
+
+        self.format_def: Dict[str, Callable[[Any, bool, bool, ], str]] = {}
+        self.format_desc: Dict[str, str] = {}
+        self.format_unit: Dict[str, str] = {}
+        self._unknown_keys: Set[str] = set()
+
+        for p in (discover_providers() if providers is None else providers):
+            self.register(p)
+
+    def register(self, _provider: Union[Type[Provider], Provider]) -> Union[Provider, None]:
+        """
+        add a provider, sample it once and add its keys, call before start()
+        :param _provider: provider class created with the root, or an instance
+        :return: the provider, None if not available
+        """
+        try:
+            p = _provider if isinstance(_provider, Provider) else _provider(self._root)
+        except Exception as e:
+            logger.warning(f"Sensor provider {_provider} not available: {e}")
+            return None
+        if p.name in self._sources.keys():
+            logger.warning(f"Sensor provider {p.name} already registered")
+            return None
+
+        self._sources[p.name] = p
+        self._intervals.setdefault(p.name, p.interval)
+        self._cost[p.name] = _SourceCost()
+        self._next_update[p.name] = 0.0
+        self._failures[p.name] = 0
+        self._source_keys[p.name] = set()
+
+        # first snapshot before any renderer reads
+        self._update([p.name])
+
+        # declared keys activate the source even before it returns a value of them
+        for k in p.keys():
+            self.format_def[k.key] = k.formatter
+            self.format_desc[k.key] = k.desc
+            self.format_unit[k.key] = k.unit
+            self._key_source[k.key] = p.name
+
+        return p
+
+    def start(self) -> None:
+        """
+        start the sampler thread
+        :return:
+        """
+        if self._sampler is not None:
+            return
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
 
-            def _format_misc_temps(_unit: bool, _cels: bool, _i: int, _j: int) -> str:
-                if _cels:
-                    return f"{self._temp.misc_temps[_i][_j][1]:4.1f}" + ("℃" if _unit else "")
-                else:
-                    return f"{_c2f(self._temp.misc_temps[_i][_j][1]):5.1f}" + ("℉" if _unit else "")
-
-            for _c in range(self._temp.cpu_count):
-                self.format_def.update({f"CpuTemp{i:03d}": lambda _unit, _cels, _i=_c, _j=i: _format_cpu_temps(_unit, _cels, _i, _j) for i in range(len(self._temp.cpu_temps[_c]))})
-            for _c in range(self._temp.disk_count):
-                self.format_def.update({f"DiskTemp{i:03d}": lambda _unit, _cels, _i=_c, _j=i: _format_disk_temps(_unit, _cels, _i, _j) for i in range(len(self._temp.disk_temps[_c]))})
-            for _c in range(self._temp.misc_count):
-                self.format_def.update({f"MiscTemp{i:03d}": lambda _unit, _cels, _i=_c, _j=i: _format_misc_temps(_unit, _cels, _i, _j) for i in range(len(self._temp.misc_temps[_c]))})
-
-            for c in range(self._temp.cpu_count):
-                self.format_desc.update(
-                    {f"CpuTemp{i:03d}": f"CPU Temperature of {self._temp.cpu_names[c]} {v[0]}({i})" for i, v in
-                     enumerate(self._temp.cpu_temps[c])})
-            for c in range(self._temp.disk_count):
-                self.format_desc.update(
-                    {f"DiskTemp{i:03d}": f"Disk Temperature of {self._temp.disk_names[c]} {v[0]}({i})" for i, v in
-                     enumerate(self._temp.disk_temps[c])})
-            for c in range(self._temp.misc_count):
-                self.format_desc.update(
-                    {f"MiscTemp{i:03d}": f"Misc Temperature of {self._temp.misc_names[c]} {v[0]}({i})" for i, v in
-                     enumerate(self._temp.misc_temps[c])})
-
-            # system
-            def _format_system_uptime(_, __) -> str:
-                _uptime = self._system.boot_time - time.time()
-                if _uptime < 86400.0:
-                    return time.strftime("%_H:%M:%S", time.gmtime(_uptime))
+    def demand(self, _owner: Any, _keys: Set[str]) -> None:
+        """
+        set keys referenced by an owner, sources no one references are not sampled
+        :param _owner: theme, canvas or anything hashable
+        :param _keys: sensor keys
+        :return:
+        """
+        with self._lock:
+            if len(_keys) > 0:
+                self._demand[_owner] = frozenset(_keys)
+            else:
+                self._demand.pop(_owner, None)
+            self._refresh_active()
+
+    def release(self, _owner: Any) -> None:
+        self.demand(_owner, set())
+
+    def touch(self, _keys: Set[str], _ttl: float = 10.0) -> None:
+        """
+        keep keys sampled for a while, for clients polling without a theme
+        :param _keys: sensor keys
+        :param _ttl: seconds
+        :return:
+        """
+        expire = time.monotonic() + _ttl
+        with self._lock:
+            for k in _keys:
+                self._leases[k] = expire
+            self._refresh_active()
+
+    def _refresh_active(self) -> None:
+        now = time.monotonic()
+        self._leases = {k: e for k, e in self._leases.items() if e > now}
+
+        keys = set(self._leases.keys())
+        for ks in self._demand.values():
+            keys.update(ks)
+        active = set()
+        for k in keys:
+            # devices plugged after start belong to the source of their kind
+            n = self._key_source.get(k) or self._key_source.get(k.partition(".")[0])
+            if n is not None:
+                active.add(n)
+        self._active = frozenset(active)
+
+    def _sample_loop(self) -> None:
+        logger.debug("Sensors sampler started")
+        while not self.stop_env.is_set():
+            if len(self._leases) > 0:
+                with self._lock:
+                    self._refresh_active()
+            active = self._active
+
+            now = time.monotonic()
+            due = [n for n in active if self._next_update[n] <= now]
+            if len(due) > 0:
+                self._update(due)
+
+            # sleep until the next source is due, idle slowly when nothing is referenced
+            wait = min((self._next_update[n] for n in active), default=now + min(self._intervals.values(), default=1.0)) - time.monotonic()
+            self.stop_env.wait(max(wait, 0.01))
+        logger.debug("Sensors sampler stopped")
+
+    def _update(self, _sources) -> None:
+        """
+        refresh sources and publish a new snapshot, only called by the sampler
+        :param _sources: source names
+        :return:
+        """
+        values: Dict[str, Any] = dict(self._snapshot.values)
+        for n in _sources:
+            s = self._sources[n]
+            opens, reads = IoCount.opens, IoCount.reads
+            t0 = time.perf_counter()
+            try:
+                s.update()
+                sv = s.values()
+            except Exception as e:
+                # a failing source keeps its last values and is retried less often, the others go on
+                failures = self._failures[n] = self._failures[n] + 1
+                backoff = self._intervals.get(n, 1.0) * min(2 ** failures, 64)
+                self._next_update[n] = time.monotonic() + backoff
+                if failures == 1:
+                    logger.error(f"Sensor source {n} update failed: {e}")
                 else:
-                    return f"{_uptime // 86400.0:.0f} days, " + time.strftime("%_H:%M:%S", time.gmtime(_uptime))
+                    logger.debug(f"Sensor source {n} update failed {failures} times, retry in {backoff:.1f}s: {e}")
+                continue
+            cost = time.perf_counter() - t0
+            self._cost[n].add(cost, IoCount.opens - opens, IoCount.reads - reads)
+
+            now = time.monotonic()
+            self._next_update[n] = now + self._intervals.get(n, 1.0)
+            if self._failures[n] > 0:
+                logger.info(f"Sensor source {n} recovered after {self._failures[n]} failed updates")
+                self._failures[n] = 0
+
+            for k in self._source_keys[n] - sv.keys():
+                values.pop(k, None)
+            self._source_keys[n] = set(sv.keys())
+            self._key_source.update({k: n for k in sv.keys()})
+            self.history.append(now, sv)
+            values.update(sv)
+
+        # single reference swap, readers never see a half built snapshot
+        self._snapshot = SensorSnapshot(self._snapshot.seq + 1, time.monotonic(), types.MappingProxyType(values))
+
+    def snapshot(self) -> SensorSnapshot:
+        return self._snapshot
+
+    def select(self, _keys: Union[str, None]) -> Set[str]:
+        """
+        keys of a query argument
+        :param _keys: k1,k2,... None or empty for all keys
+        :return:
+        """
+        if _keys is None or _keys == "":
+            return set(self.format_desc.keys())
+        return set(_keys.split(","))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        sampling cost of each source, opens and reads only count sysfs and proc files read with SysfsFile
+        :return: {source: {active, cost, interval, count, total, last, mean, p99, max, opens, reads}} in seconds
+        """
+        active = self._active
+        return {n: {
+            "active": n in active,
+            "cost": self._sources[n].cost,
+            "interval": self._intervals.get(n, 1.0),
+            **c.stats(),
+        } for n, c in self._cost.items()}
+
+    def _unknown_key(self, key: str) -> None:
+        if key not in self._unknown_keys:
+            self._unknown_keys.add(key)
+            logger.warning(f"Unknown sensor key {key}")
+
+    def _lookup(self, key: str) -> Tuple[Union[Callable[[Any, bool, bool, ], str], None], str]:
+        """
+        formatter and description of a key, devices plugged after start use the formatter of their kind
+        :param key: sensor key, "Kind.device" for devices
+        :return:
+        """
+        f = self.format_def.get(key)
+        if f is not None:
+            return f, self.format_desc[key]
+
+        kind, dot, device = key.partition(".")
+        f = self.format_def.get(kind)
+        if f is None or not dot:
+            self._unknown_key(key)
+            return None, "None"
+        return f, f"{self.format_desc[kind]} ({device})"
+
+    def format(self, key: str, unit: bool, cels: bool) -> Tuple[Union[str, None], str]:
+        f, desc = self._lookup(key)
+        if f is None:
+            return None, desc
 
-            self.format_def.update({"SystemLoad": lambda _, __: f"{self._system.load_average[0]:5.2f}, {self._system.load_average[1]:5.2f}, {self._system.load_average[2]:5.2f}",
-                                    "SystemUptime": _format_system_uptime,
-                                    "SystemIoWait": lambda _unit, _: f"{self._system.iowait_percent:5.2f}" + "%" if _unit else "",
-                                    })
+        values = self._snapshot.values
+        if key not in values.keys():
+            return None, desc
 
-            self.format_desc.update({"SystemLoad": "System Average Load",
-                                     "SystemUptime": "Uptime",
-                                     "SystemIoWait": "CPU Time IO Wait Percentage",
-                                     })
+        return f(values[key], unit, cels), desc
 
-        return self.format_def.get(key, lambda _, __: None)(unit, cels), self.format_desc.get(key, "None")
+    def formatter(self, key: str, unit: bool, cels: bool,
+                  _filter: Union[WidgetFilter, None] = None) -> Callable[[SensorSnapshot], Union[str, None]]:
+        """
+        bind a key to its formatter once, call the result with the latest snapshot on every frame
+        :param key: sensor key
+        :param unit: with unit
+        :param cels: celsius or fahrenheit
+        :param _filter: smoothing and threshold of this widget, see widget_filter()
+        :return:
+        """
+        f, _ = self._lookup(key)
+        if f is None:
+            return lambda _snapshot: None
+
+        if _filter is None:
+            def _format(_snapshot: SensorSnapshot) -> Union[str, None]:
+                v = _snapshot.values.get(key)
+                return None if v is None else f(v, unit, cels)
+        else:
+            def _format(_snapshot: SensorSnapshot) -> Union[str, None]:
+                v = _filter.apply(_snapshot)
+                return None if v is None else f(v, unit, cels)
+
+        return _format
+
+    def widget_filter(self, key: str, smooth: Union[str, None] = None, tau: float = 1.0, window: float = 2.0,
+                      threshold: float = 0.0) -> Union[WidgetFilter, None]:
+        """
+        :param key: sensor key
+        :param smooth: None, "ema" or "mean"
+        :param tau: ema time constant in seconds
+        :param window: mean window in seconds
+        :param threshold: minimum change of the shown raw value
+        :return: None when nothing to filter
+        """
+        if smooth is None and threshold <= 0.0:
+            return None
+        return WidgetFilter(key, self.history, smooth, tau, window, threshold)
 
     def clean(self):
         """
         clean on exit
         :return:
         """
-        self._gpu.clean()
+        self.stop_env.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        for p in self._sources.values():
+            p.clean()
+
+
+def stream_interval(_args: Mapping[str, str]) -> float:
+    """
+    :param _args: query arguments, interval=seconds at least 0.1
+    :return: seconds between sensor events
+    :raise ValueError: malformed argument
+    """
+    return max(0.1, float(_args.get("interval", "1")))
+
+
+class SensorEvents:
+    """
+    server-sent events of changed sensor values, polled every interval by the threaded and the asyncio server
+    """
+    # comment sent after this many quiet seconds, keeps the connection alive through proxies
+    KEEP_ALIVE = 15.0
+
+    def __init__(self, _sensors: Sensors, _keys: Set[str], _interval: float):
+        self._sensors = _sensors
+        self.keys = _keys
+        self.interval = _interval
+        # values already sent to the client
+        self._sent: Dict[str, Any] = {}
+        self._seq = -1
+        self._idle = 0.0
+
+    def poll(self) -> str:
+        """
+        keep the keys sampled and diff the newest snapshot against what was sent
+        :return: event of the changed values, a keep alive comment or empty
+        """
+        self._sensors.touch(self.keys, max(10.0, self.interval * 2))
+        snapshot = self._sensors.snapshot()
+        if snapshot.seq != self._seq:
+            self._seq = snapshot.seq
+            changed = {k: v for k, v in snapshot.values.items() if k in self.keys and self._sent.get(k) != v}
+            if len(changed) > 0:
+                self._sent.update(changed)
+                self._idle = 0.0
+                return f"id: {snapshot.seq}\ndata: {json.dumps(changed)}\n\n"
+        self._idle += self.interval
+        if self._idle >= self.KEEP_ALIVE:
+            self._idle = 0.0
+            return ": \n\n"
+        return ""
+
+
+def profile(_seconds: float, _root: pathlib.Path = pathlib.Path("/")) -> None:
+    """
+    sample every key of every provider for a while and print the cost of each source
+    :param _seconds: sampling time
+    :param _root: filesystem root
+    :return:
+    """
+    s = Sensors(root=_root)
+    s.demand(profile, s.format_desc.keys())
+    s.start()
+    time.sleep(_seconds)
+    s.clean()
+
+    print(f"{'source':<10}{'cost':>8}{'interval':>10}{'count':>8}{'mean us':>10}{'p99 us':>10}{'max us':>10}"
+          f"{'opens':>8}{'reads':>8}")
+    for n, c in sorted(s.stats().items(), key=lambda _i: -_i[1]["total"]):
+        print(f"{n:<10}{c['cost']:>8}{c['interval']:>10.2f}{c['count']:>8}{c['mean'] * 1e6:>10.1f}"
+              f"{c['p99'] * 1e6:>10.1f}{c['max'] * 1e6:>10.1f}{c['opens']:>8}{c['reads']:>8}")
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="lcdc.server.sensors", description="print sensor values or sampling costs")
+    parser.add_argument("-p", "--profile", type=float, metavar="SECONDS", help="sample all keys and print a cost table")
+    parser.add_argument("-r", "--root", type=str, default="/", help="filesystem root of /proc and /sys")
+    args = parser.parse_args()
+
+    if args.profile is not None:
+        logging.basicConfig(level=logging.ERROR)
+        profile(args.profile, pathlib.Path(args.root))
+        exit(0)
+
     cpu = _CPU()
     gpu = _GPU()
     atexit.register(gpu.clean)
@@ -1,6 +1,6 @@
 
+import dataclasses
 import flask
-import io
 import logging
 import os
 import pathlib
@@ -11,14 +11,18 @@ import threading
 import werkzeug
 
 from .config import Config
-from .sensors import Sensors
+from .metrics import exposition
+from .preview import mjpeg_part, preview_args, stream_period
+from .sensors import SensorEvents, Sensors, stream_interval
 from ..display.usb_display import usb_detect
+from ..theme.font import FontManager
 
 
 logger = logging.getLogger(__name__)
 
 
-def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pathlib.Path, __data_dir: pathlib.Path) -> int:
+def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pathlib.Path, __data_dir: pathlib.Path,
+        __asyncio: bool = False) -> int:
 
     logger.info(f"Detecting displays")
     lcdc_displays = usb_detect()
@@ -28,12 +32,17 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
 
     logger.info("Starting server")
     lcdc_app = flask.Flask(__name__)
-    lcdc_server = werkzeug.serving.make_server(host=__listen_addr, port=__listen_port, app=lcdc_app, passthrough_errors=not __debug)
     lcdc_sensors = Sensors()
+    # cached font index, rebuilt in the background when fonts changed
+    lcdc_fonts = FontManager(__data_dir)
+    try:
+        lcdc_fonts.init(True)
+    except AssertionError as e:
+        logger.warning(e)
 
     # main process
     lcdc_configs = Config(__config_dir, __data_dir)
-    lcdc_canvas = lcdc_configs.setup_canvas(lcdc_displays, lcdc_sensors)
+    lcdc_canvas = lcdc_configs.setup_canvas(lcdc_displays, lcdc_sensors, lcdc_fonts)
 
     lcdc_canvas_paints = []
     for c in lcdc_canvas:
@@ -54,8 +63,7 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
             ret.append({"id_vendor": d.device()[0], "id_product": d.device()[1]})
         return flask.jsonify({"displays": ret})
 
-    @lcdc_app.route("/lcdc/displays/frame", methods=["GET"])
-    def route_lcdc_displays_frame():
+    def display_index_arg():
         id_v = flask.request.args.get("vendor")
         id_p = flask.request.args.get("product")
         try:
@@ -66,14 +74,58 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
 
         for i in range(len(lcdc_displays)):
             if lcdc_displays[i].device()[0] == id_v and lcdc_displays[i].device()[1] == id_p:
-                img = lcdc_canvas[i].last_frame()
-                buf = io.BytesIO()
-                img.convert("RGB").save(buf, format="JPEG", progressive=True, optimize=True, )
-                buf.seek(0)
-                return flask.send_file(path_or_file=buf, mimetype='image/jpeg')
+                return i
 
         return flask.abort(404)
 
+    def query_args(_parse):
+        try:
+            return _parse(flask.request.args)
+        except ValueError:
+            return flask.abort(400)
+
+    @lcdc_app.route("/lcdc/displays/frame", methods=["GET"])
+    def route_lcdc_displays_frame():
+        # size=WxH or scale=0.05-1, quality=1-95, 304 if If-None-Match has the etag of the current frame
+        preview = lcdc_canvas[display_index_arg()].preview
+        scale, quality, size = query_args(preview_args)
+        progressive = scale == 1.0 and size is None and "quality" not in flask.request.args
+
+        etag = preview.etag(preview.seq, scale, quality, progressive, size)
+        if flask.request.if_none_match.contains(etag):
+            ret = flask.Response(status=304)
+        else:
+            seq, jpeg = preview.encode(scale, quality, progressive, size)
+            etag = preview.etag(seq, scale, quality, progressive, size)
+            ret = flask.Response(jpeg, mimetype="image/jpeg")
+        ret.set_etag(etag)
+        ret.headers["Cache-Control"] = "no-cache"
+        return ret
+
+    @lcdc_app.route("/lcdc/displays/stream", methods=["GET"])
+    def route_lcdc_displays_stream():
+        # multipart MJPEG of new frames, fps=max frames per second size=WxH or scale=0.05-1 quality=1-95
+        preview = lcdc_canvas[display_index_arg()].preview
+        scale, quality, size = query_args(preview_args)
+        period = query_args(stream_period)
+
+        def stream():
+            seq = -1
+            while not lcdc_sensors.stop_env.is_set():
+                t0 = time.monotonic()
+                # a slow client skips to the newest frame, the render thread never waits for it
+                if preview.wait(seq, 15.0) == seq:
+                    # keep alive with the same frame
+                    seq = -1
+                seq, jpeg = preview.encode(scale, quality, False, size)
+                if jpeg is None:
+                    continue
+                yield mjpeg_part(jpeg)
+                time.sleep(max(0.0, period - (time.monotonic() - t0)))
+
+        return flask.Response(stream(), mimetype="multipart/x-mixed-replace; boundary=frame",
+                              headers={"Cache-Control": "no-cache"})
+
     @lcdc_app.route("/lcdc/displays/config", methods=["GET"])
     def route_lcdc_displays_config():
         id_v = flask.request.args.get("vendor")
@@ -90,10 +142,99 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
 
         return flask.abort(404)
 
+    @lcdc_app.route("/lcdc/displays/config", methods=["PUT", "PATCH"])
+    def route_lcdc_displays_config_write():
+        # PUT {"widgets": [widget, ...]} replaces all widgets
+        # PATCH {"widgets": {"index": {option: value or null to remove}}} changes some widgets
+        canvas = lcdc_canvas[display_index_arg()]
+        body = flask.request.get_json(silent=True)
+        if not isinstance(body, dict) or "widgets" not in body:
+            return flask.jsonify({"error": "body must be a json object with widgets"}), 400
+
+        try:
+            if flask.request.method == "PUT":
+                canvas.set_theme_widgets(body["widgets"])
+            else:
+                canvas.patch_theme_widgets(body["widgets"])
+        except ValueError as e:
+            return flask.jsonify({"error": str(e)}), 400
+
+        return flask.jsonify(canvas.get_theme_config())
+
+    @lcdc_app.route("/lcdc/displays/stats", methods=["GET"])
+    def route_lcdc_displays_stats():
+        id_v = flask.request.args.get("vendor")
+        id_p = flask.request.args.get("product")
+        try:
+            id_v = int(id_v)
+            id_p = int(id_p)
+        except Exception:
+            return flask.abort(400)
+
+        for i in range(len(lcdc_displays)):
+            if lcdc_displays[i].device()[0] == id_v and lcdc_displays[i].device()[1] == id_p:
+                # {frames, frames_distinct, filters: [{widget, raw_changes, shown_changes}]}
+                return flask.jsonify(lcdc_canvas[i].get_theme_stats())
+
+        return flask.abort(404)
+
+    @lcdc_app.route("/lcdc/displays/trace", methods=["GET"])
+    def route_lcdc_displays_trace():
+        # frame trace records oldest first, save=1 writes them to the data directory instead
+        i = display_index_arg()
+        trace = lcdc_canvas[i].trace
+        if flask.request.args.get("save", "0") != "0":
+            v, p = lcdc_displays[i].device()
+            fp = __data_dir / f"trace-{v:04x}-{p:04x}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+            return flask.jsonify({"path": str(fp), "records": trace.save(fp)})
+
+        return flask.jsonify({"counts": trace.counts(), "records": trace.dump()})
+
+    @lcdc_app.route("/lcdc/fonts", methods=["GET"])
+    def route_lcdc_fonts():
+        # q=substring prefix=1 to match the start only, offset= limit= for pages
+        try:
+            offset = max(0, int(flask.request.args.get("offset", "0")))
+            limit = min(500, max(1, int(flask.request.args.get("limit", "50"))))
+        except Exception:
+            return flask.abort(400)
+        names = lcdc_fonts.search(flask.request.args.get("q", ""), flask.request.args.get("prefix", "0") != "0")
+
+        ret = []
+        for n, is_fullname in names[offset:offset + limit]:
+            if is_fullname:
+                fi = next(fi for fl in lcdc_fonts.name_fonts[n].values() for fi in fl)
+                ret.append({"name": n, "type": "fullname", "family": fi.family[0],
+                            "style": fi.style[0] if fi.style else "", "slant": fi.slant, "weight": fi.weight,
+                            "width": fi.width, "spacing": fi.spacing, "file": fi.file})
+            else:
+                ret.append({"name": n, "type": "family", "styles": len(lcdc_fonts.family_styles[n])})
+
+        return flask.jsonify({"total": len(names), "offset": offset, "fonts": ret})
+
+    @lcdc_app.route("/lcdc/fonts/match", methods=["GET"])
+    def route_lcdc_fonts_match():
+        family = flask.request.args.get("family")
+        if family is None:
+            return flask.abort(400)
+        try:
+            fi = lcdc_fonts.match(family, int(flask.request.args.get("slant", "0")),
+                                  int(flask.request.args.get("weight", "80")),
+                                  int(flask.request.args.get("width", "100")),
+                                  int(flask.request.args.get("spacing", "-1")))
+        except ValueError:
+            return flask.abort(400)
+        if fi is None:
+            return flask.abort(404)
+
+        font = dataclasses.asdict(fi)
+        font.pop("coverage")
+        return flask.jsonify({"request_family": family, "font": font})
+
     @lcdc_app.route("/lcdc/sensors", methods=["GET"])
     def route_lcdc_sensors():
-        # {key: description}
-        return flask.jsonify({"sensors": lcdc_sensors.format_desc})
+        # {key: description}, {key: unit of raw values}
+        return flask.jsonify({"sensors": lcdc_sensors.format_desc, "units": lcdc_sensors.format_unit})
 
     @lcdc_app.route("/lcdc/sensors/format_key", methods=["GET"])
     def route_lcdc_sensor_format_key():
@@ -105,6 +246,7 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
         cels = flask.request.args.get("cels", "1")
         # without unit: unit=0
         #   fahrenheit: cels=0
+        lcdc_sensors.touch({key})
         ret = lcdc_sensors.format(key, unit != "0", cels != "0")
         if ret[0] is None:
             return flask.abort(404)
@@ -115,6 +257,74 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
             "description": ret[1],
         })
 
+    @lcdc_app.route("/lcdc/sensors/values", methods=["GET"])
+    def route_lcdc_sensors_values():
+        # keys=k1,k2,... default all keys
+        keys = lcdc_sensors.select(flask.request.args.get("keys"))
+        lcdc_sensors.touch(keys)
+        snapshot = lcdc_sensors.snapshot()
+        return flask.jsonify({
+            "seq": snapshot.seq,
+            "timestamp": snapshot.timestamp,
+            "values": {k: v for k, v in snapshot.values.items() if k in keys},
+        })
+
+    @lcdc_app.route("/lcdc/sensors/stream", methods=["GET"])
+    def route_lcdc_sensors_stream():
+        # server-sent events of changed values, keys=k1,k2,... interval=seconds
+        events = SensorEvents(lcdc_sensors, lcdc_sensors.select(flask.request.args.get("keys")),
+                              query_args(stream_interval))
+
+        def stream():
+            while not lcdc_sensors.stop_env.is_set():
+                e = events.poll()
+                if e != "":
+                    yield e
+                time.sleep(events.interval)
+
+        return flask.Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @lcdc_app.route("/lcdc/sensors/history", methods=["GET"])
+    def route_lcdc_sensors_history():
+        key = flask.request.args.get("key")
+        if key is None:
+            return flask.abort(400)
+        try:
+            seconds = float(flask.request.args.get("seconds", "60"))
+        except Exception:
+            return flask.abort(400)
+
+        lcdc_sensors.touch({key})
+        ret = lcdc_sensors.history.aggregate(key, seconds)
+        if ret is None:
+            return flask.abort(404)
+
+        # {count, min, max, mean, p50, p95, p99}
+        return flask.jsonify({
+            "request_key": key,
+            "seconds": seconds,
+            "aggregate": ret,
+        })
+
+    @lcdc_app.route("/lcdc/sensors/stats", methods=["GET"])
+    def route_lcdc_sensors_stats():
+        # {source: {active, cost, interval, count, total, last, mean, p99, max, opens, reads}}
+        return flask.jsonify({"sources": lcdc_sensors.stats()})
+
+    @lcdc_app.route("/metrics", methods=["GET"])
+    def route_metrics():
+        # prometheus text format
+        text = exposition([(f"{d.device()[0]:04x}:{d.device()[1]:04x}", c.metrics) for d, c in zip(lcdc_displays, lcdc_canvas)],
+                          lcdc_sensors.stats())
+        return flask.Response(text, mimetype="text/plain; version=0.0.4")
+
+    if __asyncio:
+        from .aserver import AsyncServer
+        return AsyncServer(lcdc_app, __listen_addr, __listen_port, lcdc_displays, lcdc_canvas, lcdc_sensors,
+                           lcdc_canvas_paints).run()
+
+    lcdc_server = werkzeug.serving.make_server(host=__listen_addr, port=__listen_port, app=lcdc_app, threaded=True, passthrough_errors=not __debug)
+
     # SIGINT handler
     def signal_handler(sig, frame):
         logger.info(f"Signal {sig} detected")
@@ -133,6 +343,7 @@ def run(__listen_addr: str, __listen_port: int, __debug: bool, __config_dir: pat
     signal.signal(signal.SIGINT, signal_handler)
 
     logger.warning("Ctrl+C to stop server")
+    lcdc_sensors.start()
     for _t in lcdc_canvas_paints:
         _t.start()
 
@@ -0,0 +1,94 @@
+import itertools
+import json
+import math
+import numpy
+import pathlib
+import time
+
+from typing import Dict, List
+
+
+# event ids stored in the ring
+TRACE_ACCEPT = 0
+TRACE_DROP_LATE = 1
+TRACE_DROP_SLOW = 2
+TRACE_VIDEO_EMPTY = 3
+TRACE_AUDIO_EMPTY = 4
+TRACE_VIDEO_FULL = 5
+TRACE_AUDIO_FULL = 6
+TRACE_LOOP = 7
+
+TRACE_EVENTS = ("accept", "drop_late", "drop_slow", "video_empty", "audio_empty", "video_full", "audio_full", "loop")
+
+
+class TraceRing:
+    """
+    fixed-size frame trace of a canvas, replaces per-frame debug logging
+
+    Each record is (monotonic time, event, frame time, clock delta, video queue depth, audio queue depth) kept in
+    preallocated column arrays. Writers take a slot from an itertools counter, whose next() is atomic, so the
+    render threads never lock and never format strings. Readers may see the slot being written as a torn record.
+    """
+    def __init__(self, _capacity: int = 4096):
+        self.capacity = _capacity
+        self._t = numpy.zeros(_capacity, dtype=numpy.float64)
+        self._event = numpy.zeros(_capacity, dtype=numpy.int8)
+        self._frame_time = numpy.zeros(_capacity, dtype=numpy.float64)
+        self._delta = numpy.zeros(_capacity, dtype=numpy.float64)
+        self._video_q = numpy.zeros(_capacity, dtype=numpy.int16)
+        self._audio_q = numpy.zeros(_capacity, dtype=numpy.int16)
+        self._counter = itertools.count()
+        # records written, read without taking a slot
+        self._written = 0
+
+    def record(self, _event: int, _frame_time: float = math.nan, _delta: float = math.nan,
+               _video_q: int = -1, _audio_q: int = -1) -> None:
+        n = next(self._counter)
+        i = n % self.capacity
+        self._t[i] = time.monotonic()
+        self._event[i] = _event
+        self._frame_time[i] = _frame_time
+        self._delta[i] = _delta
+        self._video_q[i] = _video_q
+        self._audio_q[i] = _audio_q
+        self._written = max(self._written, n + 1)
+
+    def dump(self) -> List[Dict]:
+        """
+        :return: records oldest first, nan fields as None
+        """
+        n = self._written
+        if n <= self.capacity:
+            order = numpy.arange(n)
+        else:
+            order = (numpy.arange(self.capacity) + n) % self.capacity
+
+        def _f(_v: float):
+            return None if math.isnan(_v) else float(_v)
+
+        return [{
+            "t": float(self._t[i]),
+            "event": TRACE_EVENTS[self._event[i]],
+            "frame_time": _f(self._frame_time[i]),
+            "delta": _f(self._delta[i]),
+            "video_queue": int(self._video_q[i]),
+            "audio_queue": int(self._audio_q[i]),
+        } for i in order]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        events of each kind in the ring
+        """
+        c = numpy.bincount(self._event[:min(self._written, self.capacity)], minlength=len(TRACE_EVENTS))
+        return {e: int(c[i]) for i, e in enumerate(TRACE_EVENTS)}
+
+    def save(self, _path: pathlib.Path) -> int:
+        """
+        write records as json lines
+        :return: records written
+        """
+        records = self.dump()
+        with open(_path, "w") as f:
+            for r in records:
+                f.write(json.dumps(r) + "\n")
+        return len(records)
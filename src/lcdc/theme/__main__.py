@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import pathlib
+import re
+import time
+
+from typing import List, Tuple
+
+
+def main(_in_dir: str, _out_dir: str, _resolutions: List[str], _jobs: int, _force: bool, _debug: bool) -> int:
+    logging.basicConfig(level=logging.DEBUG if _debug else logging.WARNING)
+    logger = logging.getLogger(__name__)
+
+    in_dir = pathlib.Path(_in_dir).expanduser().absolute()
+    if not in_dir.is_dir():
+        logger.error(f"Theme directory {in_dir} is not a directory")
+        return -1
+    out_dir = pathlib.Path(_out_dir).expanduser().absolute()
+
+    resolutions: List[Tuple[int, int]] = []
+    for r in _resolutions or []:
+        m = re.fullmatch(r"([\d]+)x([\d]+)", r)
+        if m is None or int(m.group(1)) == 0 or int(m.group(2)) == 0:
+            logger.error(f"Invalid resolution format: {r}")
+            return -1
+        resolutions.append((int(m.group(1)), int(m.group(2))))
+    if len(resolutions) == 0:
+        # every supported display
+        from lcdc.display.usb_display import usb_resolutions
+        resolutions = sorted({r for rl in usb_resolutions().values() for r in rl})
+
+    from lcdc.theme.convert import convert_all
+
+    counts = {"converted": 0, "skipped": 0, "failed": 0}
+    t = time.perf_counter()
+    for r in convert_all(in_dir, out_dir, resolutions, _jobs, _force):
+        counts[r.status] += 1
+        print(f"{r.status:9} {r.seconds:7.3f}s  {r.theme}" + (f"  {r.error}" if r.error else ""))
+    print(f"{sum(counts.values())} themes to {', '.join(f'{w}x{h}' for w, h in resolutions)} in "
+          f"{time.perf_counter() - t:.3f}s: {counts['converted']} converted, {counts['skipped']} up to date, "
+          f"{counts['failed']} failed")
+
+    return 1 if counts["failed"] > 0 else 0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog="lcdc.theme", description="convert DC themes into lcdc themes")
+    parser.add_argument("themes", type=str, help="directory searched for .dc theme files")
+    parser.add_argument("output", type=str, help="output directory")
+    parser.add_argument("-r", "--resolution", type=str, action="append",
+                        help="target WxH, repeatable, all supported displays by default")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, cpu count by default")
+    parser.add_argument("-f", "--force", action="store_true", help="convert up to date themes again")
+    parser.add_argument("-d", "--debug", action="store_true", help="set debug log level mode")
+    parser.set_defaults(func=lambda args: main(args.themes, args.output, args.resolution, args.jobs, args.force,
+                                               args.debug))
+
+    myfunc = parser.parse_args()
+    exit(myfunc.func(myfunc))
@@ -0,0 +1,153 @@
+import collections
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+
+from PIL import Image
+from typing import Dict, Iterator, List, Tuple, Union
+
+from .dc import dc_config
+
+
+logger = logging.getLogger(__name__)
+
+
+# bump when the output of a theme changes, so converted themes are redone
+_CONVERT_VERSION = 2
+_HASH_FILE = "source.sha256"
+
+
+@dataclasses.dataclass
+class ConvertResult:
+    theme: str
+    # converted, skipped or failed
+    status: str
+    seconds: float
+    error: str = ""
+
+
+def _source_hash(_dc_file: pathlib.Path, _config: Dict, _resolutions: List[Tuple[int, int]]) -> str:
+    """
+    hash of everything a converted theme is made of
+    """
+    h = hashlib.sha256(f"{_CONVERT_VERSION} {_resolutions}".encode())
+    for p in (_dc_file, _config["background"], _config["mask"]):
+        if p is None:
+            h.update(b"\0")
+            continue
+        with open(p, "rb") as f:
+            while b := f.read(1048576):
+                h.update(b)
+    return h.hexdigest()
+
+
+def _scale_widget(_w: Dict, _sx: float, _sy: float) -> Dict:
+    w = dict(_w)
+    if "xy" in w:
+        w["xy"] = [round(w["xy"][0] * _sx), round(w["xy"][1] * _sy)]
+    if "size" in w:
+        w["size"] = max(1.0, round(w["size"] * min(_sx, _sy), 1))
+    if "wh" in w:
+        w["wh"] = [max(1, round(w["wh"][0] * _sx)), max(1, round(w["wh"][1] * _sy))]
+    return w
+
+
+def _write_json(_path: pathlib.Path, _data: Dict) -> None:
+    tmp = _path.parent / (_path.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(json.dumps(_data, ensure_ascii=False, indent=4))
+    os.replace(tmp, _path)
+
+
+def convert_theme(_dc_file: pathlib.Path, _out_dir: pathlib.Path, _resolutions: List[Tuple[int, int]],
+                  _force: bool = False) -> str:
+    """
+    convert a DC theme into one lcdc theme directory per resolution, named WxH under _out_dir
+    the background is transcoded to JPEG and scaled with the mask and widgets to each resolution
+    :param _dc_file:
+    :param _out_dir:
+    :param _resolutions:
+    :param _force: convert even if the outputs are up to date
+    :return: converted or skipped
+    """
+    config = dc_config(_dc_file)
+    digest = _source_hash(_dc_file, config, _resolutions)
+    hash_file = _out_dir / _HASH_FILE
+    if (not _force and hash_file.is_file() and hash_file.read_text().strip() == digest and
+            all((_out_dir / f"{w}x{h}" / "config.json").is_file() for w, h in _resolutions)):
+        return "skipped"
+
+    _out_dir.mkdir(parents=True, exist_ok=True)
+    with Image.open(config["background"]) as bg:
+        background = bg.convert("RGB")
+    mask = None
+    if config["mask"] is not None:
+        with Image.open(config["mask"]) as m:
+            mask = m.convert("RGBA")
+
+    for w, h in _resolutions:
+        d = _out_dir / f"{w}x{h}"
+        d.mkdir(exist_ok=True)
+        # widget offsets and sizes are in pixels of the original background
+        sx, sy = w / background.width, h / background.height
+
+        bg_file = d / "background.jpg"
+        background.resize((w, h), Image.Resampling.LANCZOS).save(bg_file, format="JPEG", quality=95)
+        mask_file = d / "mask.png"
+        if mask is None:
+            Image.new("RGBA", (w, h), (0, 0, 0, 0)).save(mask_file, format="PNG")
+        else:
+            mask.resize((w, h), Image.Resampling.LANCZOS).save(mask_file, format="PNG")
+
+        _write_json(d / "config.json", {
+            "background": str(bg_file.absolute()),
+            "mask": str(mask_file.absolute()),
+            "widgets": [_scale_widget(wd, sx, sy) for wd in config["widgets"]],
+        })
+
+    # written last, an interrupted conversion is redone
+    hash_file.write_text(digest + "\n")
+    return "converted"
+
+
+def _convert_task(_name: str, _dc_file: pathlib.Path, _out_dir: pathlib.Path, _resolutions: List[Tuple[int, int]],
+                  _force: bool) -> ConvertResult:
+    t = time.perf_counter()
+    try:
+        status = convert_theme(_dc_file, _out_dir, _resolutions, _force)
+        return ConvertResult(_name, status, time.perf_counter() - t)
+    except Exception as e:
+        return ConvertResult(_name, "failed", time.perf_counter() - t, f"{type(e).__name__}: {e}")
+
+
+def convert_all(_in_dir: pathlib.Path, _out_dir: pathlib.Path, _resolutions: List[Tuple[int, int]],
+                _jobs: Union[int, None] = None, _force: bool = False) -> Iterator[ConvertResult]:
+    """
+    convert every .dc theme under _in_dir in a process pool
+    :param _in_dir: searched recursively, the directory of each .dc file is one theme
+    :param _out_dir: themes keep their path relative to _in_dir
+    :param _resolutions:
+    :param _jobs: worker processes, cpu count if None
+    :param _force:
+    :return: results in completion order
+    """
+    dc_files = sorted(_in_dir.rglob("*.dc"))
+    if len(dc_files) == 0:
+        return
+    per_dir = collections.Counter(f.parent for f in dc_files)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=_jobs) as pool:
+        futures = []
+        for f in dc_files:
+            rel = f.parent.relative_to(_in_dir)
+            # several .dc files in one directory are kept apart
+            if per_dir[f.parent] > 1:
+                rel = rel / f.stem
+            futures.append(pool.submit(_convert_task, str(rel), f, _out_dir / rel, _resolutions, _force))
+        for fu in concurrent.futures.as_completed(futures):
+            yield fu.result()
@@ -1,8 +1,15 @@
+import json
 import logging
+import mmap
+import os
+import pathlib
 import struct
 import sys
 
-from typing import List, Tuple
+from PIL import Image
+from typing import Dict, List, Tuple, Union
+
+from .font import FC_SLANT_ITALIC, FC_SLANT_ROMAN, FC_WEIGHT_BOLD, FC_WEIGHT_REGULAR
 
 
 logger = logging.getLogger(__name__)
@@ -177,67 +184,228 @@ class DC:
                 f"Offset: ({self.x_offset}, {self.y_offset})\n")
 
 
-def dc_load_dd(dc) -> int:
-    buffer = dc.read(1)
-    if buffer == b'\x00':
+# (w_device, w_param) of sensor widgets: lcdc sensor key, None if lcdc has no such sensor
+DC_SENSORS: Dict[Tuple[int, int], Union[str, None]] = {
+    (0, 1): "CpuTemp000",
+    (0, 2): "CpuUsage",
+    (0, 3): "CpuFreq",
+    (0, 4): None,
+    (1, 1): "GpuTemp000",
+    (1, 2): "GpuUsage000",
+    (1, 3): None,
+    (1, 4): None,
+    (2, 1): None,
+    (2, 2): "MemoryDdrUsage",
+    (2, 3): None,
+    (2, 4): "MemoryDdrFree",
+    (3, 1): "DiskTemp000",
+    (3, 2): None,
+    (3, 3): "DiskReadRate",
+    (3, 4): "DiskWriteRate",
+    (4, 1): "NetworkSentRate",
+    (4, 2): "NetworkRecvRate",
+    (4, 3): "NetworkSent",
+    (4, 4): "NetworkRecv",
+    (5, 1): "FanRpm000",
+    (5, 2): "FanRpm001",
+    (5, 3): "FanRpm002",
+    (5, 4): "FanRpm003",
+    (10000, 1): "FanRpm000",
+}
+
+# (w_type, w_mode) of time, weekday and date widgets: clock widget format
+DC_CLOCKS: Dict[Tuple[int, int], str] = {
+    (1, 1): "time12",
+    (1, 2): "time24",
+    (2, 0): "weekday_zh",
+    (2, 1): "weekday",
+    (3, 1): "ymd",
+    (3, 2): "dmy",
+    (3, 3): "md",
+    (3, 4): "dm",
+}
+
+# files next to the .dc file in a theme directory
+DC_BACKGROUNDS = ("00.png", "00.jpg")
+DC_MASK = "01.png"
+
+
+def dc_load_dd(_buf: memoryview, _offset: int) -> List[DC]:
+    """
+    parse the widget records of a 0xDD theme
+    :param _buf: whole file
+    :param _offset: first byte after the 0xDD magic
+    :return:
+    """
+    o = _offset
+
+    def _take(_n: int) -> int:
+        nonlocal o
+        if o + _n > len(_buf):
+            raise ValueError(f"dc file truncated at {o}, {_n} bytes expected")
+        o += _n
+        return o - _n
+
+    def _string() -> str:
+        n = _buf[_take(1)]
+        return str(_buf[_take(n):o], "utf-8", "ignore") if n > 0 else ""
+
+    flag = _buf[_take(1)]
+    if flag == 0x00:
         logger.info("theme without text/data widgets")
-        return 0
-    elif buffer == b'\x01':
-        pass
-    else:
-        logger.info(f"unexpected data {buffer}\n")
+        return []
+    elif flag != 0x01:
+        logger.info(f"unexpected data {flag:#04x}")
 
     # widgets count
-    b = dc.read(4)
-    wc = int.from_bytes(b, 'little')
+    wc, = struct.unpack_from("<I", _buf, _take(4))
     logger.info(f"will load {wc} widgets")
 
     # widgets read
+    ret: List[DC] = []
     for i in range(wc):
-        b = dc.read(24)
-        w_type, w_mode, x_offset, y_offset, w_device, w_param = struct.unpack("<IIIIII", b)
-        rdc = DC(w_type, w_mode, x_offset, y_offset, w_device, w_param)
-
-        b = dc.read(1)
-        if b[0] > 0:
-            b = dc.read(b[0])
-            rdc.f_name = b.decode("utf-8", errors="ignore")
-
-        b = dc.read(5)
-        f_size, f_fmt = struct.unpack("<fB", b)
-        rdc.f_size = f_size
-        rdc.f_format = f_fmt
-
-        b = dc.read(2)
-        if b != b"\x03\x86":
-            logger.warning(f"magic number {b} not 0386")
-        rdc.magic = b
-
-        b = dc.read(4)
-        c_alpha, c_r, c_g, c_b = struct.unpack("<BBBB", b)
+        rdc = DC(*struct.unpack_from("<IIIIII", _buf, _take(24)))
+        rdc.f_name = _string()
+        rdc.f_size, rdc.f_format = struct.unpack_from("<fB", _buf, _take(5))
+
+        rdc.magic = bytes(_buf[_take(2):o])
+        if rdc.magic != b"\x03\x86":
+            logger.warning(f"magic number {rdc.magic} not 0386")
+
+        c_alpha, c_r, c_g, c_b = struct.unpack_from("<BBBB", _buf, _take(4))
         rdc.c_alpha = c_alpha # unused in TRCC
         rdc.c_color = (c_r, c_g, c_b)
 
-        b = dc.read(1)
-        if b[0] > 0:
-            b = dc.read(b[0])
-            rdc.w_text = b.decode("utf-8", errors="ignore")
+        rdc.w_text = _string()
+        ret.append(rdc)
 
-        print(rdc)
+    return ret
 
-    return 0
+
+def dc_load(_dc_file: pathlib.Path) -> List[DC]:
+    """
+    read the widgets of a .dc theme file, mapped instead of read in small pieces
+    :param _dc_file:
+    :return:
+    """
+    with open(_dc_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Unsupported file format: empty file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = memoryview(mm)
+            try:
+                if buf[0] != 0xdd:
+                    raise ValueError(f"Unsupported file format: {buf[0]:#04x}")
+                return dc_load_dd(buf, 1)
+            finally:
+                buf.release()
+
+
+def dc_widget(_dc: DC) -> Union[Dict, None]:
+    """
+    convert one DC widget to an lcdc theme widget
+    :param _dc:
+    :return: None if lcdc can not show it
+    """
+    w: Dict = {}
+    if _dc.w_type == 0:
+        key = DC_SENSORS.get((_dc.w_device, _dc.w_param))
+        if key is None:
+            logger.warning(f"DC sensor {_dc.w_device}/{_dc.w_param} has no lcdc sensor, skipped")
+            return None
+        w["widget"] = key
+        w["unit"] = _dc.w_mode == 1
+    elif _dc.w_type in (1, 2, 3):
+        clock = DC_CLOCKS.get((_dc.w_type, _dc.w_mode))
+        if clock is None:
+            logger.warning(f"DC clock mode {_dc.w_type}/{_dc.w_mode} unknown, skipped")
+            return None
+        w["clock"] = clock
+    elif _dc.w_type == 4:
+        w["text"] = _dc.w_text
+    else:
+        logger.warning(f"DC widget type {_dc.w_type} unknown, skipped")
+        return None
+
+    w["xy"] = [_dc.x_offset, _dc.y_offset]
+    # alpha is unused by TRCC
+    w["color"] = [*_dc.c_color, 255]
+    # points at 96 dpi
+    w["size"] = max(1.0, round(_dc.f_size * 96.0 / 72.0, 1))
+
+    slant = FC_SLANT_ITALIC if _dc.f_format & 2 else FC_SLANT_ROMAN
+    weight = FC_WEIGHT_BOLD if _dc.f_format & 1 else FC_WEIGHT_REGULAR
+    if _dc.f_format & 12:
+        logger.info(f"DC underline and strikeout of {_dc.f_name} ignored")
+    if _dc.f_name != "":
+        # kept as named by the theme, FontManager.match() picks an installed face when drawing
+        w["font"] = _dc.f_name
+    if slant != FC_SLANT_ROMAN:
+        w["slant"] = slant
+    if weight != FC_WEIGHT_REGULAR:
+        w["weight"] = weight
+
+    return w
+
+
+def dc_config(_dc_file: pathlib.Path) -> Dict:
+    """
+    lcdc theme config of a DC theme directory
+    :param _dc_file: .dc file, the background and mask are looked up next to it
+    :return: config whose mask is None if the theme has none
+    """
+    widgets = [w for w in (dc_widget(d) for d in dc_load(_dc_file)) if w is not None]
+
+    background = next((_dc_file.parent / b for b in DC_BACKGROUNDS if (_dc_file.parent / b).is_file()), None)
+    if background is None:
+        raise ValueError(f"No background {' or '.join(DC_BACKGROUNDS)} next to {_dc_file}")
+    mask = _dc_file.parent / DC_MASK
+
+    return {
+        "background": str(background.absolute()),
+        "mask": str(mask.absolute()) if mask.is_file() else None,
+        "widgets": widgets,
+    }
+
+
+def dc_import(_dc_file: pathlib.Path, _theme_dir: pathlib.Path) -> Dict:
+    """
+    write the config of a DC theme into an lcdc theme directory, with a clear mask if the theme has none
+    :param _dc_file:
+    :param _theme_dir: directory of Theme, created if missing
+    :return: config written
+    """
+    c = dc_config(_dc_file)
+    _theme_dir.mkdir(parents=True, exist_ok=True)
+    if c["mask"] is None:
+        mask = _theme_dir / "mask.png"
+        with Image.open(c["background"]) as bg:
+            Image.new("RGBA", bg.size, (0, 0, 0, 0)).save(mask, format="PNG")
+        c["mask"] = str(mask.absolute())
+
+    fp = _theme_dir / "config.json"
+    tmp = fp.parent / (fp.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(json.dumps(c, ensure_ascii=False, indent=4))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, fp)
+
+    return c
 
 
 def main(dc_file) -> int:
     logger.info(f"reading {dc_file}")
 
-    with open(dc_file, "rb") as dc:
-        buffer = dc.read(1)
-        if buffer == b'\xdd':
-            return dc_load_dd(dc)
-        else:
-            logger.fatal(f"Unsupported file format: {buffer}")
-            return 1
+    try:
+        widgets = dc_load(pathlib.Path(dc_file))
+    except (OSError, ValueError) as e:
+        logger.fatal(e)
+        return 1
+
+    for w in widgets:
+        print(w)
+    return 0
 
 
 if __name__ == "__main__":
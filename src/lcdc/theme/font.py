@@ -1,14 +1,51 @@
 
+import bisect
 import ctypes
 import ctypes.util
 import dataclasses
+import json
 import logging
+import os
+import pathlib
+import threading
+import unicodedata
 
 from typing import Dict, List, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
 
+# bump when FontInfo or the cache layout changes
+_CACHE_VERSION = 2
+
+# text runs memoized before the memo is dropped
+_RUNS_CACHE_SIZE = 4096
+
+# fontconfig defaults of a pattern without style
+FC_SLANT_ROMAN = 0
+FC_WEIGHT_REGULAR = 80
+FC_WIDTH_NORMAL = 100
+# styles DC themes may ask for
+FC_SLANT_ITALIC = 100
+FC_WEIGHT_BOLD = 200
+
+# used when no font of the asked family is installed, like the sans-serif alias of fontconfig
+FALLBACK_FAMILIES = ("DejaVu Sans", "Noto Sans", "Liberation Sans", "FreeSans")
+
+
+def fontconfig_cache_state() -> Dict[str, int]:
+    """
+    mtime of fontconfig cache directories, fc-cache updates them whenever installed fonts change
+    :return: {directory: mtime in ns}
+    """
+    dirs = [
+        pathlib.Path("/var/cache/fontconfig"),
+        pathlib.Path("/usr/lib/fontconfig/cache"),
+        pathlib.Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser() / "fontconfig",
+    ]
+    return {str(d): d.stat().st_mtime_ns for d in dirs if d.is_dir()}
+
+
 @dataclasses.dataclass
 class _FontRaw:
     family: List[str]
@@ -35,6 +72,7 @@ class _FontRaw:
     symbol: List[bool]
     variable: List[bool]
     fonthashint: List[bool]
+    coverage: List[int]
 
 
 @dataclasses.dataclass
@@ -62,11 +100,30 @@ class FontInfo:
     variable: bool
     fonthashint: bool
     file: str
+    # face index in a collection file
+    index: int = 0
+    # codepoint ranges of the charset as sorted [start, end) bounds: start0, end0, start1, end1, ...
+    coverage: List[int] = dataclasses.field(default_factory=list, repr=False)
+
+    def covers(self, _cp: int) -> bool:
+        """
+        :param _cp: codepoint
+        :return: the font has a glyph of _cp, True if the charset is unknown
+        """
+        return len(self.coverage) == 0 or bisect.bisect_right(self.coverage, _cp) & 1 == 1
 
 
 class FontManager:
-    def __init__(self):
+    def __init__(self, _cache_dir: Union[pathlib.Path, None] = None):
+        """
+        :param _cache_dir: directory of the font index cache, None to always scan fontconfig
+        """
         self.fontconfig = ctypes.util.find_library("fontconfig")
+        self._cache_file = None if _cache_dir is None else _cache_dir / "fonts.json"
+        # set once an index, cached or scanned, is available
+        self.ready = threading.Event()
+        # fontconfig is initialized and finalized by each scan, never run two at once
+        self._scan_lock = threading.Lock()
         self.font_raw: List[_FontRaw] = []
         # { family: { style: List[FontInfo] } }
         self.fonts: Dict[str, Dict[Tuple[int, int, int, int], List[FontInfo]]] = {}
@@ -77,7 +134,91 @@ class FontManager:
         self.fullnames: List[str] = []
         self.fullname_styles: Dict[str, List[Tuple[int, int, int, int]]] = {}
 
-    def init(self):
+        # {lower case family alias: families}
+        self._family_alias: Dict[str, List[str]] = {}
+        # every suffix of lower case family and full names, sorted, with the name it came from
+        self._suffixes: List[str] = []
+        self._suffix_names: List[Tuple[str, bool]] = []
+        # {(family, slant, weight, width, spacing): FontInfo}, dropped with the index it was computed on
+        self._match_cache: Dict[Tuple[str, int, int, int, int], Union[FontInfo, None]] = {}
+        # {(slant, weight): faces with a known charset in fallback order}
+        self._fallback_order: Dict[Tuple[int, int], List[FontInfo]] = {}
+        # {(codepoint, slant, weight): face covering the codepoint}
+        self._fallback_cache: Dict[Tuple[int, int, int], Union[FontInfo, None]] = {}
+        # {(text, file, index): runs}
+        self._runs_cache: Dict[Tuple[str, str, int], List[Tuple[str, FontInfo]]] = {}
+
+    def init(self, _background: bool = False) -> None:
+        """
+        load the font index from the cache, scan fontconfig when the cache is missing or stale
+        :param _background: scan in a thread, a stale cached index is served meanwhile
+        :return:
+        """
+        if self.fontconfig is None:
+            raise AssertionError("Font subsystem not init for fontconfig.so not found")
+
+        state = fontconfig_cache_state()
+        cached = self._load_cache()
+        if cached is not None:
+            self._index(cached[1])
+            if cached[0] == state:
+                logger.info(f"Font index loaded from {self._cache_file}")
+                return
+            logger.info("Font cache is stale, rebuilding the font index")
+
+        if _background:
+            threading.Thread(target=self._rebuild, args=(state, ), daemon=True).start()
+        else:
+            self._rebuild(state)
+
+    def _rebuild(self, _state: Dict[str, int]) -> None:
+        with self._scan_lock:
+            try:
+                infos = self._scan()
+            except Exception as e:
+                logger.error(f"Font index rebuild failed: {e}")
+                return
+            self._index(infos)
+            self._save_cache(_state, infos)
+        logger.info(f"Font index rebuilt with {len(infos)} fonts")
+
+    def _load_cache(self) -> Union[Tuple[Dict[str, int], List[FontInfo]], None]:
+        """
+        :return: fontconfig cache state the index was built with, fonts; None if no usable cache
+        """
+        if self._cache_file is None or not self._cache_file.is_file():
+            return None
+        try:
+            with open(self._cache_file, "r") as f:
+                c = json.load(f)
+            if c["version"] != _CACHE_VERSION or c["fontconfig"] != self.fontconfig:
+                return None
+            return c["state"], [FontInfo(**fi) for fi in c["fonts"]]
+        except Exception as e:
+            logger.warning(f"Font cache {self._cache_file} unreadable: {e}")
+            return None
+
+    def _save_cache(self, _state: Dict[str, int], _infos: List[FontInfo]) -> None:
+        if self._cache_file is None:
+            return
+        tmp = self._cache_file.parent / (self._cache_file.name + ".tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump({
+                    "version": _CACHE_VERSION,
+                    "fontconfig": self.fontconfig,
+                    "state": _state,
+                    "fonts": [dataclasses.asdict(fi) for fi in _infos],
+                }, f, ensure_ascii=False)
+            os.replace(tmp, self._cache_file)
+        except OSError as e:
+            logger.warning(f"Font cache {self._cache_file} not saved: {e}")
+
+    def _scan(self) -> List[FontInfo]:
+        """
+        list all fonts through fontconfig
+        :return:
+        """
         if self.fontconfig is None:
             raise AssertionError("Font subsystem not init for fontconfig.so not found")
 
@@ -139,6 +280,11 @@ class FontManager:
         _FcEmbolden = b"embolden"  # Bool    Rasterizer should synthetically embolden the font
         _FcDecorative = b"decorative"  # Bool    Whether the style is a decorative variant
         _FcFonthashint = b"fonthashint"  # Bool    Whether font has hinting
+        _FcCharset = b"charset"  # CharSet Unicode chars encoded by the font
+
+        _FcCharSetP = ctypes.c_void_p
+        _FC_CHARSET_MAP_SIZE = 8
+        _FC_CHARSET_DONE = 0xFFFFFFFF
 
         # functions
         fc.FcInit.restype = _FcBool
@@ -157,6 +303,12 @@ class FontManager:
         fc.FcPatternGetInteger.argtypes = [_FcPatternP, ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
         fc.FcPatternGetString.restype = _FcResult
         fc.FcPatternGetString.argtypes = [_FcPatternP, ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(ctypes.c_char_p)]
+        fc.FcPatternGetCharSet.restype = _FcResult
+        fc.FcPatternGetCharSet.argtypes = [_FcPatternP, ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(_FcCharSetP)]
+        fc.FcCharSetFirstPage.restype = _FcChar32
+        fc.FcCharSetFirstPage.argtypes = [_FcCharSetP, ctypes.POINTER(_FcChar32), ctypes.POINTER(_FcChar32)]
+        fc.FcCharSetNextPage.restype = _FcChar32
+        fc.FcCharSetNextPage.argtypes = [_FcCharSetP, ctypes.POINTER(_FcChar32), ctypes.POINTER(_FcChar32)]
         fc.FcObjectSetBuild.restype = _FcObjectSetP
         fc.FcObjectSetDestroy.argtypes = [_FcObjectSetP]
 
@@ -166,7 +318,7 @@ class FontManager:
         # build an object set from a null-terminated list of property names
         objset = fc.FcObjectSetBuild(_FcNamelang, _FcFamily, _FcFamilyLang, _FcStyle, _FcStyleLang, _FcSlant, _FcFontformat,
                                      _FcWeight, _FcWidth, _FcSpacing, _FcSize, _FcAspect, _FcPixelSize, _FcSymbol, _FcHinting, _FcFonthashint, _FcHintstyle,
-                                     _FcFullname, _FcFullnameLang, _FcPostscriptname, _FcEmbolden, _FcDecorative, _FcVariable, _FcFile, _FcIndex, None)
+                                     _FcFullname, _FcFullnameLang, _FcPostscriptname, _FcEmbolden, _FcDecorative, _FcVariable, _FcFile, _FcIndex, _FcCharset, None)
         # build patterns with no properties
         pat = fc.FcPatternCreate()
         # list fonts
@@ -259,6 +411,36 @@ class FontManager:
 
             return out_list
 
+        def _fc_pattern_get_coverage(_pattern: _FcPatternP) -> List[int]:
+            """
+            walk the charset pages, each a 256 bit map of codepoints from its base
+            :return: [start, end) bounds of covered ranges, empty if the font has no charset
+            """
+            cs = _FcCharSetP()
+            if fc.FcPatternGetCharSet(_pattern, _FcCharset, 0, ctypes.byref(cs)) != _FcResultMatch:
+                return []
+
+            bounds: List[int] = []
+            page = (_FcChar32 * _FC_CHARSET_MAP_SIZE)()
+            nxt = _FcChar32()
+            base = fc.FcCharSetFirstPage(cs, page, ctypes.byref(nxt))
+            while base != _FC_CHARSET_DONE:
+                bits = 0
+                for w in reversed(page):
+                    bits = (bits << 32) | w
+                while bits:
+                    # lowest run of set bits
+                    lo = (bits & -bits).bit_length() - 1
+                    run = ((bits >> lo) ^ ((bits >> lo) + 1)).bit_length() - 1
+                    bits &= ~(((1 << run) - 1) << lo)
+                    if len(bounds) > 0 and bounds[-1] == base + lo:
+                        bounds[-1] = base + lo + run
+                    else:
+                        bounds += [base + lo, base + lo + run]
+                base = fc.FcCharSetNextPage(cs, page, ctypes.byref(nxt))
+
+            return bounds
+
         self.font_raw: List[_FontRaw] = []
         for i in range(fontsets.nfont):
             p = fontsets.fonts[i]
@@ -287,6 +469,7 @@ class FontManager:
                 fonthashint=_fc_pattern_get_bool(p, _FcFonthashint),
                 file=_fc_pattern_list_strings(p, _FcFile),
                 index=_fc_pattern_get_int(p, _FcIndex),
+                coverage=_fc_pattern_get_coverage(p),
             )
             if r.weight is None or r.slant is None or r.width is None:
                 continue
@@ -316,18 +499,16 @@ class FontManager:
                 r.embolden = [-1]
             if r.hintstyle is None:
                 r.hintstyle = [-1]
+            if r.index is None:
+                r.index = [0]
             self.font_raw.append(r)
 
         # destroy
         fc.FcPatternDestroy(pat)
         fc.FcFontSetDestroy(cfontsets)
-        # parse font raw families
+        infos: List[FontInfo] = []
         for fr in self.font_raw:
-            fm = fr.family[0]
-            fn = fr.fullname[0]
-            fs = (fr.slant[0], fr.weight[0], fr.width[0], fr.spacing[0])
-            logger.warning(f"{fr}")
-            fi = FontInfo(
+            infos.append(FontInfo(
                 family=fr.family,
                 familylang=fr.familylang,
                 style=fr.style,
@@ -351,15 +532,41 @@ class FontManager:
                 variable=fr.variable[0],
                 fonthashint=fr.fonthashint[0],
                 file=fr.file[0],
-            )
+                index=fr.index[0],
+                coverage=fr.coverage,
+            ))
 
-            if fm not in self.fonts.keys():
-                self.fonts[fm] = {}
-                self.family_styles[fm] = []
-                self.families.append(fm)
-            if fs not in self.fonts[fm].keys():
-                self.fonts[fm][fs] = []
-                self.family_styles[fm].append(fs)
+        fc.FcObjectSetDestroy(objset)
+        # finalize fontconfig library
+        fc.FcFini()
+
+        return infos
+
+    def _index(self, _infos: List[FontInfo]) -> None:
+        """
+        build family and fullname indexes, then swap them in
+        :param _infos:
+        :return:
+        """
+        fonts: Dict[str, Dict[Tuple[int, int, int, int], List[FontInfo]]] = {}
+        families: List[str] = []
+        family_styles: Dict[str, List[Tuple[int, int, int, int]]] = {}
+        name_fonts: Dict[str, Dict[Tuple[int, int, int, int], List[FontInfo]]] = {}
+        fullnames: List[str] = []
+        fullname_styles: Dict[str, List[Tuple[int, int, int, int]]] = {}
+
+        for fi in _infos:
+            fm = fi.family[0]
+            fn = fi.fullname[0]
+            fs = (fi.slant, fi.weight, fi.width, fi.spacing)
+
+            if fm not in fonts.keys():
+                fonts[fm] = {}
+                family_styles[fm] = []
+                families.append(fm)
+            if fs not in fonts[fm].keys():
+                fonts[fm][fs] = []
+                family_styles[fm].append(fs)
             # check postscriptname
             # is not correct
             #pnf = False
@@ -371,22 +578,178 @@ class FontManager:
             #            if p in fp.postscriptname:
             #                pnf = True
             #if not pnf:
-            self.fonts[fm][fs].append(fi)
-
-            if fn not in self.name_fonts.keys():
-                self.name_fonts[fn] = {}
-                self.fullname_styles[fn] = []
-                self.fullnames.append(fn)
-            if fs not in self.name_fonts[fn].keys():
-                self.name_fonts[fn][fs] = []
-                self.fullname_styles[fn].append(fs)
-            self.name_fonts[fn][fs].append(fi)
-
-        self.fullnames.sort()
+            fonts[fm][fs].append(fi)
+
+            if fn not in name_fonts.keys():
+                name_fonts[fn] = {}
+                fullname_styles[fn] = []
+                fullnames.append(fn)
+            if fs not in name_fonts[fn].keys():
+                name_fonts[fn][fs] = []
+                fullname_styles[fn].append(fs)
+            name_fonts[fn][fs].append(fi)
+
+        fullnames.sort()
+
+        family_alias: Dict[str, List[str]] = {}
+        for fm in families:
+            for fi in (fi for fl in fonts[fm].values() for fi in fl):
+                for a in fi.family:
+                    al = family_alias.setdefault(a.lower(), [])
+                    if fm not in al:
+                        al.append(fm)
+
+        # (name, is fullname)
+        suffixes: List[Tuple[str, Tuple[str, bool]]] = []
+        for n, is_fullname in [(fm, False) for fm in families] + [(fn, True) for fn in fullnames]:
+            nl = n.lower()
+            suffixes += [(nl[i:], (n, is_fullname)) for i in range(len(nl))]
+        suffixes.sort()
+
+        self.fonts = fonts
+        self.families = families
+        self.family_styles = family_styles
+        self.name_fonts = name_fonts
+        self.fullnames = fullnames
+        self.fullname_styles = fullname_styles
+        self._family_alias = family_alias
+        self._suffixes = [sf for sf, _ in suffixes]
+        self._suffix_names = [n for _, n in suffixes]
+        self._match_cache = {}
+        self._fallback_order = {}
+        self._fallback_cache = {}
+        self._runs_cache = {}
+        self.ready.set()
+
+    def match(self, _family: str, _slant: int = FC_SLANT_ROMAN, _weight: int = FC_WEIGHT_REGULAR,
+              _width: int = FC_WIDTH_NORMAL, _spacing: int = -1) -> Union[FontInfo, None]:
+        """
+        best installed font like FcFontMatch: the faces of family _family, else a face whose full name is
+        _family, else a fallback family; then the closest spacing, slant, weight and width
+        :param _family: family or full name, case insensitive
+        :param _slant: FC_SLANT_*
+        :param _weight: FC_WEIGHT_*
+        :param _width: FC_WIDTH_*
+        :param _spacing: FC_MONO and others, -1 for any
+        :return: None if no font is installed
+        """
+        key = (_family.lower(), _slant, _weight, _width, _spacing)
+        cache = self._match_cache
+        if key in cache:
+            return cache[key]
+
+        candidates: List[FontInfo] = []
+        for fm in self._family_alias.get(key[0], []):
+            candidates += [fi for fl in self.fonts[fm].values() for fi in fl]
+        if len(candidates) == 0:
+            for fn in self.fullnames:
+                if fn.lower() == key[0]:
+                    candidates = [fi for fl in self.name_fonts[fn].values() for fi in fl]
+                    break
+        if len(candidates) == 0:
+            for fm in FALLBACK_FAMILIES:
+                if fm in self.fonts:
+                    candidates = [fi for fl in self.fonts[fm].values() for fi in fl]
+                    break
+        if len(candidates) == 0:
+            candidates = [fi for fm in self.families for fl in self.fonts[fm].values() for fi in fl]
+
+        ret = min(candidates, default=None, key=lambda _fi: (
+            _spacing >= 0 and _fi.spacing != _spacing,
+            abs(_fi.slant - _slant),
+            abs(_fi.weight - _weight),
+            abs(_fi.width - _width),
+        ))
+        cache[key] = ret
+        return ret
+
+    def search(self, _query: str, _prefix: bool = False) -> List[Tuple[str, bool]]:
+        """
+        family and full names containing _query, from the sorted suffix index
+        :param _query: case insensitive
+        :param _prefix: only names starting with _query
+        :return: (name, is full name) sorted by name
+        """
+        q = _query.lower()
+        if q == "":
+            return sorted([(fm, False) for fm in self.families] + [(fn, True) for fn in self.fullnames],
+                          key=lambda _n: (_n[0].lower(), _n[1]))
+
+        suffixes, names = self._suffixes, self._suffix_names
+        found = set()
+        i = bisect.bisect_left(suffixes, q)
+        while i < len(suffixes) and suffixes[i].startswith(q):
+            n = names[i]
+            if not _prefix or len(suffixes[i]) == len(n[0]):
+                found.add(n)
+            i += 1
+        return sorted(found, key=lambda _n: (_n[0].lower(), _n[1]))
+
+    def fallback(self, _cp: int, _slant: int = FC_SLANT_ROMAN, _weight: int = FC_WEIGHT_REGULAR) -> Union[FontInfo, None]:
+        """
+        face to draw a codepoint the asked font lacks: fallback families first, then the face of the closest
+        style with the largest charset
+        :param _cp: codepoint
+        :param _slant: style of the text
+        :param _weight:
+        :return: None if no installed face covers _cp
+        """
+        key = (_cp, _slant, _weight)
+        cache = self._fallback_cache
+        if key in cache:
+            return cache[key]
+
+        order = self._fallback_order.get((_slant, _weight))
+        if order is None:
+            rank = {fm: i for i, fm in enumerate(FALLBACK_FAMILIES)}
+            order = sorted((fi for fm in self.families for fl in self.fonts[fm].values() for fi in fl
+                            if len(fi.coverage) > 0),
+                           key=lambda _fi: (rank.get(_fi.family[0], len(rank)), abs(_fi.slant - _slant),
+                                            abs(_fi.weight - _weight), -len(_fi.coverage)))
+            self._fallback_order[(_slant, _weight)] = order
+
+        ret = next((fi for fi in order if fi.covers(_cp)), None)
+        cache[key] = ret
+        return ret
+
+    def runs(self, _text: str, _font: FontInfo) -> List[Tuple[str, FontInfo]]:
+        """
+        split text into runs of one face each, memoized
+        characters _font lacks go to a fallback face, combining marks stay with the character before them
+        :param _text:
+        :param _font: face asked for
+        :return: (text, face) in text order
+        """
+        key = (_text, _font.file, _font.index)
+        cache = self._runs_cache
+        ret = cache.get(key)
+        if ret is not None:
+            return ret
+
+        ret = []
+        run_text = ""
+        run_font = _font
+        for ch in _text:
+            cp = ord(ch)
+            if _font.covers(cp):
+                fi = _font
+            elif len(run_text) > 0 and unicodedata.category(ch).startswith("M"):
+                fi = run_font
+            else:
+                fi = self.fallback(cp, _font.slant, _font.weight) or _font
+            if fi is not run_font and len(run_text) > 0:
+                ret.append((run_text, run_font))
+                run_text = ""
+            run_font = fi
+            run_text += ch
+        if len(run_text) > 0:
+            ret.append((run_text, run_font))
+
+        if len(cache) >= _RUNS_CACHE_SIZE:
+            cache.clear()
+        cache[key] = ret
+        return ret
 
-        fc.FcObjectSetDestroy(objset)
-        # finalize fontconfig library
-        fc.FcFini()
 
 if __name__ == "__main__":
     font = FontManager()
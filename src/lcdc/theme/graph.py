@@ -0,0 +1,96 @@
+import logging
+import numpy
+
+from PIL import Image
+from typing import Tuple, Union
+
+from ..server.history import History
+
+
+logger = logging.getLogger(__name__)
+
+
+GRAPH_KINDS = ("bar", "line", "sparkline")
+
+
+class Graph:
+    """
+    sensor history graph kept as an RGBA array
+
+    bar and line graphs use a fixed value range and scroll: the previous bitmap is shifted left and only
+    the columns of new samples are drawn. sparkline graphs scale to the samples shown and redraw on new samples.
+    """
+    def __init__(self, _kind: str, _key: str, _size: Tuple[int, int], _color: Tuple[int, int, int, int],
+                 _background: Tuple[int, int, int, int] = (0, 0, 0, 0),
+                 _range: Tuple[float, float] = (0.0, 100.0), _step: int = 1):
+        if _kind not in GRAPH_KINDS:
+            raise ValueError(f"Unknown graph kind {_kind}")
+
+        self.kind = _kind
+        self.key = _key
+        self._w, self._h = _size
+        self._color = numpy.array(_color, dtype=numpy.uint8)
+        self._background = numpy.array(_background, dtype=numpy.uint8)
+        self._range = _range
+        # at least one sample fits in the width
+        self._step = min(max(1, _step), self._w)
+
+        self._buf = numpy.empty((self._h, self._w, 4), dtype=numpy.uint8)
+        self._buf[:] = self._background
+        self._rows = numpy.arange(self._h)[:, None]
+
+        self._last_t = float("-inf")
+        # row of the newest drawn sample, to join line segments
+        self._last_y: Union[int, None] = None
+        self._img = Image.fromarray(self._buf, "RGBA")
+
+    def _y(self, _v: numpy.ndarray, _lo: float, _hi: float) -> numpy.ndarray:
+        span = _hi - _lo if _hi > _lo else 1.0
+        frac = numpy.clip((_v - _lo) / span, 0.0, 1.0)
+        return (self._h - 1) - numpy.rint(frac * (self._h - 1)).astype(numpy.int64)
+
+    def _draw_columns(self, _x: int, _ys: numpy.ndarray) -> None:
+        """
+        draw samples into the columns from _x to the right edge
+        """
+        ys = numpy.repeat(_ys, self._step)
+        if self.kind == "bar":
+            mask = self._rows >= ys[None, :]
+        else:
+            prev = numpy.empty_like(ys)
+            prev[0] = ys[0] if self._last_y is None else self._last_y
+            prev[1:] = ys[:-1]
+            mask = (self._rows >= numpy.minimum(prev, ys)[None, :]) & (self._rows <= numpy.maximum(prev, ys)[None, :])
+
+        self._buf[:, _x:][mask] = self._color
+        self._last_y = int(ys[-1])
+
+    @property
+    def last_sample(self) -> float:
+        """
+        time of the newest drawn sample
+        """
+        return self._last_t
+
+    def render(self, _history: History) -> Image.Image:
+        t, v = _history.since(self.key, self._last_t)
+        if len(t) == 0:
+            return self._img
+        self._last_t = float(t[-1])
+
+        columns = max(1, self._w // self._step)
+        if self.kind == "sparkline":
+            v = _history.last(self.key, columns)
+            self._buf[:] = self._background
+            self._last_y = None
+            self._draw_columns(self._w - len(v) * self._step, self._y(v, float(v.min()), float(v.max())))
+        else:
+            v = v[-columns:]
+            n = len(v) * self._step
+            # scroll, numpy copes with the overlapping slices
+            self._buf[:, :self._w - n] = self._buf[:, n:]
+            self._buf[:, self._w - n:] = self._background
+            self._draw_columns(self._w - n, self._y(v, self._range[0], self._range[1]))
+
+        self._img = Image.fromarray(self._buf, "RGBA")
+        return self._img
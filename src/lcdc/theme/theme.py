@@ -1,21 +1,135 @@
 
+import copy
 import json
 import logging
+import os
 import pathlib
 import random
 import string
+import threading
+import time
 
 from PIL import Image, ImageDraw, ImageFont
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Set, Tuple, Union
 
-from ..server.sensors import Sensors
+from .font import FALLBACK_FAMILIES, FC_SLANT_ROMAN, FC_WEIGHT_REGULAR, FontInfo, FontManager
+from .graph import GRAPH_KINDS, Graph
+from ..server.filters import SMOOTH_KINDS, WidgetFilter
+from ..server.sensors import Sensors, SensorSnapshot
 
 
 logger = logging.getLogger(__name__)
 
 
+def _check_ints(_v: Any, _lengths: Tuple[int, ...], _lo: int, _hi: int) -> None:
+    if (not isinstance(_v, (list, tuple)) or len(_v) not in _lengths or
+            not all(isinstance(i, int) and not isinstance(i, bool) and _lo <= i <= _hi for i in _v)):
+        raise ValueError(f"must be {' or '.join(map(str, _lengths))} integers in [{_lo}, {_hi}]")
+
+
+def _check_number(_v: Any, _lo: float) -> None:
+    if not isinstance(_v, (int, float)) or isinstance(_v, bool) or _v < _lo:
+        raise ValueError(f"must be a number not less than {_lo}")
+
+
+def _check_type(_v: Any, _type: type) -> None:
+    if not isinstance(_v, _type):
+        raise ValueError(f"must be {_type.__name__}")
+
+
+def _check_choice(_v: Any, _choices: Tuple[str, ...]) -> None:
+    if _v not in _choices:
+        raise ValueError(f"must be one of {', '.join(_choices)}")
+
+
+def _check_range(_v: Any) -> None:
+    if (not isinstance(_v, (list, tuple)) or len(_v) != 2 or
+            not all(isinstance(i, (int, float)) and not isinstance(i, bool) for i in _v)):
+        raise ValueError("must be 2 numbers")
+
+
+_WEEKDAYS_ZH = ("星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日")
+
+# clock widget: formatter of the local time
+CLOCK_FORMATS: Dict[str, Callable[[time.struct_time], str]] = {
+    "time12": lambda _t: time.strftime("%I:%M %p", _t),
+    "time24": lambda _t: time.strftime("%H:%M", _t),
+    "weekday": lambda _t: time.strftime("%a", _t),
+    "weekday_zh": lambda _t: _WEEKDAYS_ZH[_t.tm_wday],
+    "ymd": lambda _t: time.strftime("%Y/%m/%d", _t),
+    "dmy": lambda _t: time.strftime("%d/%m/%Y", _t),
+    "md": lambda _t: time.strftime("%m/%d", _t),
+    "dm": lambda _t: time.strftime("%d/%m", _t),
+}
+
+
+# widget option: value checker raising ValueError
+_WIDGET_OPTIONS: Dict[str, Callable[[Any], None]] = {
+    "text": lambda _v: _check_type(_v, str),
+    "widget": lambda _v: _check_type(_v, str),
+    "clock": lambda _v: _check_choice(_v, tuple(CLOCK_FORMATS.keys())),
+    "xy": lambda _v: _check_ints(_v, (2, ), -65536, 65535),
+    "color": lambda _v: _check_ints(_v, (3, 4), 0, 255),
+    "size": lambda _v: _check_number(_v, 1),
+    "unit": lambda _v: _check_type(_v, bool),
+    "cels": lambda _v: _check_type(_v, bool),
+    "smooth": lambda _v: _check_choice(_v, SMOOTH_KINDS),
+    "tau": lambda _v: _check_number(_v, 0.0),
+    "window": lambda _v: _check_number(_v, 0.0),
+    "threshold": lambda _v: _check_number(_v, 0.0),
+    "graph": lambda _v: _check_choice(_v, GRAPH_KINDS),
+    "wh": lambda _v: _check_ints(_v, (2, ), 1, 4096),
+    "background": lambda _v: _check_ints(_v, (3, 4), 0, 255),
+    "range": _check_range,
+    "step": lambda _v: _check_ints([_v], (1, ), 1, 4096),
+    "font": lambda _v: _check_type(_v, str),
+    "weight": lambda _v: _check_ints([_v], (1, ), 0, 215),
+    "slant": lambda _v: _check_ints([_v], (1, ), 0, 110),
+}
+
+# {(file, index, size): font} shared by all themes
+_truetype_cache: Dict[Tuple[str, int, float], ImageFont.FreeTypeFont] = {}
+
+
+def _truetype(_fi: FontInfo, _size: float) -> ImageFont.FreeTypeFont:
+    key = (_fi.file, _fi.index, _size)
+    font = _truetype_cache.get(key)
+    if font is None:
+        font = ImageFont.truetype(_fi.file, _size, index=_fi.index)
+        _truetype_cache[key] = font
+    return font
+
+
+def validate_widget(_w: Any) -> Dict:
+    """
+    check a widget from the api before it is applied
+    :param _w: widget dict
+    :return: _w
+    """
+    if not isinstance(_w, dict):
+        raise ValueError("widget must be an object")
+    if len([k for k in ("text", "widget", "clock") if k in _w]) != 1:
+        raise ValueError("widget must have exactly one of text, widget and clock")
+    if "graph" in _w and "widget" not in _w:
+        raise ValueError("graph needs a sensor key in widget")
+    for k, v in _w.items():
+        check = _WIDGET_OPTIONS.get(k)
+        if check is None:
+            raise ValueError(f"Unknown widget option {k}")
+        try:
+            check(v)
+        except ValueError as e:
+            raise ValueError(f"{k} {e}")
+    if "graph" in _w and "color" in _w and len(_w["color"]) != 4:
+        raise ValueError("color of graph must be RGBA")
+    if "graph" in _w and _w.get("step", 1) > _w.get("wh", (200, 50))[0]:
+        raise ValueError("step of graph must not exceed its width")
+    return _w
+
+
 class Theme:
-    def __init__(self, _config_path: pathlib.Path, _default_width: int, _default_height: int):
+    def __init__(self, _config_path: pathlib.Path, _default_width: int, _default_height: int,
+                 _fonts: Union[FontManager, None] = None):
         # use json for not recommended to edit manually
         self._config_file = "config.json"
         self._config_path: pathlib.Path = _config_path
@@ -28,6 +142,20 @@ class Theme:
         self.background = self._config_path / "demo.jpg"
         self.mask = self._config_path / "mask.png"
         self.mask_img = None
+        # compiled widgets drawing on (image, draw, snapshot), rebuilt when widgets change
+        self._plan: Union[List[Callable[[Image.Image, ImageDraw.ImageDraw, SensorSnapshot], Any]], None] = None
+        self._plan_sensor: Union[Sensors, None] = None
+        # text is split into runs of installed fonts once the font index is ready, the default font before
+        self._fonts = _fonts
+        self._plan_fonts = False
+        # {widget json: (draw callable, filter)} of the current plan, reused when other widgets change
+        self._compiled: Dict[str, Tuple[Callable, Union[WidgetFilter, None]]] = {}
+        # serializes api writes, blend only reads the swapped plan
+        self._write_lock = threading.Lock()
+        self._filters: List[Tuple[str, WidgetFilter]] = []
+        self._drawn: List[Any] = []
+        self._frames = 0
+        self._frames_distinct = 0
         self.widgets: List[Dict] = [
             {
                 "text": "CPU",
@@ -54,7 +182,12 @@ class Theme:
                 c = json.load(f)
                 self.background = pathlib.Path(c["background"])
                 self.mask = pathlib.Path(c["mask"])
-                self.widgets = c["widgets"]
+                self.widgets = []
+                for i, w in enumerate(c["widgets"]):
+                    try:
+                        self.widgets.append(validate_widget(w))
+                    except ValueError as e:
+                        logger.error(f"Theme config {fp} widget {i} dropped: {e}")
         except FileNotFoundError:
             logger.warning(f"Theme config {fp} not found")
             self._init_theme()
@@ -75,6 +208,8 @@ class Theme:
             self._init_theme()
 
         self.mask_img = Image.open(self.mask).convert("RGBA")
+        self._plan = None
+        self._compiled = {}
 
     def _init_theme(self):
         self._init_ebu_background(self._default_width, self._default_height)
@@ -121,6 +256,177 @@ class Theme:
 
         img.save(self.mask, format="PNG")
 
+    def compile(self, _sensor: Sensors) -> None:
+        """
+        bind widgets to their formatters, filters, fonts and graphs, so blend is only a list of calls
+        :param _sensor:
+        :return:
+        """
+
+        # each widget returns what it drew, to count frames that really changed
+        def _text_widget(_fmt, _xy, _color, _font):
+            def _draw_text(_img, _draw, _snapshot):
+                text = str(_fmt(_snapshot))
+                _draw.text(_xy, text, _color, _font)
+                return text
+            return _draw_text
+
+        def _runs_widget(_fmt, _xy, _color, _fi, _size):
+            # runs share the baseline of the asked font, which is drawn from the top like the default font
+            font = _truetype(_fi, _size)
+            baseline = _xy[1] + font.getmetrics()[0]
+
+            def _draw_runs(_img, _draw, _snapshot):
+                text = str(_fmt(_snapshot))
+                if "\n" in text:
+                    _draw.text(_xy, text, _color, font)
+                    return text
+                x = _xy[0]
+                for run, fi in fonts.runs(text, _fi):
+                    f = font if fi is _fi else _truetype(fi, _size)
+                    _draw.text((x, baseline), run, _color, f, anchor="ls")
+                    x += f.getlength(run)
+                return text
+            return _draw_runs
+
+        def _graph_widget(_graph, _xy):
+            def _draw_graph(_img, _draw, _snapshot):
+                _img.alpha_composite(_graph.render(_sensor.history), _xy)
+                return _graph.last_sample
+            return _draw_graph
+
+        fonts = self._fonts if self._fonts is not None and self._fonts.ready.is_set() else None
+        if self._plan_sensor is not _sensor or self._plan_fonts != (fonts is not None):
+            self._compiled = {}
+
+        plan = []
+        filters = []
+        compiled = {}
+        for w in self.widgets:
+            # unchanged widgets keep their font, graph bitmap and filter state
+            j = json.dumps(w, sort_keys=True)
+            while j in compiled:
+                j += "#"
+            c = self._compiled.get(j)
+            if c is not None:
+                plan.append(c[0])
+                if c[1] is not None:
+                    filters.append((w["widget"], c[1]))
+                compiled[j] = c
+                continue
+
+            xy = tuple(w.get("xy", (50, 50)))
+            color = tuple(w.get("color", (0, 0, 0, 255)))
+
+            if "graph" in w.keys():
+                try:
+                    g = Graph(w["graph"], w["widget"], tuple(w.get("wh", (200, 50))), color,
+                              tuple(w.get("background", (0, 0, 0, 0))), tuple(w.get("range", (0.0, 100.0))), w.get("step", 1))
+                except Exception as e:
+                    logger.error(f"Graph widget {w} skipped: {e}")
+                    continue
+                plan.append(_graph_widget(g, xy))
+                compiled[j] = (plan[-1], None)
+                continue
+
+            flt = None
+            if "text" in w.keys():
+                fmt = lambda _, _text=w["text"]: _text
+            elif "clock" in w.keys():
+                fmt = lambda _, _clock=CLOCK_FORMATS[w["clock"]]: _clock(time.localtime())
+            else:
+                try:
+                    flt = _sensor.widget_filter(w["widget"], w.get("smooth"), w.get("tau", 1.0), w.get("window", 2.0),
+                                                w.get("threshold", 0.0))
+                except Exception as e:
+                    logger.error(f"Widget {w} filter ignored: {e}")
+                    flt = None
+                if flt is not None:
+                    filters.append((w["widget"], flt))
+                fmt = _sensor.formatter(w["widget"], w.get("unit", True), w.get("cels", True), flt)
+            fi = None
+            if fonts is not None:
+                fi = fonts.match(w.get("font", FALLBACK_FAMILIES[0]), w.get("slant", FC_SLANT_ROMAN),
+                                 w.get("weight", FC_WEIGHT_REGULAR))
+            if fi is not None:
+                try:
+                    plan.append(_runs_widget(fmt, xy, color, fi, w.get("size", 10)))
+                except OSError as e:
+                    logger.error(f"Font {fi.file} of widget {w} unusable: {e}")
+                    fi = None
+            if fi is None:
+                plan.append(_text_widget(fmt, xy, color, ImageFont.load_default(w.get("size", 10))))
+            compiled[j] = (plan[-1], flt)
+
+        self._compiled = compiled
+        self._plan = plan
+        self._plan_sensor = _sensor
+        self._plan_fonts = fonts is not None
+        self._filters = filters
+
+    def set_widgets(self, _widgets: List[Dict], _sensor: Sensors) -> None:
+        """
+        validate and apply a new widget list, then persist it
+        :param _widgets: widgets replacing all current ones
+        :param _sensor:
+        :return:
+        """
+        if not isinstance(_widgets, list):
+            raise ValueError("widgets must be a list")
+        for w in _widgets:
+            validate_widget(w)
+
+        with self._write_lock:
+            self.widgets = _widgets
+            self.compile(_sensor)
+            self.save_config()
+
+    def patch_widgets(self, _patches: Dict[str, Dict], _sensor: Sensors) -> None:
+        """
+        validate and apply changes of some widgets, then persist them
+        :param _patches: {index: {option: value}}, a null value removes the option
+        :param _sensor:
+        :return:
+        """
+        if not isinstance(_patches, dict):
+            raise ValueError("widgets must be an object of index: changes")
+
+        with self._write_lock:
+            widgets = copy.deepcopy(self.widgets)
+            self._patch(widgets, _patches)
+            self.widgets = widgets
+            self.compile(_sensor)
+            self.save_config()
+
+    @staticmethod
+    def _patch(_widgets: List[Dict], _patches: Dict[str, Dict]) -> None:
+        for i, p in _patches.items():
+            try:
+                i = int(i)
+                if i < 0:
+                    raise IndexError
+                w = _widgets[i]
+            except (ValueError, IndexError):
+                raise ValueError(f"No widget {i}")
+            if not isinstance(p, dict):
+                raise ValueError(f"Changes of widget {i} must be an object")
+            for k, v in p.items():
+                if v is None:
+                    w.pop(k, None)
+                else:
+                    w[k] = v
+            try:
+                validate_widget(w)
+            except ValueError as e:
+                raise ValueError(f"Widget {i}: {e}")
+
+    def _stale(self, _sensor: Sensors) -> bool:
+        """
+        the plan is missing, built for another sensor, or built before the font index finished loading
+        """
+        return (self._plan is None or self._plan_sensor is not _sensor or
+                (not self._plan_fonts and self._fonts is not None and self._fonts.ready.is_set()))
+
     def blend(self, _background: Image.Image, _sensor: Sensors) -> Image.Image:
         base = _background.convert("RGBA")
 
@@ -128,24 +434,43 @@ class Theme:
             self.mask_img = self.mask_img.resize(base.size, Image.Resampling.BILINEAR)
         img = Image.alpha_composite(base, self.mask_img)
 
-        # widgets
+        if self._stale(_sensor):
+            with self._write_lock:
+                # an api write may have compiled while waiting
+                if self._stale(_sensor):
+                    self.compile(_sensor)
+
+        # widgets, all from one snapshot
+        snapshot = _sensor.snapshot()
         draw = ImageDraw.Draw(img)
-        for w in self.widgets:
-            if "text" in w.keys():
-                text = w["text"]
-            else:
-                unit = w.get("unit", True)
-                cels = w.get("cels", True)
-                text = str(_sensor.format(w["widget"], unit, cels)[0])
-            xy = tuple(w.get("xy", (50, 50)))
-            color = tuple(w.get("color", (0, 0, 0, 255)))
-            size = w.get("size", 10)
-            font = ImageFont.load_default(size)
-            draw.text(xy, text, color, font)
+        drawn = [widget(img, draw, snapshot) for widget in self._plan]
+
+        self._frames += 1
+        if drawn != self._drawn:
+            self._drawn = drawn
+            self._frames_distinct += 1
 
         self._blend_frame = img
         return img
 
+    def stats(self) -> Dict:
+        """
+        blended frames, frames whose widgets changed, and value changes of filtered widgets without and with filter
+        :return:
+        """
+        return {
+            "frames": self._frames,
+            "frames_distinct": self._frames_distinct,
+            "filters": [{"widget": k, "raw_changes": f.raw_changes, "shown_changes": f.shown_changes} for k, f in self._filters],
+        }
+
+    def sensor_keys(self) -> Set[str]:
+        """
+        sensor keys referenced by widgets
+        :return:
+        """
+        return {w["widget"] for w in self.widgets if "text" not in w.keys() and "widget" in w.keys()}
+
     def last_blend_frame(self) -> Image.Image:
         return self._blend_frame
 
@@ -159,5 +484,10 @@ class Theme:
     def save_config(self):
         fp = self._config_path / self._config_file
         d = self.get_config()
-        with open(fp, "w+") as f:
+        # a crash leaves either the old or the new config, never a truncated one
+        tmp = fp.parent / (fp.name + ".tmp")
+        with open(tmp, "w") as f:
             f.write(json.dumps(d, ensure_ascii=False, indent=4))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fp)
@@ -0,0 +1,13 @@
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "src"))
+
+from lcdc.server.bench import make_fake_root
+
+
+@pytest.fixture
+def fake_root(tmp_path: pathlib.Path) -> pathlib.Path:
+    return make_fake_root(tmp_path, _hwmon_sensors=16)
@@ -0,0 +1,87 @@
+import struct
+
+import pytest
+from PIL import Image
+
+from lcdc.theme.convert import convert_theme
+from lcdc.theme.dc import dc_config, dc_load
+
+
+def _string(_s: str) -> bytes:
+    b = _s.encode()
+    return bytes([len(b)]) + b
+
+
+def _dc_widget(_type: int, _mode: int, _xy, _device: int, _param: int, _font: str, _text: str) -> bytes:
+    return (struct.pack("<IIIIII", _type, _mode, _xy[0], _xy[1], _device, _param) + _string(_font) +
+            struct.pack("<fB", 12.0, 1) + b"\x03\x86" + bytes([255, 10, 20, 30]) + _string(_text))
+
+
+DC_WIDGETS = [
+    _dc_widget(4, 0, (10, 20), 0, 0, "DejaVu Sans", "CPU"),
+    _dc_widget(0, 1, (30, 40), 2, 2, "", ""),
+    _dc_widget(1, 2, (50, 60), 0, 0, "", ""),
+]
+DC_FILE = b"\xdd\x01" + struct.pack("<I", len(DC_WIDGETS)) + b"".join(DC_WIDGETS)
+
+
+@pytest.fixture
+def dc_theme(tmp_path):
+    d = tmp_path / "theme"
+    d.mkdir()
+    (d / "config.dc").write_bytes(DC_FILE)
+    Image.new("RGB", (320, 240), (0, 0, 255)).save(d / "00.png")
+    return d / "config.dc"
+
+
+def test_load(dc_theme):
+    w = dc_load(dc_theme)
+    assert [(d.w_type, d.x_offset, d.y_offset) for d in w] == [(4, 10, 20), (0, 30, 40), (1, 50, 60)]
+    assert (w[0].f_name, w[0].w_text, w[0].c_color) == ("DejaVu Sans", "CPU", (10, 20, 30))
+
+
+def test_load_empty(tmp_path):
+    (tmp_path / "empty.dc").write_bytes(b"")
+    with pytest.raises(ValueError, match="empty file"):
+        dc_load(tmp_path / "empty.dc")
+
+
+def test_load_bad_magic(tmp_path):
+    (tmp_path / "bad.dc").write_bytes(b"\xdc\x01")
+    with pytest.raises(ValueError, match="Unsupported file format"):
+        dc_load(tmp_path / "bad.dc")
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 10, 40, len(DC_FILE) - 1])
+def test_load_truncated(tmp_path, size):
+    (tmp_path / "cut.dc").write_bytes(DC_FILE[:size])
+    with pytest.raises(ValueError, match="truncated"):
+        dc_load(tmp_path / "cut.dc")
+
+
+def test_config(dc_theme):
+    c = dc_config(dc_theme)
+    assert c["mask"] is None
+    assert c["widgets"][0] == {"text": "CPU", "xy": [10, 20], "color": [10, 20, 30, 255], "size": 16.0,
+                               "font": "DejaVu Sans", "weight": 200}
+    assert c["widgets"][1]["widget"] == "MemoryDdrUsage"
+    assert c["widgets"][2]["clock"] == "time24"
+
+
+def test_convert_skip(dc_theme, tmp_path):
+    out = tmp_path / "out"
+    assert convert_theme(dc_theme, out, [(160, 120)]) == "converted"
+    config = out / "160x120" / "config.json"
+    mtime = config.stat().st_mtime_ns
+    assert convert_theme(dc_theme, out, [(160, 120)]) == "skipped"
+    assert config.stat().st_mtime_ns == mtime
+
+    assert convert_theme(dc_theme, out, [(160, 120)], True) == "converted"
+    # other resolutions, a changed background and a missing output are converted again
+    assert convert_theme(dc_theme, out, [(160, 120), (80, 60)]) == "converted"
+    assert convert_theme(dc_theme, out, [(160, 120), (80, 60)]) == "skipped"
+    Image.new("RGB", (320, 240), (255, 0, 0)).save(dc_theme.parent / "00.png")
+    assert convert_theme(dc_theme, out, [(160, 120), (80, 60)]) == "converted"
+    (out / "80x60" / "config.json").unlink()
+    assert convert_theme(dc_theme, out, [(160, 120), (80, 60)]) == "converted"
+    assert convert_theme(dc_theme, out, [(160, 120), (80, 60)]) == "skipped"
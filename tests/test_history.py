@@ -0,0 +1,64 @@
+import time
+
+import numpy
+
+from lcdc.server.history import History
+
+
+def _filled(_capacity: int, _n: int) -> History:
+    h = History(_capacity)
+    for i in range(_n):
+        h.append(float(i), {"k": i * 10, "s": "not a number"})
+    return h
+
+
+def test_window():
+    h = _filled(8, 20)
+    t, v = h.window("k")
+    assert list(t) == [float(i) for i in range(12, 20)]
+    assert list(v) == [i * 10.0 for i in range(12, 20)]
+    assert "s" not in h.keys()
+    assert len(h.window("missing")[0]) == 0
+
+
+def test_window_seconds():
+    h = History(16)
+    now = time.monotonic()
+    for i in range(10):
+        h.append(now - 9 + i, {"k": i})
+    assert list(h.window("k", 3.5)[1]) == [6.0, 7.0, 8.0, 9.0]
+    assert len(h.window("k", 0.0)[1]) == 0
+
+
+def test_since():
+    for capacity, n in ((8, 5), (8, 8), (8, 13), (8, 16)):
+        h = _filled(capacity, n)
+        ot, ov = h.window("k")
+        for after in numpy.arange(-1.0, n + 1.0, 0.5):
+            s = numpy.searchsorted(ot, after, side="right")
+            t, v = h.since("k", after)
+            assert list(t) == list(ot[s:])
+            assert list(v) == list(ov[s:])
+    assert len(_filled(8, 5).since("k", 4.0)[0]) == 0
+
+
+def test_since_copies():
+    h = _filled(8, 13)
+    t, v = h.since("k", 10.0)
+    v[:] = -1.0
+    assert list(h.last("k", 2)) == [110.0, 120.0]
+
+
+def test_aggregate():
+    h = History(200)
+    now = time.monotonic()
+    for i in range(101):
+        h.append(now - 100 + i, {"k": i})
+    a = h.aggregate("k")
+    assert a["count"] == 101
+    assert (a["min"], a["max"], a["mean"]) == (0.0, 100.0, 50.0)
+    assert (a["p50"], a["p95"], a["p99"]) == (50.0, 95.0, 99.0)
+
+    a = h.aggregate("k", 9.5)
+    assert (a["count"], a["min"]) == (10, 91.0)
+    assert h.aggregate("missing") is None
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+from PIL import Image
+
+from lcdc.server.preview import FramePreview, mjpeg_part, preview_args, stream_period
+
+
+def _size(_jpeg: bytes):
+    with Image.open(io.BytesIO(_jpeg)) as img:
+        return img.size
+
+
+def test_before_first_frame():
+    p = FramePreview()
+    assert p.encode() == (0, None)
+
+
+def test_etag():
+    p = FramePreview()
+    p.publish(Image.new("RGBA", (320, 240), (255, 0, 0, 255)))
+    seq, _ = p.encode()
+    assert seq == 1
+    etag = p.etag(seq)
+    # a client sending the etag of the current frame gets 304
+    assert etag == p.etag(p.seq)
+    assert len({etag, p.etag(seq, 0.5), p.etag(seq, 1.0, 50), p.etag(seq, 1.0, 75, True),
+                p.etag(seq, 1.0, 75, False, (160, 120))}) == 5
+    assert FramePreview().etag(seq) != etag
+
+    p.publish(Image.new("RGBA", (320, 240), (0, 255, 0, 255)))
+    assert p.etag(p.seq) != etag
+
+
+def test_variants():
+    p = FramePreview()
+    p.publish(Image.new("RGBA", (320, 240), (255, 0, 0, 255)))
+    assert _size(p.encode()[1]) == (320, 240)
+    assert _size(p.encode(0.5)[1]) == (160, 120)
+    # size wins over scale and never exceeds the frame
+    assert _size(p.encode(0.5, 75, False, (100, 50))[1]) == (100, 50)
+    assert _size(p.encode(1.0, 75, False, (1000, 50))[1]) == (320, 50)
+
+
+def test_cache():
+    p = FramePreview(_cache_size=2)
+    p.publish(Image.new("RGBA", (320, 240)))
+    a = p.encode(0.5)[1]
+    assert p.encode(0.5)[1] is a
+    assert (p.hits, p.misses) == (1, 1)
+    p.encode(0.25)
+    p.encode(1.0)
+    # evicted
+    assert p.encode(0.5)[1] is not a
+    assert p.misses == 4
+
+    p.publish(Image.new("RGBA", (320, 240)))
+    assert p.encode(0.5) == (2, p.encode(0.5)[1])
+    assert p.misses == 5
+
+
+def test_args():
+    assert preview_args({}) == (1.0, 75, None)
+    assert preview_args({"scale": "0.01", "quality": "100", "size": "160X120"}) == (0.05, 95, (160, 120))
+    assert stream_period({"fps": "1000"}) == 1.0 / 60.0
+    assert stream_period({}) == 0.1
+    for bad in ({"scale": "half"}, {"quality": "1.5"}, {"size": "160"}, {"size": "1x2x3"}):
+        with pytest.raises(ValueError):
+            preview_args(bad)
+    with pytest.raises(ValueError):
+        stream_period({"fps": "fast"})
+
+
+def test_mjpeg_part():
+    assert mjpeg_part(b"ab") == b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: 2\r\n\r\nab\r\n"
@@ -0,0 +1,129 @@
+import time
+
+from lcdc.server.provider import Provider, SensorKey
+from lcdc.server.sensors import Sensors, SensorEvents, _BAT, _CPU, _MEMORY, _NET, _SYSTEM
+
+
+PROVIDERS = [_CPU, _MEMORY, _NET, _BAT, _SYSTEM]
+
+
+class _Broken(Provider):
+    name = "broken"
+
+    def update(self) -> None:
+        raise OSError("gone")
+
+    def values(self):
+        return {}
+
+    def keys(self):
+        return [SensorKey("Broken", "Broken", "", str)]
+
+
+def test_keys(fake_root):
+    s = Sensors(root=fake_root, providers=PROVIDERS)
+    for k in ("CpuUsage", "CpuFreq007", "MemoryDdrUsage", "NetworkRecvRate.eth0", "BatteryPercent", "SystemUptime"):
+        assert k in s.format_desc
+    # the tree has eight cores
+    assert "CpuFreq008" not in s.format_desc
+
+
+def test_values(fake_root):
+    s = Sensors(root=fake_root, providers=PROVIDERS)
+    v = s.snapshot().values
+    assert v["MemoryDdrUsage"] == 50.0
+    assert v["MemoryDdrFree"] == 8192000 * 1024
+    assert v["MemorySwapUsage"] == 25.0
+    assert v["CpuFreq001"] == 3001.0
+    assert v["NetworkRecv.eth0"] == 500000
+    assert v["SystemUptime"] == 12345.67
+    # discharging at 10 W with 40 Wh left
+    assert v["BatteryPlugged"] == 0
+    assert v["BatteryTimeLeft"] == 14400.0
+
+
+def test_battery_status(fake_root):
+    (fake_root / "sys/class/power_supply/AC/online").write_text("1\n")
+    (fake_root / "sys/class/power_supply/BAT0/status").write_text("Charging\n")
+    b = _BAT(fake_root)
+    assert b.values()["BatteryPlugged"] == 1
+    assert "BatteryTimeLeft" not in b.values()
+
+    # mains is only used without a battery status
+    (fake_root / "sys/class/power_supply/BAT0/status").unlink()
+    b.detect()
+    b.update()
+    assert b.values()["BatteryPlugged"] == 1
+
+
+def _active(_s: Sensors):
+    return {n for n, c in _s.stats().items() if c["active"]}
+
+
+def test_demand(fake_root):
+    s = Sensors(root=fake_root, providers=PROVIDERS)
+    assert _active(s) == set()
+
+    s.demand("theme", {"CpuUsage", "MemoryDdrUsage"})
+    assert _active(s) == {"cpu", "memory"}
+    # devices plugged later activate the source of their kind
+    s.demand("theme", {"NetworkRecvRate.eth1"})
+    assert _active(s) == {"net"}
+    s.release("theme")
+    assert _active(s) == set()
+
+
+def test_touch(fake_root):
+    s = Sensors(root=fake_root, providers=PROVIDERS)
+    s.touch({"SystemLoad"}, 0.05)
+    assert _active(s) == {"system"}
+    time.sleep(0.1)
+    s.touch(set())
+    assert _active(s) == set()
+
+
+def test_sampler(fake_root):
+    s = Sensors(intervals={"memory": 0.05}, root=fake_root, providers=PROVIDERS + [_Broken])
+    s.demand("theme", {"MemoryDdrUsage"})
+    s.start()
+    try:
+        seq = s.snapshot().seq
+        time.sleep(0.3)
+        assert s.snapshot().seq > seq
+        assert s.history.window("MemoryDdrUsage")[1][-1] == 50.0
+    finally:
+        s.clean()
+
+
+def test_sampler_empty():
+    s = Sensors(providers=[])
+    s.start()
+    time.sleep(0.05)
+    assert s._sampler.is_alive()
+    s.clean()
+
+
+def test_broken_source(fake_root):
+    s = Sensors(root=fake_root, providers=[_MEMORY, _Broken])
+    assert s.snapshot().values["MemoryDdrUsage"] == 50.0
+    s._update(["broken", "memory"])
+    assert s.snapshot().values["MemoryDdrUsage"] == 50.0
+
+
+def test_events(fake_root):
+    s = Sensors(root=fake_root, providers=PROVIDERS)
+    keys = s.select("SystemUptime,MemoryDdrUsage")
+    assert keys == {"SystemUptime", "MemoryDdrUsage"}
+    assert s.select("") == set(s.format_desc.keys())
+
+    e = SensorEvents(s, keys, 5.0)
+    assert e.poll().startswith(f"id: {s.snapshot().seq}\ndata: ")
+    assert _active(s) == {"memory", "system"}
+    # nothing new, then a keep alive
+    assert e.poll() == ""
+    assert e.poll() == ""
+    assert e.poll() == ": \n\n"
+
+    (fake_root / "proc/uptime").write_text("12346.00 0\n")
+    s._update(["system"])
+    assert e.poll() == f"id: {s.snapshot().seq}\ndata: {{\"SystemUptime\": 12346.0}}\n\n"
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from PIL import Image
+
+from lcdc.server.sensors import Sensors, _MEMORY, _SYSTEM
+from lcdc.theme.theme import Theme, validate_widget
+
+
+@pytest.mark.parametrize("w", [
+    {"text": "CPU", "xy": [1, 2], "color": [255, 0, 0, 255], "size": 20},
+    {"widget": "MemoryDdrUsage", "unit": True, "smooth": "ema", "tau": 2.0},
+    {"clock": "time24", "font": "DejaVu Sans", "weight": 200, "slant": 100},
+    {"widget": "MemoryDdrUsage", "graph": "line", "wh": [100, 40], "step": 2, "color": [0, 255, 0, 255]},
+])
+def test_validate(w):
+    assert validate_widget(w) is w
+
+
+@pytest.mark.parametrize("w", [
+    [],
+    {"xy": [1, 2]},
+    {"text": "a", "clock": "time24"},
+    {"text": "a", "graph": "line"},
+    {"text": "a", "bogus": 1},
+    {"text": "a", "color": "red"},
+    {"text": "a", "xy": [1]},
+    {"clock": "hh:mm"},
+    {"text": "a", "weight": 1000},
+    {"widget": "MemoryDdrUsage", "graph": "line", "color": [0, 255, 0]},
+    {"widget": "MemoryDdrUsage", "graph": "line", "wh": [10, 40], "step": 30},
+    {"widget": "MemoryDdrUsage", "graph": "line", "step": "2"},
+])
+def test_validate_rejects(w):
+    with pytest.raises(ValueError):
+        validate_widget(w)
+
+
+@pytest.fixture
+def theme(tmp_path, fake_root):
+    sensors = Sensors(root=fake_root, providers=[_MEMORY, _SYSTEM])
+    t = Theme(tmp_path, 320, 240)
+    t.set_widgets([
+        {"text": "RAM", "xy": [0, 0]},
+        {"widget": "MemoryDdrUsage", "xy": [0, 20]},
+        {"widget": "MemoryDdrUsage", "graph": "line", "xy": [0, 40], "wh": [100, 40]},
+    ], sensors)
+    return t, sensors
+
+
+def test_patch_reuse(theme):
+    t, sensors = theme
+    plan = list(t._plan)
+    t.patch_widgets({"0": {"text": "MEM", "color": [0, 0, 255, 255]}}, sensors)
+    assert t.widgets[0] == {"text": "MEM", "xy": [0, 0], "color": [0, 0, 255, 255]}
+    # only the patched widget is compiled again
+    assert t._plan[0] is not plan[0]
+    assert t._plan[1:] == plan[1:]
+
+    t.patch_widgets({"1": {"xy": None}}, sensors)
+    assert "xy" not in t.widgets[1]
+    saved = json.loads((t._config_path / "config.json").read_text())
+    assert saved["widgets"] == t.widgets
+
+    t.blend(Image.new("RGB", (320, 240)), sensors)
+    assert t.stats()["frames"] == 1
+
+
+@pytest.mark.parametrize("patches", [
+    {"3": {"text": "a"}},
+    {"-1": {"text": "a"}},
+    {"x": {"text": "a"}},
+    {"0": "MEM"},
+    {"0": {"clock": "time24"}},
+    {"2": {"step": 500}},
+    {"0": {"text": None}},
+])
+def test_patch_rejects(theme, patches):
+    t, sensors = theme
+    widgets, plan = json.dumps(t.widgets), t._plan
+    with pytest.raises(ValueError):
+        t.patch_widgets(patches, sensors)
+    # nothing applied or saved
+    assert json.dumps(t.widgets) == widgets
+    assert t._plan is plan
+    assert json.loads((t._config_path / "config.json").read_text())["widgets"] == json.loads(widgets)
+
+
+def test_invalid_config(tmp_path):
+    Image.new("RGBA", (320, 240)).save(tmp_path / "mask.png")
+    (tmp_path / "config.json").write_text(json.dumps({
+        "background": str(tmp_path / "demo.jpg"),
+        "mask": str(tmp_path / "mask.png"),
+        "widgets": [{"text": "ok"}, {"text": "a", "bogus": 1}, {"clock": "never"}],
+    }))
+    t = Theme(tmp_path, 320, 240)
+    assert t.widgets == [{"text": "ok"}]